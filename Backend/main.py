@@ -1,15 +1,24 @@
+import logging
 import sys
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 
 # Ajusta o path para permitir imports do Backend
 sys.path.append(os.path.dirname(__file__))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write-behind: grava o que ainda estiver pendente antes de o processo sair
+    escrita.descarregar_tudo()
+    pool_pdf.encerrar()
+
 # Cria a aplicação FastAPI
-app = FastAPI(debug=True)
+app = FastAPI(debug=True, lifespan=lifespan)
 
 # Middleware para CORS
 app.add_middleware(
@@ -17,15 +26,53 @@ app.add_middleware(
     allow_origins=["*"],  # Em produção, restrinja para o domínio do Vercel
     allow_methods=["*"],
     allow_headers=["*"],
+    # Versão do dataset lida, para a forma compacta do relatório (utils/http_cache.py)
+    expose_headers=["X-RiskWise-Versao"],
 )
 
-# ✅ Middleware para desativar cache
+# ✅ Política de cache por rota
+# Arquivos estáticos e páginas podem ficar no cache do navegador, mas são
+# revalidados (ETag/Last-Modified do StaticFiles). Os /dados definem o próprio
+# Cache-Control junto com o ETag. O restante da API (POST, PDFs) não é cacheado.
+CACHE_CONTROL_PADRAO = "no-store, max-age=0"
+CACHE_CONTROL_POR_PREFIXO = [
+    ("/css/", "no-cache"),
+    ("/javascript/", "no-cache"),
+    ("/imagens/", "no-cache"),
+]
+
+def _politica_cache(path: str) -> str:
+    for prefixo, politica in CACHE_CONTROL_POR_PREFIXO:
+        if path.startswith(prefixo):
+            return politica
+    if path == "/" or path.endswith(".html"):
+        return "no-cache"
+    return CACHE_CONTROL_PADRAO
+
 @app.middleware("http")
 async def add_cache_headers(request, call_next):
     response = await call_next(request)
-    response.headers["Cache-Control"] = "no-store, max-age=0"
+    if "cache-control" not in response.headers:
+        response.headers["Cache-Control"] = _politica_cache(request.url.path)
     return response
 
+# ✅ Compressão gzip/brotli conforme o Accept-Encoding (registrada por último
+# = mais externa). Os /dados completos já chegam comprimidos do cache por
+# versão do dataset e os estáticos do dist com a variante pré-comprimida:
+# ambos têm Content-Encoding e passam direto.
+from utils.compressao import CompressaoMiddleware
+app.add_middleware(CompressaoMiddleware)
+
+# ✅ Métricas (GET /metrics): a mais externa de todas, para a latência
+# incluir compressão e o envio do corpo inteiro
+from utils import metricas
+app.add_middleware(metricas.MetricasMiddleware, roteador=app)
+
+# ✅ Profiling sob demanda (RISKWISE_PROFILING=1 + header X-RiskWise-Profile
+# ou ?profile=1); sem a variável o middleware só repassa a requisição
+from utils import perfil
+app.add_middleware(perfil.PerfilMiddleware)
+
 # Importa e inclui as rotas da API
 from .routes import chronic, acute, mexico, report_combined
 app.include_router(chronic.router, tags=["Dieta Crônica"])
@@ -33,16 +80,79 @@ app.include_router(acute.router, prefix="/acute", tags=["Nova Planilha"])
 app.include_router(mexico.router, prefix="/mexico", tags=["México Planilha"])
 app.include_router(report_combined.router, prefix="/report", tags=["Report"])
 
+# Contadores do cache de planilhas (hits/misses por processo)
+from utils.dataset_cache import dataset_cache
+from utils import escrita
+from utils.pool_pdf import pool_pdf
+from utils.cache_pdf import cache_pdf
+
+@app.get("/cache/stats", tags=["Cache"])
+def cache_stats():
+    return {
+        **dataset_cache.estatisticas(),
+        "escrita": escrita.estatisticas(),
+        "pdf": pool_pdf.estatisticas(),
+        "pdf_cache": cache_pdf.estatisticas(),
+    }
+
+def _metricas_dos_caches():
+    cache = dataset_cache.estatisticas()
+    yield "riskwise_dataset_cache_hits_total", "counter", "Leituras servidas do cache de planilhas.", cache["hits"]
+    yield "riskwise_dataset_cache_misses_total", "counter", "Leituras que carregaram a planilha.", cache["misses"]
+    yield "riskwise_dataset_cache_invalidacoes_total", "counter", "Entradas invalidadas no cache de planilhas.", cache["invalidacoes"]
+    pdf = pool_pdf.estatisticas()
+    yield "riskwise_pdf_em_andamento", "gauge", "PDFs em geração ou na fila do pool.", pdf["em_andamento"]
+    yield "riskwise_pdf_recusados_total", "counter", "PDFs recusados com 503 (fila cheia).", pdf["recusados"]
+
+metricas.registro.coletor(_metricas_dos_caches)
+
+@app.get("/metrics", tags=["Cache"], include_in_schema=False)
+def metrics():
+    """Formato texto do Prometheus; contadores por processo."""
+    return PlainTextResponse(metricas.registro.exportar(), media_type=metricas.CONTENT_TYPE)
+
+@app.get("/profiling", tags=["Profiling"])
+def profiling_listar():
+    """Perfis guardados (ver utils/perfil.py), do mais recente ao mais antigo."""
+    if not perfil.habilitado():
+        raise HTTPException(status_code=404, detail="Profiling desabilitado (RISKWISE_PROFILING).")
+    return perfil.listar()
+
+@app.get("/profiling/{perfil_id}", tags=["Profiling"])
+def profiling_baixar(perfil_id: str):
+    """Pilhas no formato collapsed (flamegraph.pl, speedscope)."""
+    caminho = perfil.caminho_de(perfil_id) if perfil.habilitado() else None
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    return FileResponse(caminho, media_type="text/plain; charset=utf-8", filename=f"perfil_{perfil_id}.txt")
+
+@app.get("/escrita/status", tags=["Cache"])
+def escrita_status():
+    """Versões aceitas x gravadas no disco, por planilha (write-behind)."""
+    return escrita.estatisticas()
+
 FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "..", "Frontend")
 FRONTEND_HTML_DIR = os.path.join(FRONTEND_DIR, "html")
 
-# Servir CSS, JS e imagens
-app.mount("/css", StaticFiles(directory=os.path.join(FRONTEND_DIR, "css")), name="css")
-app.mount("/javascript", StaticFiles(directory=os.path.join(FRONTEND_DIR, "javascript")), name="javascript")
-app.mount("/imagens", StaticFiles(directory=os.path.join(FRONTEND_DIR, "imagens")), name="imagens")
+# Build de construir_estaticos.py (assets com hash + .gz/.br), se existir e
+# estiver em dia com as fontes; senão, os diretórios do Frontend direto
+from utils import estaticos
+frontend_compilado = estaticos.carregar(FRONTEND_DIR)
+if frontend_compilado is not None:
+    app.mount("/", frontend_compilado, name="frontend")
+else:
+    if os.environ.get("VERCEL"):
+        # No deploy o dist vem do buildCommand do vercel.json
+        logging.getLogger(__name__).warning(
+            "Frontend/dist ausente ou desatualizado: servindo Frontend/ sem hash (rode construir_estaticos.py no build)"
+        )
+    # Servir CSS, JS e imagens
+    app.mount("/css", StaticFiles(directory=os.path.join(FRONTEND_DIR, "css")), name="css")
+    app.mount("/javascript", StaticFiles(directory=os.path.join(FRONTEND_DIR, "javascript")), name="javascript")
+    app.mount("/imagens", StaticFiles(directory=os.path.join(FRONTEND_DIR, "imagens")), name="imagens")
 
-# Servir HTML
-app.mount("/", StaticFiles(directory=FRONTEND_HTML_DIR, html=True), name="frontend")
+    # Servir HTML
+    app.mount("/", StaticFiles(directory=FRONTEND_HTML_DIR, html=True), name="frontend")
 
 # ✅ Rota para favicon
 @app.get("/favicon.ico")
@@ -1,20 +1,40 @@
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Body, Query, Request
+from fastapi.responses import Response
 from fastapi.encoders import jsonable_encoder
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime, date
-from io import BytesIO
-import pandas as pd
-import numpy as np
 import os
 
-# Importa a função que gera PDF em memória
-from utils.report import gerar_pdf_bytes
+from starlette.concurrency import run_in_threadpool
+
+from utils.pool_pdf import pool_pdf
+from utils.cache_pdf import cache_pdf, chave_de
+from utils.spool_pdf import resposta_pdf
+from utils.dataset_cache import dataset_cache, corpo_json
+from utils.http_cache import resposta_dataset, resposta_condicional, etag_de
+from utils import snapshot
+from utils import calculos
+from utils import consulta
+from utils import streaming
+from utils import serializacao
+from utils import edicao
+from utils import escrita
+from utils import referencias
+from utils import metricas
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
 router = APIRouter()
 
 # ✅ Caminho relativo para o arquivo dentro do projeto
+# (RISKWISE_DATA_DIR troca o diretório, ex.: planilhas sintéticas dos benchmarks)
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta para Backend
-EXCEL_PATH = os.path.join(BASE_DIR, "data", "DietaAgudaOf.xlsx")
+DATA_DIR = os.environ.get("RISKWISE_DATA_DIR") or os.path.join(BASE_DIR, "data")
+EXCEL_PATH = os.path.join(DATA_DIR, "DietaAgudaOf.xlsx")
 
 # Colunas obrigatórias (mínimo para funcionar)
 REQUIRED_COLS = [
@@ -46,44 +66,114 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [str(c).strip() for c in df.columns]
     return df
 
-def _read_excel_validated(path: str) -> pd.DataFrame:
+# Esquema validado (também registrado no snapshot colunar, ver utils/snapshot.py)
+ESQUEMA = {"required": REQUIRED_COLS, "optional": OPTIONAL_COLS}
+
+def _ler_xlsx_validado(path: str) -> pd.DataFrame:
     if not os.path.exists(path):
         raise HTTPException(status_code=500, detail=f"Arquivo não encontrado: {path}")
 
     try:
-        df = pd.read_excel(path)
+        with metricas.etapa("leitura_planilha", arquivo=os.path.basename(path)):
+            df = pd.read_excel(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao ler Excel: {e}")
 
-    df = _normalize_columns(df)
-    missing = [c for c in REQUIRED_COLS if c not in df.columns]
-    if missing:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Colunas ausentes na planilha: {missing}. Colunas disponíveis: {list(df.columns)}"
-        )
+    with metricas.etapa("validacao_colunas", arquivo=os.path.basename(path)):
+        df = _normalize_columns(df)
+        missing = [c for c in REQUIRED_COLS if c not in df.columns]
+        if missing:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Colunas ausentes na planilha: {missing}. Colunas disponíveis: {list(df.columns)}"
+            )
 
-    cols_to_keep = REQUIRED_COLS + [c for c in OPTIONAL_COLS if c in df.columns]
-    df = df[cols_to_keep]
+        cols_to_keep = REQUIRED_COLS + [c for c in OPTIONAL_COLS if c in df.columns]
+        return df[cols_to_keep]
 
-    df = df.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
+def _read_excel_validated(path: str) -> pd.DataFrame:
+    with metricas.etapa("leitura_snapshot", arquivo=os.path.basename(path)):
+        carregado = snapshot.carregar(path, ESQUEMA)
+    if carregado is not None:
+        df, _ = carregado
+    else:
+        df = _ler_xlsx_validado(path)
+        snapshot.atualizar_se_possivel(path, df, ESQUEMA)
+
+    with metricas.etapa("limpeza_nan", arquivo=os.path.basename(path)):
+        df = df.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
     return df
 
+def _carregar(path: str):
+    # Edições por célula ainda no diário (PATCH, ver utils/diario.py) vão por cima
+    return escrita.com_diario(path, _read_excel_validated(path)), {}
+
+def _meta(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> Dict:
+    meta = {
+        "file": os.path.basename(EXCEL_PATH),
+        "total_registros": len(df),
+        "colunas": list(df.columns),
+        # Token a mandar como "versao" na forma compacta do relatório (utils/referencias.py)
+        "versao": entrada.token,
+    }
+    if paginacao is not None:
+        meta["paginacao"] = paginacao
+    return meta
+
+def _montar_corpo(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> bytes:
+    registros = jsonable_encoder(df.to_dict(orient="records"))
+    return corpo_json({"tabelaCompleta": registros, "meta": _meta(entrada, df, paginacao)})
+
+def _montar_corpo_colunar(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> bytes:
+    return serializacao.dumps({**serializacao.colunar(df), "meta": _meta(entrada, df, paginacao)})
+
+def _montar_resposta(entrada) -> bytes:
+    return _montar_corpo(entrada, entrada.df)
+
+def _montar_resposta_colunar(entrada) -> bytes:
+    return _montar_corpo_colunar(entrada, entrada.df)
+
 # -------------------------------
 # Endpoints
 # -------------------------------
 
 @router.get("/dados")
-def get_dados():
+def get_dados(
+    request: Request,
+    regiao: Optional[List[str]] = Query(None),
+    ano_pof: Optional[List[str]] = Query(None),
+    cultivo: Optional[List[str]] = Query(None),
+    caso_formula: Optional[List[str]] = Query(None),
+    fields: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=consulta.LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = None,
+    formato: str = Query("registros", alias="format", pattern=serializacao.PADRAO_FORMATO),
+):
     try:
-        df = _read_excel_validated(EXCEL_PATH)
-        registros = jsonable_encoder(df.to_dict(orient="records"))
-        meta = {
-            "file": os.path.basename(EXCEL_PATH),
-            "total_registros": len(registros),
-            "colunas": list(df.columns),
+        entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+        filtros = {
+            "Região": regiao,
+            "ANO POF": ano_pof,
+            "Cultivo/ Matriz Animal": cultivo,
+            "Caso Fórmula": caso_formula,
         }
-        return JSONResponse(content={"tabelaCompleta": registros, "meta": meta})
+        if streaming.pedido(request, stream):
+            pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+            return streaming.resposta_ndjson(request, entrada, pagina, {"meta": _meta(entrada, pagina, paginacao)})
+
+        colunar = formato == "columnar"
+        if consulta.sem_parametros(filtros, fields, limit, cursor):
+            if colunar:
+                return resposta_dataset(request, entrada, _montar_resposta_colunar, chave="colunar")
+            return resposta_dataset(request, entrada, _montar_resposta)
+
+        pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+        if colunar:
+            corpo = _montar_corpo_colunar(entrada, pagina, paginacao)
+        else:
+            corpo = _montar_corpo(entrada, pagina, paginacao)
+        return resposta_condicional(request, corpo, etag_de(corpo), versao=entrada.token)
     except HTTPException:
         raise
     except Exception as e:
@@ -109,25 +199,174 @@ def atualizar(dados: List[Dict] = Body(...)):
         cols_to_save = REQUIRED_COLS + [c for c in OPTIONAL_COLS if c in novo_df.columns]
         novo_df = novo_df[cols_to_save].replace({pd.NA: None, np.nan: None})
 
+        # Memória primeiro (leituras já veem a nova tabela); a planilha é gravada
+        # de forma atômica e agrupada pelo gravador do dataset (utils/escrita.py)
+        gravador = escrita.gravador_de(EXCEL_PATH)
+        with gravador.estado:
+            entrada = dataset_cache.substituir(EXCEL_PATH, novo_df.reset_index(drop=True), {})
+            ticket = gravador.agendar(completa=lambda destino: novo_df.to_excel(destino, index=False))
         try:
-            novo_df.to_excel(EXCEL_PATH, index=False)
+            gravador.aguardar(ticket)
         except PermissionError:
             raise HTTPException(status_code=423, detail="Feche o arquivo Excel e tente novamente.")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Erro ao salvar Excel: {e}")
 
-        return {"status": "salvo", "linhas": len(novo_df), "arquivo": os.path.basename(EXCEL_PATH)}
+        return {
+            "status": gravador.situacao(),
+            "linhas": len(novo_df),
+            "arquivo": os.path.basename(EXCEL_PATH),
+            "versao": entrada.token,
+            "versao_escrita": ticket.versao,
+        }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar atualização: {e}")
 
 
+@router.patch("/dados")
+def patch_dados(payload: Any = Body(...)):
+    """
+    Edição por célula: aplica as operações no dataset em cache e grava só
+    as células alteradas (ver utils/edicao.py para o formato).
+    """
+    if os.environ.get("VERCEL") or os.environ.get("VERCEL_ENV"):
+        raise HTTPException(
+            status_code=501,
+            detail="Escrita desabilitada no ambiente de deploy (filesystem read-only)."
+        )
+
+    try:
+        gravador = escrita.gravador_de(EXCEL_PATH)
+        with gravador.estado:
+            entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+            novo_df, alteracoes = edicao.aplicar_ops(entrada, payload)
+            if alteracoes:
+                # Cache atualizado com o DataFrame já editado, sem reler a planilha
+                entrada = dataset_cache.substituir(EXCEL_PATH, novo_df, entrada.extras)
+                ticket = gravador.agendar(celulas=alteracoes)
+
+        if alteracoes:
+            try:
+                gravador.aguardar(ticket)
+            except HTTPException:
+                raise
+            except PermissionError:
+                raise HTTPException(status_code=423, detail="Feche o arquivo Excel e tente novamente.")
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Erro ao salvar Excel: {e}")
+
+        return {
+            "status": gravador.situacao(),
+            "celulas": len(alteracoes),
+            "linhas": sorted({pos for pos, _ in alteracoes}),
+            "versao": entrada.token,
+            "versao_escrita": ticket.versao if alteracoes else gravador.versao,
+            "arquivo": os.path.basename(EXCEL_PATH),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar edição: {e}")
+
+
+# -------------------------------
+# Cálculo vetorizado de IMEA / %DRFA
+# -------------------------------
+@router.post("/calcular")
+def calcular(payload: Dict[str, Any] = Body(...)):
+    """
+    Espera um JSON:
+    {
+      "drfa_externo": valor,
+      "drfa_interno": valor,
+      "overrides": { "<índice da linha em tabelaCompleta>": { "LMR (mg/kg)": valor, ... } }  (opcional)
+    }
+    Retorna IMEA, %DRFA ANVISA (externo) e %DRFA SYNGENTA (interno) para todas
+    as linhas, na mesma ordem de /acute/dados.
+    """
+    try:
+        entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+        base = entrada.derivado("entradas_imea", lambda e: calculos.preparar_acute(e.df))
+        try:
+            entradas = calculos.aplicar_overrides(base, payload.get("overrides"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        imea = calculos.calcular_imea(entradas)
+        drfa_externo = calculos.calcular_drfa(imea, payload.get("drfa_externo"))
+        drfa_interno = calculos.calcular_drfa(imea, payload.get("drfa_interno"))
+
+        return Response(content=corpo_json({
+            "resultados": {
+                "IMEA (mg/kg p.c./dia)": calculos.para_json(imea),
+                "%DRFA ANVISA": calculos.para_json(drfa_externo),
+                "%DRFA SYNGENTA": calculos.para_json(drfa_interno),
+            },
+            "meta": {
+                "file": os.path.basename(EXCEL_PATH),
+                "total_registros": len(imea),
+            },
+        }), media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular IMEA: {e}")
+
+
+# -------------------------------
+# Linhas do relatório combinado por referência (utils/referencias.py)
+# -------------------------------
+COLUNAS_RELATORIO = [
+    "Cultivo/ Matriz Animal", "ANO POF", "Região", "Caso Fórmula",
+    "LMR (mg/kg)", "HR/MCR (mg/kg)", "MREC/STMR (mg/kg)",
+]
+
+def linhas_relatorio(versao: str, overrides: Dict[str, Dict[str, Any]],
+                     drfa_externo, drfa_interno) -> List[Dict[str, Any]]:
+    """
+    Linhas do Acute para o relatório a partir das posições em `overrides`, como
+    o front as salva (salvarDadosNoLocalStorage em acute_crop.js): valores
+    enviados sobre os do dataset, bloqueios "NA" por caso, IMEA e %DRFA.
+    IMEA/%DRFA são calculados só para essas linhas. Levanta ValueError para
+    linha/coluna inválida.
+    """
+    entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+    referencias.conferir_versao(entrada, versao)
+    pedidas = referencias.por_linha(overrides, len(entrada.df))
+    posicoes = list(pedidas)
+
+    base = entrada.derivado("entradas_imea", lambda e: calculos.preparar_acute(e.df))
+    entradas = calculos.aplicar_overrides(
+        {coluna: valores[posicoes] for coluna, valores in base.items()},
+        {i: pedidas[p] for i, p in enumerate(posicoes)},
+    )
+    imea = calculos.calcular_imea(entradas)
+    drfa = {
+        "%DRFA ANVISA": calculos.calcular_drfa(imea, drfa_externo),
+        "%DRFA SYNGENTA": calculos.calcular_drfa(imea, drfa_interno),
+    }
+    imea = calculos.para_json(imea)
+
+    linhas = entrada.df.iloc[posicoes][COLUNAS_RELATORIO].to_dict(orient="records")
+    for i, (linha, enviados) in enumerate(zip(linhas, pedidas.values())):
+        linha.update({c: v for c, v in enviados.items() if c in linha})
+        caso = str(linha["Caso Fórmula"] or "").strip()
+        if caso == "Caso 3":
+            linha["HR/MCR (mg/kg)"] = "NA"
+        if caso in ("Caso 1", "Caso 2a", "Caso 2b"):
+            linha["MREC/STMR (mg/kg)"] = "NA"
+        linha["IMEA (mg/kg p.c./dia)"] = imea[i]
+        for coluna, valores in drfa.items():
+            linha[coluna] = "-" if np.isnan(valores[i]) else f"{valores[i]:.2f}%"
+    return linhas
+
 # -------------------------------
 # Novo endpoint para gerar PDF
 # -------------------------------
 @router.post("/gerar-pdf")
-def gerar_pdf_endpoint(payload: Dict[str, Any]):
+async def gerar_pdf_endpoint(payload: Dict[str, Any]):
     """
     Espera um JSON:
     {
@@ -136,18 +375,26 @@ def gerar_pdf_endpoint(payload: Dict[str, Any]):
       "drfa_interno": "valor"
     }
     """
+    # ReportLab só é importado no primeiro PDF, não no cold start (utils/sob_demanda.py)
+    from utils.report import gerar_pdf_bytes
+
     try:
         dados: List[Dict[str, Any]] = payload.get("dados", [])
         drfa_externo: str = payload.get("drfa_externo", "-")
         drfa_interno: str = payload.get("drfa_interno", "-")
 
-        pdf_bytes = gerar_pdf_bytes(drfa_externo, drfa_interno, dados)
+        # Hash canônico da tabela inteira: numa thread, fora do event loop
+        chave = await run_in_threadpool(
+            chave_de, "gerar_pdf_bytes", {"drfa_externo": drfa_externo, "drfa_interno": drfa_interno, "dados": dados}
+        )
+        pdf, origem = await cache_pdf.obter_ou_gerar(
+            chave,
+            lambda: pool_pdf.renderizar(gerar_pdf_bytes, drfa_externo, drfa_interno, dados),
+        )
         filename = f"riskwise_acute_{date.today().isoformat()}.pdf"
 
-        return StreamingResponse(
-            BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-        )
+        return resposta_pdf(pdf, filename, {"X-PDF-Cache": origem})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF: {e}")
\ No newline at end of file
@@ -1,16 +1,34 @@
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Body, Query, Request
+from fastapi.responses import Response
 from fastapi.encoders import jsonable_encoder
-from typing import List, Dict
-import pandas as pd
-import numpy as np
+from typing import Any, List, Dict, Optional
 import os
 
+from utils.dataset_cache import dataset_cache, corpo_json
+from utils.http_cache import resposta_dataset, resposta_condicional, etag_de
+from utils import snapshot
+from utils import calculos
+from utils import consulta
+from utils import streaming
+from utils import serializacao
+from utils import edicao
+from utils import escrita
+from utils import referencias
+from utils import metricas
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
 router = APIRouter()
 
 # ✅ Caminho relativo para o arquivo dentro do projeto
+# (RISKWISE_DATA_DIR troca o diretório, ex.: planilhas sintéticas dos benchmarks)
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta para Backend
-EXCEL_PATH = os.path.join(BASE_DIR, "data", "DietaCronicaOf.xlsx")
+DATA_DIR = os.environ.get("RISKWISE_DATA_DIR") or os.path.join(BASE_DIR, "data")
+EXCEL_PATH = os.path.join(DATA_DIR, "DietaCronicaOf.xlsx")
 
 REQUIRED_COLS = [
     "Cultivo", "ANO_POF", "Região", "LMR (mg_kg)",
@@ -25,69 +43,110 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [str(c).strip() for c in df.columns]
     return df
 
-def _read_excel_validated(path: str) -> pd.DataFrame:
+# Esquema validado (também registrado no snapshot colunar, ver utils/snapshot.py)
+ESQUEMA = {"required": REQUIRED_COLS}
+
+def _ler_xlsx_validado(path: str) -> pd.DataFrame:
     if not os.path.exists(path):
         raise HTTPException(status_code=500, detail=f"Arquivo não encontrado: {path}")
 
     try:
-        df = pd.read_excel(path)
+        with metricas.etapa("leitura_planilha", arquivo=os.path.basename(path)):
+            df = pd.read_excel(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao ler Excel: {e}")
 
-    df = _normalize_columns(df)
-    missing = [c for c in REQUIRED_COLS if c not in df.columns]
-    if missing:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Colunas ausentes na planilha: {missing}. Colunas disponíveis: {list(df.columns)}"
-        )
+    with metricas.etapa("validacao_colunas", arquivo=os.path.basename(path)):
+        df = _normalize_columns(df)
+        missing = [c for c in REQUIRED_COLS if c not in df.columns]
+        if missing:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Colunas ausentes na planilha: {missing}. Colunas disponíveis: {list(df.columns)}"
+            )
+
+        return df[REQUIRED_COLS]
+
+def _read_excel_validated(path: str) -> pd.DataFrame:
+    with metricas.etapa("leitura_snapshot", arquivo=os.path.basename(path)):
+        carregado = snapshot.carregar(path, ESQUEMA)
+    if carregado is not None:
+        df, _ = carregado
+    else:
+        df = _ler_xlsx_validado(path)
+        snapshot.atualizar_se_possivel(path, df, ESQUEMA)
 
-    df = df[REQUIRED_COLS]
-    df = df.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
+    with metricas.etapa("limpeza_nan", arquivo=os.path.basename(path)):
+        df = df.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
 
     return df
 
+def _carregar(path: str):
+    # Edições por célula ainda no diário (PATCH, ver utils/diario.py) vão por cima
+    return escrita.com_diario(path, _read_excel_validated(path)), {}
+
+def _entradas(entrada):
+    return entrada.derivado("entradas_idmt", lambda e: calculos.preparar_chronic(e.df))
+
+def _cabecalho(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> Dict:
+    # Monta POF (PC por ano × região) em um único groupby; sempre sobre a tabela inteira
+    pof = entrada.derivado("pof", lambda e: calculos.agregar_pof(_entradas(e)))
+
+    meta = {
+        "file": os.path.basename(entrada.path),
+        "total_registros": len(df),
+        "colunas": list(df.columns),
+        # Token a mandar como "versao" na forma compacta do relatório (utils/referencias.py)
+        "versao": entrada.token,
+    }
+    if paginacao is not None:
+        meta["paginacao"] = paginacao
+    return {"POF_2008": pof[2008], "POF_2017": pof[2017], "meta": meta}
+
+def _montar_corpo(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> bytes:
+    registros = jsonable_encoder(df.to_dict(orient="records"))
+    return corpo_json({"tabelaCompleta": registros, **_cabecalho(entrada, df, paginacao)})
+
+def _montar_corpo_colunar(entrada, df: pd.DataFrame, paginacao: Optional[Dict] = None) -> bytes:
+    return serializacao.dumps({**serializacao.colunar(df), **_cabecalho(entrada, df, paginacao)})
+
+def _montar_resposta(entrada) -> bytes:
+    return _montar_corpo(entrada, entrada.df)
+
+def _montar_resposta_colunar(entrada) -> bytes:
+    return _montar_corpo_colunar(entrada, entrada.df)
+
 @router.get("/dados")
-def get_dados():
+def get_dados(
+    request: Request,
+    regiao: Optional[List[str]] = Query(None),
+    ano_pof: Optional[List[str]] = Query(None),
+    cultivo: Optional[List[str]] = Query(None),
+    fields: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=consulta.LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = None,
+    formato: str = Query("registros", alias="format", pattern=serializacao.PADRAO_FORMATO),
+):
     try:
-        df = _read_excel_validated(EXCEL_PATH)
+        entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+        filtros = {"Região": regiao, "ANO_POF": ano_pof, "Cultivo": cultivo}
+        if streaming.pedido(request, stream):
+            pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+            return streaming.resposta_ndjson(request, entrada, pagina, _cabecalho(entrada, pagina, paginacao))
 
-        # Monta POF dinamicamente
-        pof_2008 = {"PC_Kg": {}, "%IDA_ANVISA": {}, "%IDA_SYNGENTA": {}}
-        pof_2017 = {"PC_Kg": {}, "%IDA_ANVISA": {}, "%IDA_SYNGENTA": {}}
+        colunar = formato == "columnar"
+        if consulta.sem_parametros(filtros, fields, limit, cursor):
+            if colunar:
+                return resposta_dataset(request, entrada, _montar_resposta_colunar, chave="colunar")
+            return resposta_dataset(request, entrada, _montar_resposta)
 
-        for linha in df.to_dict(orient="records"):
-            try:
-                if linha["ANO_POF"] == 2008:
-                    regiao = linha["Região"]
-                    pc_kg = linha["PC (kg)"]
-                    if regiao and pc_kg is not None:
-                        pof_2008["PC_Kg"][regiao] = round(float(pc_kg), 4)
-                        pof_2008["%IDA_ANVISA"][regiao] = None
-                        pof_2008["%IDA_SYNGENTA"][regiao] = None
-                if linha["ANO_POF"] == 2017:
-                    regiao = linha["Região"]
-                    pc_kg = linha["PC (kg)"]
-                    if regiao and pc_kg is not None:
-                        pof_2017["PC_Kg"][regiao] = round(float(pc_kg), 4)
-                        pof_2017["%IDA_ANVISA"][regiao] = None
-                        pof_2017["%IDA_SYNGENTA"][regiao] = None
-            except Exception:
-                # Se alguma linha vier malformada, continua sem derrubar tudo
-                continue
-
-        registros = jsonable_encoder(df.to_dict(orient="records"))
-        meta = {
-            "file": os.path.basename(EXCEL_PATH),
-            "total_registros": len(registros),
-            "colunas": list(df.columns),
-        }
-        return JSONResponse(content={
-            "tabelaCompleta": registros,
-            "POF_2008": pof_2008,
-            "POF_2017": pof_2017,
-            "meta": meta
-        })
+        pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+        if colunar:
+            corpo = _montar_corpo_colunar(entrada, pagina, paginacao)
+        else:
+            corpo = _montar_corpo(entrada, pagina, paginacao)
+        return resposta_condicional(request, corpo, etag_de(corpo), versao=entrada.token)
     except HTTPException:
         raise
     except Exception as e:
@@ -112,15 +171,148 @@ def atualizar(dados: List[Dict] = Body(...)):
 
         novo_df = novo_df[REQUIRED_COLS].replace({pd.NA: None, np.nan: None})
 
+        # Memória primeiro (leituras já veem a nova tabela); a planilha é gravada
+        # de forma atômica e agrupada pelo gravador do dataset (utils/escrita.py)
+        gravador = escrita.gravador_de(EXCEL_PATH)
+        with gravador.estado:
+            entrada = dataset_cache.substituir(EXCEL_PATH, novo_df.reset_index(drop=True), {})
+            ticket = gravador.agendar(completa=lambda destino: novo_df.to_excel(destino, index=False))
         try:
-            novo_df.to_excel(EXCEL_PATH, index=False)
+            gravador.aguardar(ticket)
         except PermissionError:
             raise HTTPException(status_code=423, detail="Feche o arquivo Excel e tente novamente.")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Erro ao salvar Excel: {e}")
 
-        return {"status": "salvo", "linhas": len(novo_df), "arquivo": os.path.basename(EXCEL_PATH)}
+        return {
+            "status": gravador.situacao(),
+            "linhas": len(novo_df),
+            "arquivo": os.path.basename(EXCEL_PATH),
+            "versao": entrada.token,
+            "versao_escrita": ticket.versao,
+        }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar atualização: {e}")
+
+@router.patch("/dados")
+def patch_dados(payload: Any = Body(...)):
+    """
+    Edição por célula: aplica as operações no dataset em cache e grava só
+    as células alteradas (ver utils/edicao.py para o formato).
+    """
+    if os.environ.get("VERCEL") or os.environ.get("VERCEL_ENV"):
+        raise HTTPException(
+            status_code=501,
+            detail="Escrita desabilitada no ambiente de deploy (filesystem read-only)."
+        )
+
+    try:
+        gravador = escrita.gravador_de(EXCEL_PATH)
+        with gravador.estado:
+            entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+            novo_df, alteracoes = edicao.aplicar_ops(entrada, payload)
+            if alteracoes:
+                # Cache atualizado com o DataFrame já editado, sem reler a planilha
+                entrada = dataset_cache.substituir(EXCEL_PATH, novo_df, entrada.extras)
+                ticket = gravador.agendar(celulas=alteracoes)
+
+        if alteracoes:
+            try:
+                gravador.aguardar(ticket)
+            except HTTPException:
+                raise
+            except PermissionError:
+                raise HTTPException(status_code=423, detail="Feche o arquivo Excel e tente novamente.")
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Erro ao salvar Excel: {e}")
+
+        return {
+            "status": gravador.situacao(),
+            "celulas": len(alteracoes),
+            "linhas": sorted({pos for pos, _ in alteracoes}),
+            "versao": entrada.token,
+            "versao_escrita": ticket.versao if alteracoes else gravador.versao,
+            "arquivo": os.path.basename(EXCEL_PATH),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar edição: {e}")
+
+@router.post("/calcular")
+def calcular(payload: Dict[str, Any] = Body(...)):
+    """
+    Espera um JSON:
+    {
+      "ida_anvisa": valor,      (IDA externa)
+      "ida_syngenta": valor,    (IDA interna)
+      "overrides": { "<índice da linha em tabelaCompleta>": { "LMR (mg_kg)": valor, ... } }  (opcional)
+    }
+    Retorna IDMT e contribuição individual por linha (ordem de /dados) e as
+    matrizes %IDA ANVISA/SYNGENTA das POF 2008 e 2017.
+    """
+    try:
+        entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+        try:
+            entradas = calculos.aplicar_overrides(_entradas(entrada), payload.get("overrides"), virgula_decimal=False)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        idmt = calculos.calcular_idmt(entradas)
+        contribuicao = calculos.calcular_contribuicao(idmt, entradas)
+        pof = calculos.agregar_pof(entradas, idmt, payload.get("ida_anvisa"), payload.get("ida_syngenta"))
+
+        return Response(content=corpo_json({
+            "resultados": {
+                "IDMT (Numerador)": calculos.para_json(idmt),
+                "Contribuição Individual do Cultivo": calculos.para_json(contribuicao),
+            },
+            "POF_2008": pof[2008],
+            "POF_2017": pof[2017],
+            "meta": {
+                "file": os.path.basename(EXCEL_PATH),
+                "total_registros": len(idmt),
+            },
+        }), media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular IDMT: {e}")
+
+
+# -------------------------------
+# Linhas do relatório combinado por referência (utils/referencias.py)
+# -------------------------------
+COLUNAS_RELATORIO = [
+    "Cultivo", "ANO_POF", "Região", "LMR (mg_kg)", "MREC_STMR (mg_kg)", "Market Share",
+]
+
+def linhas_relatorio(versao: str, overrides: Dict[str, Dict[str, Any]],
+                     ida_anvisa=None, ida_syngenta=None):
+    """
+    Linhas do Chronic para o relatório a partir das posições em `overrides`
+    (valores enviados sobre os do dataset, IDMT e contribuição recalculados)
+    e as matrizes POF 2008/2017 com esses valores, como em /calcular.
+    Retorna (linhas, pof). Levanta ValueError para linha/coluna inválida.
+    """
+    entrada = dataset_cache.obter(EXCEL_PATH, _carregar)
+    referencias.conferir_versao(entrada, versao)
+    pedidas = referencias.por_linha(overrides, len(entrada.df))
+    posicoes = list(pedidas)
+
+    # O POF soma todas as linhas, então o IDMT é calculado sobre a tabela inteira
+    entradas = calculos.aplicar_overrides(_entradas(entrada), pedidas, virgula_decimal=False)
+    idmt = calculos.calcular_idmt(entradas)
+    contribuicao = calculos.calcular_contribuicao(idmt, entradas)
+    pof = calculos.agregar_pof(entradas, idmt, ida_anvisa, ida_syngenta)
+
+    idmt_linhas = calculos.para_json(idmt[posicoes])
+    contribuicao_linhas = calculos.para_json(contribuicao[posicoes])
+    linhas = entrada.df.iloc[posicoes][COLUNAS_RELATORIO].to_dict(orient="records")
+    for i, (linha, enviados) in enumerate(zip(linhas, pedidas.values())):
+        linha.update({c: v for c, v in enviados.items() if c in linha})
+        linha["IDMT (Numerador)"] = idmt_linhas[i]
+        linha["Contribuição Individual do Cultivo"] = contribuicao_linhas[i]
+    return linhas, pof
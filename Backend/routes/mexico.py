@@ -1,17 +1,35 @@
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Body, Query, Request
 from fastapi.encoders import jsonable_encoder
-from pathlib import Path
-from typing import Dict
-import pandas as pd
-import numpy as np
+from typing import Any, Dict, List, Optional
+import logging
 import os
 
+from utils.dataset_cache import dataset_cache, corpo_json
+from utils.http_cache import resposta_dataset, resposta_condicional, etag_de
+from utils import snapshot
+from utils import calculos
+from utils import consulta
+from utils import streaming
+from utils import serializacao
+from utils import escrita
+from utils import referencias
+from utils import metricas
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+openpyxl = modulo("openpyxl")
+
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # ✅ Caminho relativo para o arquivo dentro do projeto
+# (RISKWISE_DATA_DIR troca o diretório, ex.: planilhas sintéticas dos benchmarks)
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta para Backend
-EXCEL_PATH = os.path.join(BASE_DIR, "data", "DietaCronicaMexico.xlsx")
+DATA_DIR = os.environ.get("RISKWISE_DATA_DIR") or os.path.join(BASE_DIR, "data")
+EXCEL_PATH = os.path.join(DATA_DIR, "DietaCronicaMexico.xlsx")
 
 # Colunas esperadas na tabela principal
 COLUNAS_DESEJADAS = [
@@ -30,51 +48,183 @@ def safe_json(obj):
 
 # -------------------- Função para ler metadados e tabela --------------------
 
-def carregar_dados():
-    # Log para verificar caminho e existência do arquivo
-    print(f"EXCEL_PATH: {EXCEL_PATH}")
-    print(f"Arquivo existe? {os.path.exists(EXCEL_PATH)}")
+# Layout da planilha: metadados nas linhas 1-5, cabeçalho da tabela na linha 7
+LINHAS_META = 5
+LINHA_CABECALHO = 6
 
-    if not os.path.exists(EXCEL_PATH):
-        raise HTTPException(status_code=500, detail=f"Arquivo não encontrado: {EXCEL_PATH}")
+# Esquema validado (também registrado no snapshot colunar, ver utils/snapshot.py)
+ESQUEMA = {"colunas": COLUNAS_DESEJADAS, "linhas_meta": LINHAS_META, "linha_cabecalho": LINHA_CABECALHO}
 
-    try:
-        # Ler metadados (linhas 1 a 5)
-        meta_df = pd.read_excel(EXCEL_PATH, nrows=5, header=None)
-        meta_dict = {str(meta_df.iloc[i, 0]).strip(): meta_df.iloc[i, 1] for i in range(len(meta_df))}
+def _valor_celula(cell):
+    # Mesma conversão do leitor openpyxl do pandas: erro (#DIV/0!) vira NaN,
+    # número inteiro vira int
+    if cell.value is None:
+        return None
+    if cell.data_type == "e":
+        return np.nan
+    if cell.data_type == "n" and not isinstance(cell.value, bool):
+        inteiro = int(cell.value)
+        return inteiro if inteiro == cell.value else float(cell.value)
+    return cell.value
+
+def _ler_xlsx(path: str):
+    """
+    Lê metadados e tabela em uma única passada (openpyxl read_only), em vez
+    de abrir o arquivo uma vez para cada bloco.
+    """
+    with metricas.etapa("leitura_planilha", arquivo=os.path.basename(path)):
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+        try:
+            ws = wb.worksheets[0]
+            bloco_meta, cabecalho, linhas = [], None, []
+            for i, row in enumerate(ws.iter_rows()):
+                valores = [_valor_celula(c) for c in row]
+                if i < LINHAS_META:
+                    bloco_meta.append(valores)
+                elif i == LINHA_CABECALHO:
+                    cabecalho = valores
+                elif i > LINHA_CABECALHO:
+                    linhas.append(valores)
+        finally:
+            wb.close()
+
+    # Linhas vazias no fim da planilha são descartadas (como no pd.read_excel)
+    while linhas and all(v is None for v in linhas[-1]):
+        linhas.pop()
 
-        # Extrair valores fixos
-        adi_interno = float(meta_dict.get("ADI (mg/kg bw/day)", 0.05))
-        bw = float(meta_dict.get("bw (kg)", 70))
-        idmt = meta_dict.get("IDMT", None)
-        percent_adi = meta_dict.get("%ADI", None)
+    meta_dict = {str(r[0]).strip(): (r[1] if len(r) > 1 else None) for r in bloco_meta if r}
 
-        # Ler tabela principal (a partir da linha 7)
-        df = pd.read_excel(EXCEL_PATH, skiprows=6)
+    # Extrair valores fixos
+    extras = {
+        "adi_interno": float(_ou_nan(meta_dict.get("ADI (mg/kg bw/day)", 0.05))),
+        "bw": float(_ou_nan(meta_dict.get("bw (kg)", 70))),
+        "idmt": meta_dict.get("IDMT", None),
+        "percent_adi": meta_dict.get("%ADI", None),
+        # Bloco original, regravado como está pelo /atualizar
+        "bloco_meta": [[None if _vazio(v) else v for v in r] for r in bloco_meta],
+    }
 
-        # Validar colunas
+    colunas = [
+        str(c).strip() if c is not None else f"Unnamed: {i}"
+        for i, c in enumerate(cabecalho or [])
+    ]
+    df = pd.DataFrame(linhas, columns=colunas) if colunas else pd.DataFrame()
+
+    # Validar colunas
+    with metricas.etapa("validacao_colunas", arquivo=os.path.basename(path)):
         faltando = [c for c in COLUNAS_DESEJADAS if c not in df.columns]
         if faltando:
             raise HTTPException(status_code=500, detail=f"Colunas ausentes na planilha: {faltando}")
 
-        # Substituir NaN por None
-        df = df[COLUNAS_DESEJADAS].replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
+        df = df[COLUNAS_DESEJADAS].infer_objects()
+    vazias = [c for c in df.columns if df[c].isna().all()]
+    df[vazias] = df[vazias].astype(float)
+    return df, extras
 
-        return {
-            "meta": {"bw": bw, "adi_interno": adi_interno},
-            "rows": jsonable_encoder(df.to_dict(orient="records")),
-            "totals": {"idmt": idmt, "%ADI_interno": percent_adi}
-        }
+def _ou_nan(v):
+    return np.nan if v is None else v
+
+def _vazio(v):
+    return v is None or (isinstance(v, float) and np.isnan(v))
+
+def _ler_planilha(path: str):
+    logger.debug("Lendo planilha do México: %s", path)
+    if not os.path.exists(path):
+        logger.warning("Planilha do México não encontrada: %s", path)
+        raise HTTPException(status_code=500, detail=f"Arquivo não encontrado: {path}")
+
+    try:
+        with metricas.etapa("leitura_snapshot", arquivo=os.path.basename(path)):
+            carregado = snapshot.carregar(path, ESQUEMA)
+        if carregado is not None:
+            df, extras = carregado
+        else:
+            df, extras = _ler_xlsx(path)
+            snapshot.atualizar_se_possivel(path, df, ESQUEMA, extras)
+
+        # Substituir NaN por None
+        with metricas.etapa("limpeza_nan", arquivo=os.path.basename(path)):
+            df = df.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
+        return df, extras
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao ler Excel: {e}")
 
+def _totais(entrada):
+    return entrada.derivado(
+        "totais",
+        lambda e: calculos.totais_mexico(e.df, e.extras["bw"], e.extras["adi_interno"]),
+    )
+
+def _meta(entrada) -> Dict:
+    extras = entrada.extras
+    # "versao": token a mandar na forma compacta do relatório (utils/referencias.py)
+    return {"bw": extras["bw"], "adi_interno": extras["adi_interno"], "versao": entrada.token}
+
+def _payload(entrada, df: Optional[pd.DataFrame] = None):
+    df = entrada.df if df is None else df
+    return {
+        "meta": _meta(entrada),
+        "rows": jsonable_encoder(df.to_dict(orient="records")),
+        # Totais sempre sobre a tabela inteira, mesmo com filtros
+        "totals": _totais(entrada),
+    }
+
+def _payload_colunar(entrada, df: Optional[pd.DataFrame] = None):
+    df = entrada.df if df is None else df
+    return {
+        "meta": _meta(entrada),
+        **serializacao.colunar(df),
+        "totals": _totais(entrada),
+    }
+
+def carregar_dados():
+    return _payload(dataset_cache.obter(EXCEL_PATH, _ler_planilha))
+
+def _montar_resposta(entrada) -> bytes:
+    return corpo_json(safe_json(_payload(entrada)))
+
+def _montar_resposta_colunar(entrada) -> bytes:
+    return serializacao.dumps(_payload_colunar(entrada))
+
 # -------------------- Endpoint GET --------------------
 @router.get("/dados")
-def get_dados():
-    dados = carregar_dados()
-    dados = safe_json(dados)
-    return JSONResponse(content=dados)
+def get_dados(
+    request: Request,
+    cultivo: Optional[List[str]] = Query(None),
+    crop: Optional[List[str]] = Query(None),
+    fields: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=consulta.LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = None,
+    formato: str = Query("registros", alias="format", pattern=serializacao.PADRAO_FORMATO),
+):
+    entrada = dataset_cache.obter(EXCEL_PATH, _ler_planilha)
+    filtros = {"Cultivo": cultivo, "Crop": crop}
+    if streaming.pedido(request, stream):
+        pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+        cabecalho = {
+            "meta": {**_meta(entrada), "paginacao": paginacao},
+            "totals": _totais(entrada),
+        }
+        return streaming.resposta_ndjson(request, entrada, pagina, safe_json(cabecalho))
+
+    colunar = formato == "columnar"
+    if consulta.sem_parametros(filtros, fields, limit, cursor):
+        if colunar:
+            return resposta_dataset(request, entrada, _montar_resposta_colunar, chave="colunar")
+        return resposta_dataset(request, entrada, _montar_resposta)
+
+    pagina, paginacao = consulta.executar(entrada, filtros, fields, limit, cursor)
+    if colunar:
+        dados = _payload_colunar(entrada, pagina)
+        dados["meta"]["paginacao"] = paginacao
+        corpo = serializacao.dumps(dados)
+    else:
+        dados = _payload(entrada, pagina)
+        dados["meta"]["paginacao"] = paginacao
+        corpo = corpo_json(safe_json(dados))
+    return resposta_condicional(request, corpo, etag_de(corpo), versao=entrada.token)
 
 # -------------------- Endpoint POST --------------------
 @router.post("/atualizar")
@@ -94,13 +244,66 @@ def atualizar(payload: Dict = Body(...)):
     # Substituir NaN por None
     novo_df = novo_df[COLUNAS_DESEJADAS].replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
 
-    try:
-        # Reescrever Excel mantendo metadados
-        meta_df = pd.read_excel(EXCEL_PATH, nrows=5, header=None)
-        with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl") as writer:
+    # Reescrever Excel mantendo metadados (bloco já lido e cacheado pelo GET)
+    extras = dataset_cache.obter(EXCEL_PATH, _ler_planilha).extras
+    meta_df = pd.DataFrame(extras["bloco_meta"])
+
+    def escrever(destino):
+        with pd.ExcelWriter(destino, engine="openpyxl") as writer:
             meta_df.to_excel(writer, index=False, header=False)
             novo_df.to_excel(writer, index=False, startrow=6)
+
+    # Memória primeiro (metadados não mudam); a planilha é gravada de forma
+    # atômica e agrupada pelo gravador do dataset (utils/escrita.py)
+    gravador = escrita.gravador_de(EXCEL_PATH)
+    with gravador.estado:
+        entrada = dataset_cache.substituir(EXCEL_PATH, novo_df.reset_index(drop=True), extras)
+        ticket = gravador.agendar(completa=escrever)
+    try:
+        gravador.aguardar(ticket)
     except PermissionError:
         raise HTTPException(status_code=423, detail="Feche o arquivo Excel e tente novamente.")
 
-    return {"status": "salvo"}
\ No newline at end of file
+    return {"status": gravador.situacao(), "versao": entrada.token, "versao_escrita": ticket.versao}
+
+# -------------------- Relatório combinado por referência --------------------
+EDITAVEIS = ["LMR (mg/kg)", "R (mg/kg)"]
+
+def linhas_relatorio(versao: str, overrides: Dict[str, Dict[str, Any]],
+                     adi=None, com_resultados: bool = True):
+    """
+    Linhas do México para o relatório a partir das posições em `overrides`
+    (LMR/R enviados sobre os do dataset, (LMR or R)*C recalculado) e, com
+    `com_resultados`, os resultados no formato do front (bw, sum, adi, idmt,
+    percentAdi) sobre a tabela inteira; sem `adi`, vale o ADI interno da
+    planilha. Retorna (linhas, resultados). Levanta ValueError para
+    linha/coluna inválida.
+    """
+    entrada = dataset_cache.obter(EXCEL_PATH, _ler_planilha)
+    referencias.conferir_versao(entrada, versao)
+    pedidas = referencias.por_linha(overrides, len(entrada.df))
+    for valores in pedidas.values():
+        invalidas = [c for c in valores if c not in EDITAVEIS]
+        if invalidas:
+            raise ValueError(f"Coluna não pode ser sobrescrita: {invalidas[0]!r}")
+
+    df = entrada.df.astype({c: object for c in EDITAVEIS})
+    for linha, valores in pedidas.items():
+        for coluna, valor in valores.items():
+            df.iat[linha, df.columns.get_loc(coluna)] = valor
+
+    selecionadas = df.iloc[list(pedidas)].copy()
+    selecionadas["(LMR or R)*C"] = calculos.para_json(calculos.calcular_lc_mexico(selecionadas))
+    linhas = jsonable_encoder(selecionadas[COLUNAS_DESEJADAS].to_dict(orient="records"))
+
+    resultados = {}
+    if com_resultados:
+        extras = entrada.extras
+        adi = extras["adi_interno"] if adi in (None, "") else adi
+        totais = calculos.totais_mexico(df, extras["bw"], adi)
+        resultados = {
+            "bw": extras["bw"], "sum": totais["sumLC"], "adi": adi,
+            "idmt": totais["idmt"], "percentAdi": totais["%ADI_interno"],
+        }
+        resultados = {k: ("-" if v is None else v) for k, v in resultados.items()}
+    return linhas, resultados
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query
 from fastapi.responses import StreamingResponse
-from typing import Any, Dict, List, Optional
-from io import BytesIO
-from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime
+import asyncio
+import json
+import os
+import re
+import time
 
-from utils.report import gerar_pdf_combinado
+from starlette.concurrency import run_in_threadpool
+
+from utils.pool_pdf import pool_pdf
+from utils.cache_pdf import cache_pdf, chave_de
+from utils.spool_pdf import resposta_arquivo, resposta_pdf, tamanho
+from utils import exportacao
+from utils.zip_fluxo import ZipEmFluxo
+from utils import referencias
+from . import acute as rota_acute, chronic as rota_chronic, mexico as rota_mexico
 
 router = APIRouter()
 
@@ -77,152 +89,399 @@ def _linhas_usuario_digitou_string(
     return out
 
 
+def _linhas_por_referencia(nome: str, secao: Dict[str, Any], campos_editaveis: List[str], montar):
+    """
+    Seção na forma compacta (utils/referencias.py): entram as linhas com pelo
+    menos 1 campo editável preenchido, juntadas ao dataset pela rota dona
+    dele via `montar(versao, overrides)`.
+    """
+    versao, overrides = referencias.ler(secao, nome)
+    tocadas = {
+        linha: valores for linha, valores in overrides.items()
+        if any(not _is_blank_like(valores.get(campo)) for campo in campos_editaveis)
+    }
+    try:
+        return montar(versao, tocadas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"'{nome}': {e}")
+
+
 # -------------------------------
-# Endpoint
+# Normalização do payload
 # -------------------------------
-@router.post("/gerar-pdf")
-def gerar_pdf_completo(payload: Dict[str, Any] = Body(...)):
-    try:
-        # ---- Campos editáveis por calculadora
-        acute_campos_editaveis = ["LMR (mg/kg)", "HR/MCR (mg/kg)", "MREC/STMR (mg/kg)"]
-        chronic_campos_editaveis = ["LMR (mg_kg)", "LMR (mg/kg)", "MREC_STMR (mg_kg)", "MREC_STMR (mg/kg)"]
-        mexico_campos_editaveis = ["LMR (mg/kg)", "R (mg/kg)"]  # só consideramos México se usuário preencheu LMR/R
+def _preparar_relatorio(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """
+    Aplica os filtros do payload de /gerar-pdf e devolve (argumentos de
+    gerar_pdf_combinado, nome do arquivo).
 
-        # ---- Entradas brutas
-        acute_input: List[Dict[str, Any]] = payload.get("acute", []) or []
-        chronic_input: List[Dict[str, Any]] = payload.get("chronic", []) or []
+    "acute", "chronic" e "mexico" aceitam a tabela completa ou a forma
+    compacta {"versao", "overrides"} (utils/referencias.py); na compacta o
+    POF (sem pof2008/pof2017) e os resultados do México (sem "results") são
+    calculados no servidor.
+    """
+    # ---- Campos editáveis por calculadora
+    acute_campos_editaveis = ["LMR (mg/kg)", "HR/MCR (mg/kg)", "MREC/STMR (mg/kg)"]
+    chronic_campos_editaveis = ["LMR (mg_kg)", "LMR (mg/kg)", "MREC_STMR (mg_kg)", "MREC_STMR (mg/kg)"]
+    mexico_campos_editaveis = ["LMR (mg/kg)", "R (mg/kg)"]  # só consideramos México se usuário preencheu LMR/R
 
+    # ---- Entradas brutas
+    acute_input = payload.get("acute", []) or []
+    chronic_input = payload.get("chronic", []) or []
+
+    # ---- POFs
+    pof2008: Optional[Dict[str, Any]] = payload.get("pof2008")
+    pof2017: Optional[Dict[str, Any]] = payload.get("pof2017")
+
+    # ---- DRFA (Acute Crop)
+    drfa_externo: str = payload.get("acute_drfa_externo") or payload.get("drfa_externo") or "-"
+    drfa_interno: str = payload.get("acute_drfa_interno") or payload.get("drfa_interno") or "-"
+
+    # ---- IDAs do Chronic (separados)
+    chronic_ida_externo = payload.get("chronic_ida_externo")
+    chronic_ida_interno = payload.get("chronic_ida_interno")
+
+    if referencias.e_referencia(acute_input):
+        acute = _linhas_por_referencia(
+            "acute", acute_input, acute_campos_editaveis,
+            lambda versao, ov: rota_acute.linhas_relatorio(versao, ov, drfa_externo, drfa_interno),
+        )
+    else:
         # ---- Filtro 1 (não vazio)
         acute_base = _linhas_usuario_preencheu(acute_input, acute_campos_editaveis)
-        chronic = _linhas_usuario_preencheu(chronic_input, chronic_campos_editaveis)
 
         # ---- Filtro 2 (somente o que foi digitado como STRING) - reforço p/ Acute
         acute_str_only = _linhas_usuario_digitou_string(acute_base, acute_campos_editaveis)
         acute = acute_str_only if acute_str_only else acute_base
 
-        # ---- POFs
-        pof2008: Optional[Dict[str, Any]] = payload.get("pof2008")
-        pof2017: Optional[Dict[str, Any]] = payload.get("pof2017")
-
-        # ---- DRFA (Acute Crop)
-        drfa_externo: str = payload.get("acute_drfa_externo") or payload.get("drfa_externo") or "-"
-        drfa_interno: str = payload.get("acute_drfa_interno") or payload.get("drfa_interno") or "-"
-
-        # ---- Water Acute
-        water_conc        = payload.get("water_conc", "-")
-        water_adulto      = payload.get("water_adulto", "-")
-        water_crianca     = payload.get("water_crianca", "-")
-        water_int_adulto  = payload.get("water_int_adulto", "-")
-        water_ext_adulto  = payload.get("water_ext_adulto", "-")
-        water_int_crianca = payload.get("water_int_crianca", "-")
-        water_ext_crianca = payload.get("water_ext_crianca", "-")
-        water_drfa_ext    = payload.get("water_drfa_externo", "-")
-        water_drfa_int    = payload.get("water_drfa_interno", "-")
-
-        # Monta water_data (defesa extra); renderização respeita flags no report.py
-        water_fields = [
-            water_conc, water_adulto, water_crianca,
-            water_int_adulto, water_ext_adulto, water_int_crianca, water_ext_crianca,
-            water_drfa_ext, water_drfa_int
-        ]
-        water_data = None
-        if any(str(v).strip() and str(v).strip() not in ("-", "—") for v in water_fields):
-            water_data = {
-                "DRFA Externo": water_drfa_ext,
-                "DRFA Interno": water_drfa_int,
-                "Concentração": water_conc,
-                "Peso Adulto": water_adulto,
-                "Peso Criança": water_crianca,
-                "%DRFA Interno Adulto": water_int_adulto,
-                "%DRFA Externo Adulto": water_ext_adulto,
-                "%DRFA Interno Criança": water_int_crianca,
-                "%DRFA Externo Criança": water_ext_crianca
-            }
-
-        # ---- Water Chronic
-        wchr_conc        = payload.get("CRONICO_conc", "-")
-        wchr_adulto      = payload.get("CRONICO_adulto", "-")
-        wchr_crianca     = payload.get("CRONICO_crianca", "-")
-        wchr_int_adulto  = payload.get("CRONICO_outIntAdulto", "-")
-        wchr_ext_adulto  = payload.get("CRONICO_outExtAdulto", "-")
-        wchr_int_crianca = payload.get("CRONICO_outIntCrianca", "-")
-        wchr_ext_crianca = payload.get("CRONICO_outExtCrianca", "-")
-        wchr_ida_ext     = payload.get("CRONICO_IDA_ANVISA_VAL", "-")
-        wchr_ida_int     = payload.get("CRONICO_IDA_SYNGENTA_VAL", "-")
-
-        water_chronic_data = {
-            "IDA Externo": wchr_ida_ext,
-            "IDA Interno": wchr_ida_int,
-            "Concentração": wchr_conc,
-            "Peso Adulto": wchr_adulto,
-            "Peso Criança": wchr_crianca,
-            "%IDA Interno Adulto": wchr_int_adulto,
-            "%IDA Externo Adulto": wchr_ext_adulto,
-            "%IDA Interno Criança": wchr_int_crianca,
-            "%IDA Externo Criança": wchr_ext_crianca,
+    if referencias.e_referencia(chronic_input):
+        chronic, pof = _linhas_por_referencia(
+            "chronic", chronic_input, chronic_campos_editaveis,
+            lambda versao, ov: rota_chronic.linhas_relatorio(versao, ov, chronic_ida_externo, chronic_ida_interno),
+        )
+        if chronic and pof2008 is None and pof2017 is None:
+            pof2008, pof2017 = pof[2008], pof[2017]
+    else:
+        chronic = _linhas_usuario_preencheu(chronic_input, chronic_campos_editaveis)
+
+    # ---- Water Acute
+    water_conc        = payload.get("water_conc", "-")
+    water_adulto      = payload.get("water_adulto", "-")
+    water_crianca     = payload.get("water_crianca", "-")
+    water_int_adulto  = payload.get("water_int_adulto", "-")
+    water_ext_adulto  = payload.get("water_ext_adulto", "-")
+    water_int_crianca = payload.get("water_int_crianca", "-")
+    water_ext_crianca = payload.get("water_ext_crianca", "-")
+    water_drfa_ext    = payload.get("water_drfa_externo", "-")
+    water_drfa_int    = payload.get("water_drfa_interno", "-")
+
+    # Monta water_data (defesa extra); renderização respeita flags no report.py
+    water_fields = [
+        water_conc, water_adulto, water_crianca,
+        water_int_adulto, water_ext_adulto, water_int_crianca, water_ext_crianca,
+        water_drfa_ext, water_drfa_int
+    ]
+    water_data = None
+    if any(str(v).strip() and str(v).strip() not in ("-", "—") for v in water_fields):
+        water_data = {
+            "DRFA Externo": water_drfa_ext,
+            "DRFA Interno": water_drfa_int,
+            "Concentração": water_conc,
+            "Peso Adulto": water_adulto,
+            "Peso Criança": water_crianca,
+            "%DRFA Interno Adulto": water_int_adulto,
+            "%DRFA Externo Adulto": water_ext_adulto,
+            "%DRFA Interno Criança": water_int_crianca,
+            "%DRFA Externo Criança": water_ext_crianca
         }
 
-        # ---- México: filtre o dataset base e só inclua se há LMR/R OU resultados numéricos
-        mexico_input = payload.get("mexico") or {}
-        mexico_data_raw: List[Dict[str, Any]] = mexico_input.get("data") or []
-        mexico_results: Dict[str, Any] = mexico_input.get("results") or {}
+    # ---- Water Chronic
+    wchr_conc        = payload.get("CRONICO_conc", "-")
+    wchr_adulto      = payload.get("CRONICO_adulto", "-")
+    wchr_crianca     = payload.get("CRONICO_crianca", "-")
+    wchr_int_adulto  = payload.get("CRONICO_outIntAdulto", "-")
+    wchr_ext_adulto  = payload.get("CRONICO_outExtAdulto", "-")
+    wchr_int_crianca = payload.get("CRONICO_outIntCrianca", "-")
+    wchr_ext_crianca = payload.get("CRONICO_outExtCrianca", "-")
+    wchr_ida_ext     = payload.get("CRONICO_IDA_ANVISA_VAL", "-")
+    wchr_ida_int     = payload.get("CRONICO_IDA_SYNGENTA_VAL", "-")
 
-        mexico_data_filtered = _linhas_usuario_preencheu(mexico_data_raw, mexico_campos_editaveis)
+    water_chronic_data = {
+        "IDA Externo": wchr_ida_ext,
+        "IDA Interno": wchr_ida_int,
+        "Concentração": wchr_conc,
+        "Peso Adulto": wchr_adulto,
+        "Peso Criança": wchr_crianca,
+        "%IDA Interno Adulto": wchr_int_adulto,
+        "%IDA Externo Adulto": wchr_ext_adulto,
+        "%IDA Interno Criança": wchr_int_crianca,
+        "%IDA Externo Criança": wchr_ext_crianca,
+    }
 
-        tem_resultados_mexico = any(
-            _is_number_like(mexico_results.get(k))
-            for k in ("adi", "idmt", "percentAdi", "sum", "bw")
-        )
+    # ---- México: filtre o dataset base e só inclua se há LMR/R OU resultados numéricos
+    mexico_input = payload.get("mexico") or {}
+    mexico_results: Dict[str, Any] = mexico_input.get("results") or {}
 
-        should_include_mexico = (len(mexico_data_filtered) > 0) or tem_resultados_mexico
-
-        mexico_payload = None
-        if should_include_mexico:
-            mexico_payload = {
-                "data": mexico_data_filtered,
-                "results": mexico_results
-            }
-
-        # ---- Flags vindas do frontend (Water)
-        incluir_water_acute   = bool(payload.get("incluirWaterAcute"))
-        incluir_water_chronic = bool(payload.get("incluirWaterChronic"))
-
-        # ---- Nome do arquivo dinâmico
-        name_parts = []
-        if acute: name_parts.append("acute")
-        if chronic: name_parts.append("chronic")
-        if incluir_water_acute: name_parts.append("waterAcute")
-        if incluir_water_chronic: name_parts.append("waterChronic")
-        if should_include_mexico: name_parts.append("mexico")
-        if not name_parts:
-            name_parts = ["empty"]
-        filename = f"riskwise_{'_'.join(name_parts)}_{date.today().isoformat()}.pdf"
-
-        # ---- IDAs do Chronic (separados)
-        chronic_ida_externo = payload.get("chronic_ida_externo")
-        chronic_ida_interno = payload.get("chronic_ida_interno")
-
-        # ---- Geração do PDF
-        pdf_bytes = gerar_pdf_combinado(
-            acute_drfa_externo=drfa_externo,
-            acute_drfa_interno=drfa_interno,
-            chronic_ida_externo=chronic_ida_externo,
-            chronic_ida_interno=chronic_ida_interno,
-            acute_rows=acute,
-            chronic_rows=chronic,
-            pof2008=pof2008,
-            pof2017=pof2017,
-            water_data=water_data,
-            water_chronic_data=water_chronic_data,
-            incluir_water_acute=incluir_water_acute,
-            incluir_water_chronic=incluir_water_chronic,
-            mexico=mexico_payload  # ⬅️ só passa se realmente deve incluir
+    if referencias.e_referencia(mexico_input):
+        mexico_data_filtered, calculados = _linhas_por_referencia(
+            "mexico", mexico_input, mexico_campos_editaveis,
+            lambda versao, ov: rota_mexico.linhas_relatorio(
+                versao, ov, mexico_input.get("adi"), com_resultados=bool(ov) and not mexico_results,
+            ),
         )
+        mexico_results = mexico_results or calculados
+    else:
+        mexico_data_raw: List[Dict[str, Any]] = mexico_input.get("data") or []
+        mexico_data_filtered = _linhas_usuario_preencheu(mexico_data_raw, mexico_campos_editaveis)
+
+    tem_resultados_mexico = any(
+        _is_number_like(mexico_results.get(k))
+        for k in ("adi", "idmt", "percentAdi", "sum", "bw")
+    )
+
+    should_include_mexico = (len(mexico_data_filtered) > 0) or tem_resultados_mexico
+
+    mexico_payload = None
+    if should_include_mexico:
+        mexico_payload = {
+            "data": mexico_data_filtered,
+            "results": mexico_results
+        }
+
+    # ---- Flags vindas do frontend (Water)
+    incluir_water_acute   = bool(payload.get("incluirWaterAcute"))
+    incluir_water_chronic = bool(payload.get("incluirWaterChronic"))
+
+    # ---- Nome do arquivo dinâmico
+    name_parts = []
+    if acute: name_parts.append("acute")
+    if chronic: name_parts.append("chronic")
+    if incluir_water_acute: name_parts.append("waterAcute")
+    if incluir_water_chronic: name_parts.append("waterChronic")
+    if should_include_mexico: name_parts.append("mexico")
+    if not name_parts:
+        name_parts = ["empty"]
+    filename = f"riskwise_{'_'.join(name_parts)}_{date.today().isoformat()}.pdf"
+
+    argumentos = dict(
+        acute_drfa_externo=drfa_externo,
+        acute_drfa_interno=drfa_interno,
+        chronic_ida_externo=chronic_ida_externo,
+        chronic_ida_interno=chronic_ida_interno,
+        acute_rows=acute,
+        chronic_rows=chronic,
+        pof2008=pof2008,
+        pof2017=pof2017,
+        water_data=water_data,
+        water_chronic_data=water_chronic_data,
+        incluir_water_acute=incluir_water_acute,
+        incluir_water_chronic=incluir_water_chronic,
+        mexico=mexico_payload  # ⬅️ só passa se realmente deve incluir
+    )
+    return argumentos, filename
+
+
+def _gerador_pdf():
+    # ReportLab só é importado no primeiro PDF, não no cold start (utils/sob_demanda.py)
+    from utils.report import gerar_pdf_combinado
+    return gerar_pdf_combinado
+
+
+def _preparar_com_chave(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], str, str]:
+    argumentos, filename = _preparar_relatorio(payload)
+    return argumentos, filename, chave_de("gerar_pdf_combinado", argumentos)
+
+
+async def _preparar_fora_do_loop(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], str, str]:
+    # Filtragem do payload, hash canônico da chave e (forma compacta com o
+    # cache frio) a leitura da planilha custam dezenas de ms em tabelas
+    # grandes: numa thread, para não segurar as outras requisições
+    return await run_in_threadpool(_preparar_com_chave, payload)
+
+
+async def _renderizar(argumentos: Dict[str, Any], chave: str):
+    # Cache por conteúdo (utils/cache_pdf.py) na frente do pool de processos (utils/pool_pdf.py)
+    return await cache_pdf.obter_ou_gerar(
+        chave,
+        lambda: pool_pdf.renderizar(_gerador_pdf(), **argumentos),
+    )
 
+
+# -------------------------------
+# Endpoint
+# -------------------------------
+@router.post("/gerar-pdf")
+async def gerar_pdf_completo(payload: Dict[str, Any] = Body(...)):
+    try:
+        argumentos, filename, chave = await _preparar_fora_do_loop(payload)
+        pdf, origem = await _renderizar(argumentos, chave)
+        return resposta_pdf(pdf, filename, {"X-PDF-Cache": origem})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF combinado: {e}")
+
+
+MEDIA_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@router.post("/export")
+def exportar_relatorio(
+    payload: Dict[str, Any] = Body(...),
+    formato: str = Query("xlsx", alias="format", pattern=exportacao.PADRAO_FORMATO),
+    secao: Optional[str] = Query(None, description="Só esta seção (ex.: Acute, Chronic, Mexico)"),
+):
+    """
+    Mesmo payload e filtros de /gerar-pdf, com as seções em planilha
+    (uma aba por seção) ou CSV (uma seção: CSV; várias: ZIP com um CSV
+    por seção). Os parâmetros (DRFA/IDA) vão na seção "Parametros".
+    """
+    try:
+        argumentos, filename = _preparar_relatorio(payload)
+        base = os.path.splitext(filename)[0]
+        lista = exportacao.secoes_escolhidas(argumentos, secao)
+        if formato == "xlsx":
+            return resposta_arquivo(exportacao.gerar_xlsx(lista), f"{base}.xlsx", MEDIA_XLSX)
+        if len(lista) == 1:
+            return StreamingResponse(
+                exportacao.blocos_csv(lista[0]),
+                media_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": f'attachment; filename="{base}_{lista[0].nome}.csv"'},
+            )
         return StreamingResponse(
-            BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            exportacao.zip_de_csvs(lista),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{base}_csv.zip"'},
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF combinado: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao exportar relatório: {e}")
+
+
+# -------------------------------
+# Lote: vários relatórios num ZIP
+# -------------------------------
+# RISKWISE_PDF_LOTE_MAX: máximo de relatórios por pedido (padrão 100)
+try:
+    LOTE_MAXIMO = max(1, int(os.environ.get("RISKWISE_PDF_LOTE_MAX", 100)))
+except ValueError:
+    LOTE_MAXIMO = 100
+
+# Tempo máximo que um item do lote espera vaga no pool (fila cheia por
+# outras requisições) antes de ser dado como falha no manifesto
+ESPERA_FILA_S = 120
+
+
+def _itens_do_lote(payload: Any) -> List[Dict[str, Any]]:
+    """Aceita a lista de payloads pura ou {"relatorios": [...]}."""
+    itens = payload.get("relatorios") if isinstance(payload, dict) else payload
+    if not isinstance(itens, list) or not itens:
+        raise HTTPException(status_code=400, detail='Envie uma lista de relatórios ou {"relatorios": [...]}.')
+    if len(itens) > LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"Máximo de {LOTE_MAXIMO} relatórios por lote.")
+    if not all(isinstance(item, dict) for item in itens):
+        raise HTTPException(status_code=400, detail="Cada relatório deve ser um objeto.")
+    return itens
+
+
+def _nome_no_zip(indice: int, payload: Dict[str, Any], filename: str) -> str:
+    # "nome" opcional no payload (ex.: a substância); o índice evita nomes repetidos
+    nome = re.sub(r"[^\w.-]+", "_", str(payload.get("nome") or "")).strip("._")
+    if nome:
+        filename = nome if nome.lower().endswith(".pdf") else f"{nome}.pdf"
+    return f"{indice + 1:03d}_{filename}"
+
+
+async def _gerar_no_lote(argumentos: Dict[str, Any], vagas: asyncio.Semaphore, registro: Dict[str, Any]):
+    # Só chamado em cache miss: ocupa uma vaga do lote e, se a fila do pool
+    # estiver cheia por outras requisições (503), espera e tenta de novo
+    inicio = time.perf_counter()
+    async with vagas:
+        registro["fila_s"] = round(time.perf_counter() - inicio, 3)
+        limite = time.monotonic() + ESPERA_FILA_S
+        while True:
+            try:
+                inicio = time.perf_counter()
+                pdf = await pool_pdf.renderizar(_gerador_pdf(), **argumentos)
+                registro["renderizacao_s"] = round(time.perf_counter() - inicio, 3)
+                return pdf
+            except HTTPException as e:
+                if e.status_code != 503 or time.monotonic() >= limite:
+                    raise
+                await asyncio.sleep(min(2.0, pool_pdf.retry_after()))
+
+
+async def _item_do_lote(indice: int, payload: Dict[str, Any], vagas: asyncio.Semaphore):
+    registro: Dict[str, Any] = {"indice": indice, "arquivo": None, "status": "ok"}
+    pdf = None
+    inicio = time.perf_counter()
+    try:
+        argumentos, filename, chave = await _preparar_fora_do_loop(payload)
+        registro["arquivo"] = _nome_no_zip(indice, payload, filename)
+        pdf, origem = await cache_pdf.obter_ou_gerar(
+            chave,
+            lambda: _gerar_no_lote(argumentos, vagas, registro),
+        )
+        registro["cache"] = origem
+        registro["bytes"] = tamanho(pdf)
+    except HTTPException as e:
+        registro.update(status="erro", erro=str(e.detail))
+    except Exception as e:
+        registro.update(status="erro", erro=f"{type(e).__name__}: {e}")
+    registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return registro, pdf
+
+
+async def _zip_do_lote(itens: List[Dict[str, Any]]):
+    inicio = time.perf_counter()
+    # Um relatório por worker do pool; sem workers, um por vez na thread
+    vagas = asyncio.Semaphore(max(1, pool_pdf.workers))
+    tarefas = [asyncio.ensure_future(_item_do_lote(i, p, vagas)) for i, p in enumerate(itens)]
+    saida = ZipEmFluxo()
+    registros = []
+    try:
+        # Cada PDF entra no ZIP assim que fica pronto, na ordem de conclusão
+        for proximo in asyncio.as_completed(tarefas):
+            registro, pdf = await proximo
+            registros.append(registro)
+            if pdf is not None:
+                for bloco in saida.adicionar(registro["arquivo"], pdf):
+                    if bloco:
+                        yield bloco
+            del pdf
+
+        registros.sort(key=lambda r: r["indice"])
+        manifesto = {
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "total": len(registros),
+            "sucesso": sum(r["status"] == "ok" for r in registros),
+            "falhas": sum(r["status"] != "ok" for r in registros),
+            "duracao_s": round(time.perf_counter() - inicio, 3),
+            # Soma dos tempos de renderização: comparar com duracao_s × workers
+            "renderizacao_total_s": round(sum(r.get("renderizacao_s", 0) for r in registros), 3),
+            "workers": pool_pdf.workers,
+            "relatorios": registros,
+        }
+        for bloco in saida.adicionar("manifest.json", json.dumps(manifesto, ensure_ascii=False, indent=2).encode("utf-8")):
+            yield bloco
+        yield saida.fechar()
+    finally:
+        # Cliente desconectou: cancela o que ainda não terminou
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+@router.post("/gerar-pdf/lote")
+async def gerar_pdf_lote(payload: Any = Body(...)):
+    """
+    Recebe uma lista de payloads no formato de /gerar-pdf (cada um pode ter
+    "nome") e devolve um ZIP com um PDF por relatório e um manifest.json com
+    tempo, origem no cache e erro de cada item. Os PDFs são gerados em
+    paralelo no pool e o ZIP é enviado enquanto ficam prontos.
+    """
+    itens = _itens_do_lote(payload)
+    return StreamingResponse(
+        _zip_do_lote(itens),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="riskwise_lote_{date.today().isoformat()}.zip"'},
+    )
@@ -0,0 +1,20 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# Mesmo esquema de imports do Backend/main.py (from utils..., from routes...)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    """Cópia de uma planilha de Backend/data num diretório temporário (sem snapshot)."""
+    def copiar(nome: str) -> str:
+        destino = str(tmp_path / nome)
+        shutil.copyfile(os.path.join(DATA_DIR, nome), destino)
+        return destino
+    return copiar
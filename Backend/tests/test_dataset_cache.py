@@ -0,0 +1,51 @@
+from fastapi.encoders import jsonable_encoder
+
+from routes import acute, mexico
+from utils import snapshot
+from utils.dataset_cache import DatasetEntry
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+
+def _token(path, df, extras=None):
+    return DatasetEntry(path, None, 1, df, extras).token
+
+
+def _pelo_xlsx_e_pelo_snapshot(path, esquema, ler):
+    assert snapshot.carregar(path, esquema) is None
+    pelo_xlsx = ler(path)  # sem snapshot: lê o .xlsx e compila o snapshot
+    assert snapshot.carregar(path, esquema) is not None
+    pelo_snapshot = ler(path)
+    return pelo_xlsx, pelo_snapshot
+
+
+def test_token_do_mexico_igual_pelo_xlsx_e_pelo_snapshot(planilha):
+    path = planilha("DietaCronicaMexico.xlsx")
+    (df_xlsx, extras), (df_snap, _) = _pelo_xlsx_e_pelo_snapshot(path, mexico.ESQUEMA, mexico._ler_planilha)
+    assert _token(path, df_xlsx, extras) == _token(path, df_snap, extras)
+
+
+def test_token_do_mexico_igual_apos_atualizar_com_as_mesmas_linhas(planilha):
+    path = planilha("DietaCronicaMexico.xlsx")
+    df, extras = mexico._ler_planilha(path)
+    # Mesmo caminho do POST /mexico/atualizar: linhas em JSON de volta para DataFrame
+    linhas = jsonable_encoder(df.to_dict(orient="records"))
+    novo = pd.DataFrame(linhas)[mexico.COLUNAS_DESEJADAS]
+    novo = novo.replace({pd.NA: None, np.nan: None, np.inf: None, -np.inf: None})
+    assert _token(path, df, extras) == _token(path, novo, extras)
+
+
+def test_token_do_acute_igual_pelo_xlsx_e_pelo_snapshot(planilha):
+    path = planilha("DietaAgudaOf.xlsx")
+    df_xlsx, df_snap = _pelo_xlsx_e_pelo_snapshot(path, acute.ESQUEMA, acute._read_excel_validated)
+    assert _token(path, df_xlsx) == _token(path, df_snap)
+
+
+def test_token_muda_com_o_conteudo(planilha):
+    path = planilha("DietaCronicaMexico.xlsx")
+    df, extras = mexico._ler_planilha(path)
+    alterado = df.copy()
+    alterado.loc[0, "LMR (mg/kg)"] = 123.0
+    assert _token(path, df, extras) != _token(path, alterado, extras)
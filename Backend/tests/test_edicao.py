@@ -0,0 +1,214 @@
+import os
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import load_workbook
+
+from utils import edicao
+
+_TIPOS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '{extras}</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets><calcPr calcId="191029"/></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>{extras}</Relationships>'
+)
+_ABA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">{dados}</worksheet>'
+)
+_TIPO_STRINGS = ('<Override PartName="/xl/sharedStrings.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>')
+_REL_STRINGS = ('<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+                'sharedStrings" Target="sharedStrings.xml"/>')
+_TIPO_CALC = ('<Override PartName="/xl/calcChain.xml" '
+              'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/>')
+_REL_CALC = ('<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+             'calcChain" Target="calcChain.xml"/>')
+
+
+def _xlsx(path, dados: str, compartilhados=None, calc_chain: str = None) -> str:
+    """Pacote .xlsx mínimo com `dados` (o <sheetData>) na primeira aba."""
+    tipos, rels = "", ""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        if compartilhados is not None:
+            sis = "".join(f"<si><t>{t}</t></si>" for t in compartilhados)
+            z.writestr("xl/sharedStrings.xml",
+                       '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">' + sis + "</sst>")
+            tipos, rels = tipos + _TIPO_STRINGS, rels + _REL_STRINGS
+        if calc_chain is not None:
+            z.writestr("xl/calcChain.xml",
+                       '<calcChain xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                       + calc_chain + "</calcChain>")
+            tipos, rels = tipos + _TIPO_CALC, rels + _REL_CALC
+        z.writestr("[Content_Types].xml", _TIPOS.format(extras=tipos))
+        z.writestr("_rels/.rels", _RELS)
+        z.writestr("xl/workbook.xml", _WORKBOOK)
+        z.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS.format(extras=rels))
+        z.writestr("xl/worksheets/sheet1.xml", _ABA.format(dados=dados))
+    return str(path)
+
+
+def _aba(path) -> bytes:
+    with zipfile.ZipFile(path) as z:
+        return z.read("xl/worksheets/sheet1.xml")
+
+
+def _valores(path, formulas=False):
+    ws = load_workbook(path, data_only=not formulas).active
+    return [list(linha) for linha in ws.iter_rows(values_only=True)]
+
+
+_CABECALHO_INLINE = (
+    '<row r="1"><c r="A1" t="inlineStr"><is><t>Nome</t></is></c>'
+    '<c r="B1" t="inlineStr"><is><t>Valor</t></is></c></row>'
+)
+
+
+def test_cabecalho_com_textos_compartilhados(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        '<sheetData><row r="1"><c r="A1" t="s"><v>1</v></c><c r="B1" t="s"><v>0</v></c></row>'
+        '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="B2"><v>1</v></c></row></sheetData>',
+        compartilhados=["Valor", "Nome", "arroz"],
+    )
+    edicao.gravar_celulas(path, {(0, "Valor"): 2.5, (0, "Nome"): "feijão"})
+    assert _valores(path) == [["Nome", "Valor"], ["feijão", 2.5]]
+
+
+def test_cabecalho_com_textos_inline(tmp_path):
+    path = _xlsx(tmp_path / "p.xlsx", f'<sheetData>{_CABECALHO_INLINE}<row r="2"><c r="A2"><v>1</v></c></row></sheetData>')
+    edicao.gravar_celulas(path, {(0, "Valor"): 7})
+    assert _valores(path) == [["Nome", "Valor"], [1, 7]]
+
+
+def test_coluna_desconhecida_e_400(tmp_path):
+    path = _xlsx(tmp_path / "p.xlsx", f"<sheetData>{_CABECALHO_INLINE}</sheetData>")
+    original = open(path, "rb").read()
+    with pytest.raises(HTTPException) as erro:
+        edicao.gravar_celulas(path, {(0, "Outra"): 1})
+    assert erro.value.status_code == 400
+    assert open(path, "rb").read() == original
+
+
+def test_linha_e_celula_autofechadas_mantem_o_estilo(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        f'<sheetData>{_CABECALHO_INLINE}<row r="2" ht="20" customHeight="1"/>'
+        '<row r="3"><c r="A3" s="4"/><c r="B3" s="5"/></row></sheetData>',
+    )
+    edicao.gravar_celulas(path, {(0, "Nome"): "a", (1, "Valor"): 3})
+    aba = _aba(path)
+    # (sem styles.xml no pacote de teste: o estilo é conferido no XML)
+    assert (b'<row r="2" ht="20" customHeight="1"><c r="A2" t="inlineStr"><is><t xml:space="preserve">a</t></is></c></row>'
+            in aba)
+    assert b'<row r="3"><c r="A3" s="4"/><c r="B3" s="5"><v>3</v></c></row>' in aba
+
+
+def test_linhas_ausentes_do_sheetdata(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        f'<sheetData>{_CABECALHO_INLINE}<row r="4"><c r="A4"><v>4</v></c></row></sheetData>',
+    )
+    # Linha 3 (entre o cabeçalho e a 4) e linha 6 (depois da última) não existem no XML
+    edicao.gravar_celulas(path, {(1, "Valor"): 3, (4, "Nome"): "fim"})
+    numeros = [int(n) for n in edicao._LINHA.findall(_aba(path))]
+    assert numeros == [1, 3, 4, 6]
+    assert _valores(path) == [["Nome", "Valor"], [None, None], [None, 3], [4, None], [None, None], ["fim", None]]
+
+
+def test_sheetdata_vazio(tmp_path):
+    path = _xlsx(tmp_path / "p.xlsx", "<sheetData/>")
+    with pytest.raises(HTTPException):
+        edicao.gravar_celulas(path, {(0, "Nome"): "x"})
+    path = _xlsx(tmp_path / "q.xlsx", "<sheetData/>")
+    aba, _ = edicao._editar_aba(_aba(path), {2: {1: "x"}})
+    assert b'<sheetData><row r="2"><c r="A2" t="inlineStr">' in aba
+
+
+def test_sobrescrever_formula_remove_o_calc_chain(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        f'<sheetData>{_CABECALHO_INLINE}'
+        '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><f>A2*2</f><v>2</v></c></row>'
+        '<row r="3"><c r="A3"><v>5</v></c><c r="B3"><f>A3*2</f><v>10</v></c></row></sheetData>',
+        calc_chain='<c r="B2" i="1"/><c r="B3"/>',
+    )
+    edicao.gravar_celulas(path, {(0, "Valor"): 99})
+
+    with zipfile.ZipFile(path) as z:
+        assert "xl/calcChain.xml" not in z.namelist()
+        assert b"calcChain" not in z.read("[Content_Types].xml")
+        assert b"calcChain" not in z.read("xl/_rels/workbook.xml.rels")
+        assert b'<calcPr fullCalcOnLoad="1" calcId="191029"/>' in z.read("xl/workbook.xml")
+    # A outra fórmula e o valor calculado dela ficam como estavam
+    assert _valores(path) == [["Nome", "Valor"], [1, 99], [5, 10]]
+    assert _valores(path, formulas=True)[2] == [5, "=A3*2"]
+
+
+def test_sem_formula_sobrescrita_o_calc_chain_fica(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        f'<sheetData>{_CABECALHO_INLINE}<row r="2"><c r="A2"><v>1</v></c><c r="B2"><f>A2*2</f><v>2</v></c></row></sheetData>',
+        calc_chain='<c r="B2" i="1"/>',
+    )
+    edicao.gravar_celulas(path, {(0, "Nome"): "x"})
+    with zipfile.ZipFile(path) as z:
+        assert "xl/calcChain.xml" in z.namelist()
+        assert b"fullCalcOnLoad" not in z.read("xl/workbook.xml")
+
+
+def test_recusa_a_celula_mestre_de_formula_compartilhada(tmp_path):
+    path = _xlsx(
+        tmp_path / "p.xlsx",
+        f'<sheetData>{_CABECALHO_INLINE}'
+        '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><f t="shared" ref="B2:B3" si="0">A2*2</f><v>2</v></c></row>'
+        '<row r="3"><c r="A3"><v>5</v></c><c r="B3"><f t="shared" si="0"/><v>10</v></c></row></sheetData>',
+    )
+    original = open(path, "rb").read()
+    with pytest.raises(ValueError, match="B2"):
+        edicao.gravar_celulas(path, {(0, "Valor"): 1})
+    assert open(path, "rb").read() == original
+    assert os.listdir(tmp_path) == ["p.xlsx"]
+
+    # Uma célula que só usa a fórmula compartilhada pode ser sobrescrita
+    edicao.gravar_celulas(path, {(1, "Valor"): 0})
+    assert _valores(path) == [["Nome", "Valor"], [1, 2], [5, 0]]
+
+
+def test_planilha_do_mexico(planilha):
+    from routes import mexico
+
+    path = planilha("DietaCronicaMexico.xlsx")
+    df, extras = mexico._ler_xlsx(path)
+    coluna, ultima = df.columns[0], len(df) - 1
+    # LINHA_CABECALHO é 0-based (enumerate das linhas); gravar_celulas conta a partir de 1
+    edicao.gravar_celulas(path, {(0, coluna): "editado", (ultima, coluna): "última"},
+                          linha_cabecalho=mexico.LINHA_CABECALHO + 1)
+    novo, novos_extras = mexico._ler_xlsx(path)
+    assert (novo[coluna].iloc[0], novo[coluna].iloc[ultima]) == ("editado", "última")
+    assert len(novo) == len(df) and novos_extras == extras
+    assert novo.drop(columns=coluna).equals(df.drop(columns=coluna))
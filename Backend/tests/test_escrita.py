@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+from utils import diario, escrita
+from utils.sob_demanda import modulo
+
+pd = modulo("pandas")
+
+
+@pytest.fixture
+def xlsx(tmp_path, monkeypatch):
+    # Sem janela de group commit e sem compactação por ociosidade durante o teste
+    monkeypatch.setenv("RISKWISE_JANELA_ESCRITA_MS", "0")
+    monkeypatch.setenv("RISKWISE_DIARIO_OCIOSO_S", "3600")
+    path = str(tmp_path / "dados.xlsx")
+    pd.DataFrame({"Nome": ["a", "b", "c"], "Valor": [1.0, 2.0, 3.0]}).to_excel(path, index=False)
+    return path
+
+
+@pytest.fixture
+def gravador(xlsx):
+    g = escrita.GravadorDataset(xlsx, assincrona=False)
+    yield g
+    g.descarregar()
+
+
+def _patch(g, celulas):
+    g.aguardar(g.agendar(celulas=celulas))
+
+
+def _atualizar(g, df):
+    g.aguardar(g.agendar(completa=lambda destino: df.to_excel(destino, index=False)))
+
+
+def _sobras(path):
+    return [n for n in os.listdir(os.path.dirname(path)) if n != os.path.basename(path)]
+
+
+def test_patch_vai_para_o_diario_e_volta_depois_de_reiniciar(xlsx, gravador):
+    original = open(xlsx, "rb").read()
+    _patch(gravador, {(1, "Valor"): 42.0, (2, "Nome"): "z"})
+    assert open(xlsx, "rb").read() == original
+    assert diario.tamanho(xlsx) > 0
+
+    # Outro processo (restart) lê a planilha antiga com o diário por cima
+    codigo = (
+        "import sys, pandas as pd; from utils import escrita; "
+        "print(escrita.com_diario(sys.argv[1], pd.read_excel(sys.argv[1])).to_json(orient='records'))"
+    )
+    saida = subprocess.run([sys.executable, "-c", codigo, xlsx], cwd=BACKEND_DIR,
+                           capture_output=True, text=True, check=True).stdout
+    assert json.loads(saida) == [
+        {"Nome": "a", "Valor": 1.0}, {"Nome": "b", "Valor": 42.0}, {"Nome": "z", "Valor": 3.0},
+    ]
+
+    # O gravador do novo processo compacta o diário no .xlsx
+    assert escrita.GravadorDataset(xlsx, assincrona=False)._compactar()
+    assert diario.tamanho(xlsx) == 0
+    assert pd.read_excel(xlsx).to_dict("records") == [
+        {"Nome": "a", "Valor": 1.0}, {"Nome": "b", "Valor": 42.0}, {"Nome": "z", "Valor": 3.0},
+    ]
+    assert _sobras(xlsx) == []
+
+
+def test_compactacao_perde_para_um_atualizar_no_meio(xlsx, gravador, monkeypatch):
+    _patch(gravador, {(0, "Valor"): 99.0})
+    novo = pd.DataFrame({"Nome": ["x", "y"], "Valor": [10.0, 20.0]})
+
+    gravar_celulas = escrita.gravar_celulas
+
+    def gravar_e_atualizar(path, celulas, linha, destino=None):
+        gravar_celulas(path, celulas, linha, destino=destino)
+        # /atualizar chega enquanto a compactação monta o .xlsx temporário
+        _atualizar(gravador, novo)
+
+    monkeypatch.setattr(escrita, "gravar_celulas", gravar_e_atualizar)
+    assert gravador._compactar() is False
+
+    assert pd.read_excel(xlsx).to_dict("records") == novo.to_dict("records")
+    assert diario.tamanho(xlsx) == 0
+    assert gravador.compactacoes == 0
+    assert _sobras(xlsx) == []
+
+
+def test_patch_durante_a_compactacao_fica_no_diario(xlsx, gravador, monkeypatch):
+    _patch(gravador, {(0, "Valor"): 99.0})
+
+    gravar_celulas = escrita.gravar_celulas
+
+    def gravar_e_editar(path, celulas, linha, destino=None):
+        gravar_celulas(path, celulas, linha, destino=destino)
+        _patch(gravador, {(2, "Valor"): 7.0})
+
+    monkeypatch.setattr(escrita, "gravar_celulas", gravar_e_editar)
+    assert gravador._compactar() is True
+
+    assert pd.read_excel(xlsx)["Valor"].tolist() == [99.0, 2.0, 3.0]
+    celulas, _, _ = diario.ler(xlsx)
+    assert celulas == {(2, "Valor"): 7.0}
@@ -0,0 +1,263 @@
+# utils/cache_pdf.py
+"""
+Cache endereçado por conteúdo dos PDFs gerados.
+
+A chave é o sha256 do JSON canônico (chaves ordenadas, sem espaços) dos
+argumentos já normalizados/filtrados passados ao gerador, mais o nome do
+gerador. Exportar de novo o mesmo relatório devolve os bytes guardados.
+
+- Memória: LRU limitado por tamanho (RISKWISE_PDF_CACHE_MB, padrão 64;
+  0 desliga) e idade (RISKWISE_PDF_CACHE_TTL em segundos, padrão 600).
+  O PDF traz "Gerado em: <data hora>", então o TTL também limita quão
+  antigo pode ser o horário impresso num PDF servido do cache.
+- Disco (opcional): RISKWISE_PDF_CACHE_DIR liga uma segunda camada, com o
+  mesmo TTL e limite RISKWISE_PDF_CACHE_DISCO_MB (padrão 256).
+- PDFs acima do limiar do spool (utils/spool_pdf.py) chegam como arquivo e
+  não entram na memória: são copiados para a camada de disco, e um hit em
+  disco desse tamanho é servido direto do arquivo.
+- Requisições idênticas simultâneas esperam a mesma renderização
+  (single-flight) em vez de gerar o PDF várias vezes. A renderização roda
+  numa tarefa própria: o cliente que desconecta só cancela a sua espera, e
+  ela só é cancelada quando ninguém mais espera por ela.
+- Leitura, cópia e poda da camada de disco rodam no threadpool, fora do
+  event loop.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from utils import perfil
+from utils.serializacao import orjson
+from utils.spool_pdf import PDFEmDisco, Resultado, limiar_spool
+
+VERSAO_CHAVE = 1
+
+
+def _inteiro_env(nome: str, padrao: int) -> int:
+    try:
+        return max(0, int(os.environ.get(nome, padrao)))
+    except ValueError:
+        return padrao
+
+
+def chave_de(gerador: str, argumentos: Dict[str, Any]) -> str:
+    """sha256 do JSON canônico de (versão, gerador, argumentos)."""
+    conteudo = [VERSAO_CHAVE, gerador, argumentos]
+    if orjson is not None:
+        # ~10x mais rápido que o json da stdlib em payloads de milhares de linhas
+        canonico = orjson.dumps(conteudo, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    else:
+        canonico = json.dumps(
+            conteudo,
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        ).encode("utf-8")
+    return hashlib.sha256(canonico).hexdigest()
+
+
+class CachePDF:
+    def __init__(self):
+        self.limite_bytes = _inteiro_env("RISKWISE_PDF_CACHE_MB", 64) * 1024 * 1024
+        self.ttl = _inteiro_env("RISKWISE_PDF_CACHE_TTL", 600)
+        self.diretorio = os.environ.get("RISKWISE_PDF_CACHE_DIR") or None
+        self.limite_disco = _inteiro_env("RISKWISE_PDF_CACHE_DISCO_MB", 256) * 1024 * 1024
+        self._itens: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        # Só acessado do event loop (handlers async): dispensa lock
+        self._em_voo: Dict[str, asyncio.Task] = {}
+        self._esperando: Dict[str, int] = {}
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.agrupados = 0
+
+    # ---------------- memória ----------------
+
+    def _expirado(self, criado_em: float) -> bool:
+        return self.ttl > 0 and time.time() - criado_em > self.ttl
+
+    def _ler_memoria(self, chave: str) -> Optional[bytes]:
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        dados, criado_em = item
+        if self._expirado(criado_em):
+            self._remover(chave)
+            return None
+        self._itens.move_to_end(chave)
+        return dados
+
+    def _remover(self, chave: str):
+        dados, _ = self._itens.pop(chave)
+        self._bytes -= len(dados)
+
+    def _guardar_memoria(self, chave: str, dados: bytes, criado_em: float):
+        if len(dados) > self.limite_bytes:
+            return
+        if chave in self._itens:
+            self._remover(chave)
+        self._itens[chave] = (dados, criado_em)
+        self._bytes += len(dados)
+        while self._bytes > self.limite_bytes:
+            self._remover(next(iter(self._itens)))
+
+    # ---------------- disco ----------------
+
+    def _arquivo(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f"{chave}.pdf")
+
+    def _ler_disco(self, chave: str) -> Optional[Tuple[Resultado, float]]:
+        if not self.diretorio:
+            return None
+        caminho = self._arquivo(chave)
+        try:
+            st = os.stat(caminho)
+            if self._expirado(st.st_mtime):
+                os.remove(caminho)
+                return None
+            if st.st_size > limiar_spool():
+                return PDFEmDisco(caminho, temporario=False), st.st_mtime
+            with open(caminho, "rb") as f:
+                return f.read(), st.st_mtime
+        except OSError:
+            return None
+
+    def _guardar_disco(self, chave: str, resultado: Resultado):
+        if not self.diretorio:
+            return
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            tmp = os.path.join(self.diretorio, f".{chave}.{uuid.uuid4().hex[:8]}.tmp")
+            if isinstance(resultado, PDFEmDisco):
+                shutil.copyfile(resultado.caminho, tmp)
+            else:
+                with open(tmp, "wb") as f:
+                    f.write(resultado)
+            os.replace(tmp, self._arquivo(chave))
+            self._podar_disco()
+        except OSError:
+            # Camada de disco é só otimização
+            pass
+
+    def _podar_disco(self):
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".pdf"):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                st = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+        arquivos.sort()
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for mtime, tamanho, caminho in arquivos:
+            if total <= self.limite_disco and not self._expirado(mtime):
+                continue
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except OSError:
+                pass
+
+    # ---------------- API ----------------
+
+    async def obter(self, chave: str) -> Optional[Resultado]:
+        dados = self._ler_memoria(chave)
+        if dados is not None:
+            self.hits += 1
+            return dados
+        if not self.diretorio:
+            return None
+        lido = await run_in_threadpool(self._ler_disco, chave)
+        if lido is not None:
+            self.hits_disco += 1
+            resultado, criado_em = lido
+            if not isinstance(resultado, PDFEmDisco):
+                self._guardar_memoria(chave, resultado, criado_em)
+            return resultado
+        return None
+
+    async def guardar(self, chave: str, resultado: Resultado):
+        if not isinstance(resultado, PDFEmDisco):
+            self._guardar_memoria(chave, resultado, time.time())
+        if self.diretorio:
+            await run_in_threadpool(self._guardar_disco, chave, resultado)
+
+    async def _gerar_e_guardar(self, chave: str, gerar: Callable[[], Awaitable[Resultado]]) -> Resultado:
+        dados = await gerar()
+        await self.guardar(chave, dados)
+        return dados
+
+    def _fim_do_voo(self, chave: str, tarefa: asyncio.Task):
+        if self._em_voo.get(chave) is tarefa:
+            del self._em_voo[chave]
+            self._esperando.pop(chave, None)
+        if not tarefa.cancelled():
+            tarefa.exception()  # evita aviso de exceção não lida se ninguém esperava
+
+    async def obter_ou_gerar(self, chave: str, gerar: Callable[[], Awaitable[Resultado]]) -> Tuple[Resultado, str]:
+        """
+        Devolve (PDF, origem) com origem "HIT", "MERGED" (esperou uma
+        renderização idêntica em andamento), "MISS" (renderizou agora) ou
+        "PROFILE" (requisição perfilada: sempre renderiza, ver utils/perfil.py).
+        O PDF são bytes ou um PDFEmDisco (ver utils/spool_pdf.py).
+        """
+        if perfil.ativo():
+            return await gerar(), "PROFILE"
+
+        dados = await self.obter(chave)
+        if dados is not None:
+            return dados, "HIT"
+
+        tarefa = self._em_voo.get(chave)
+        if tarefa is not None:
+            self.agrupados += 1
+            origem = "MERGED"
+        else:
+            self.misses += 1
+            origem = "MISS"
+            tarefa = asyncio.ensure_future(self._gerar_e_guardar(chave, gerar))
+            tarefa.add_done_callback(lambda t: self._fim_do_voo(chave, t))
+            self._em_voo[chave] = tarefa
+            self._esperando[chave] = 0
+
+        # shield: o cancelamento desta requisição não chega à tarefa, que
+        # continua para as outras; sem ninguém esperando, ela é cancelada
+        self._esperando[chave] += 1
+        try:
+            return await asyncio.shield(tarefa), origem
+        except asyncio.CancelledError:
+            if self._em_voo.get(chave) is tarefa:
+                self._esperando[chave] -= 1
+                if self._esperando[chave] == 0:
+                    tarefa.cancel()
+            raise
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "itens": len(self._itens),
+            "bytes": self._bytes,
+            "limite_bytes": self.limite_bytes,
+            "ttl_s": self.ttl,
+            "disco": self.diretorio,
+            "hits": self.hits,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "agrupados": self.agrupados,
+        }
+
+
+# Instância única compartilhada pelas rotas de PDF
+cache_pdf = CachePDF()
@@ -0,0 +1,291 @@
+# utils/calculos.py
+"""
+Motores vetorizados (NumPy) das calculadoras. Replicam as fórmulas que rodam
+no front (javascript/Botoes.js/*.js), mas para a tabela inteira de uma vez.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+
+# --------- utilidades ----------
+def numeros(valores, virgula_decimal: bool = True) -> np.ndarray:
+    """
+    Converte uma coluna para float64 como o parseNum do front: strings com
+    vírgula decimal, "-", "NA", vazio e não finitos viram NaN.
+    """
+    serie = pd.Series(valores, copy=False)
+    if serie.dtype.kind in "biuf":
+        arr = serie.to_numpy(dtype=float, copy=True)
+    else:
+        texto = serie.astype("string").str.strip()
+        if virgula_decimal:
+            texto = texto.str.replace(",", ".", n=1, regex=False)
+        arr = pd.to_numeric(texto, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    arr[~np.isfinite(arr)] = np.nan
+    return arr
+
+
+def numero(valor, virgula_decimal: bool = True) -> float:
+    return float(numeros([valor], virgula_decimal)[0])
+
+
+def _positivo(x: np.ndarray) -> np.ndarray:
+    return np.isfinite(x) & (x > 0)
+
+
+def para_json(arr: np.ndarray) -> list:
+    """Lista pronta para JSON: NaN/inf viram None."""
+    arr = np.asarray(arr, dtype=float)
+    return np.where(np.isfinite(arr), arr, None).tolist()
+
+
+def aplicar_overrides(
+    entradas: Dict[str, np.ndarray],
+    overrides: Optional[Dict[Any, Dict[str, Any]]],
+    virgula_decimal: bool = True,
+) -> Dict[str, np.ndarray]:
+    """
+    Aplica valores por linha sobre as colunas já convertidas.
+    overrides = {"<índice da linha>": {"<coluna>": valor, ...}, ...}
+    Só as colunas tocadas são copiadas; as demais continuam compartilhadas
+    com o cache. Levanta ValueError para linha/coluna inválida.
+    """
+    if not overrides:
+        return entradas
+    if not isinstance(overrides, dict):
+        raise ValueError("'overrides' deve ser um objeto {linha: {coluna: valor}}")
+
+    n = len(next(iter(entradas.values())))
+    saida = dict(entradas)
+    copiadas = set()
+    for chave, valores in overrides.items():
+        try:
+            linha = int(chave)
+        except (TypeError, ValueError):
+            raise ValueError(f"Linha inválida: {chave!r}")
+        if not 0 <= linha < n:
+            raise ValueError(f"Linha fora do intervalo: {linha}")
+        for coluna, valor in (valores or {}).items():
+            if coluna not in saida:
+                raise ValueError(f"Coluna não pode ser sobrescrita: {coluna!r}")
+            if coluna not in copiadas:
+                saida[coluna] = saida[coluna].copy()
+                copiadas.add(coluna)
+            if saida[coluna].dtype == object:
+                saida[coluna][linha] = str(valor).strip() if valor is not None else ""
+            else:
+                saida[coluna][linha] = numero(valor, virgula_decimal)
+    return saida
+
+
+# --------- Acute (IMEA / %DRFA) ----------
+ACUTE_CASO = "Caso Fórmula"
+ACUTE_NUMERICAS = [
+    "LMR (mg/kg)", "HR/MCR (mg/kg)", "MREC/STMR (mg/kg)",
+    "Maior porção MP (g/dia/pessoa)",
+    "Peso Corpóreo médio dos consumidores PC (kg)",
+    "Fator de Processamento FP", "Fator de Conversão FC",
+    "Peso Unitário da Parte Comestível Uc (g)",
+    "Fator de variabilidade v",
+]
+
+
+def preparar_acute(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Converte uma vez as colunas de entrada do IMEA (cacheável por versão do dataset)."""
+    entradas = {c: numeros(df[c]) for c in ACUTE_NUMERICAS}
+    entradas[ACUTE_CASO] = df[ACUTE_CASO].astype("string").str.strip().fillna("").to_numpy(dtype=object)
+    return entradas
+
+
+def calcular_imea(entradas: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    IMEA por linha, mesmas regras de calcularIMEA (acute_crop.js):
+      - Casos 1/2a/2b: LMR se > 0, senão HR/MCR
+      - Caso 3:        LMR se > 0, senão MREC/STMR
+    Linhas sem MP/PC/FP/FC, com resíduo inválido ou caso desconhecido ficam NaN.
+    """
+    caso = entradas[ACUTE_CASO]
+    lmr = entradas["LMR (mg/kg)"]
+    hr = entradas["HR/MCR (mg/kg)"]
+    stmr = entradas["MREC/STMR (mg/kg)"]
+    mp = entradas["Maior porção MP (g/dia/pessoa)"]
+    pc = entradas["Peso Corpóreo médio dos consumidores PC (kg)"]
+    fp = entradas["Fator de Processamento FP"]
+    fc = entradas["Fator de Conversão FC"]
+    uc = entradas["Peso Unitário da Parte Comestível Uc (g)"]
+    v = entradas["Fator de variabilidade v"]
+
+    mp_kg = mp / 1000
+    uc_kg = uc / 1000
+    base_c12 = np.where(_positivo(lmr), lmr, hr)
+    base_c3 = np.where(_positivo(lmr), lmr, stmr)
+
+    completos = ~(np.isnan(mp) | np.isnan(pc) | np.isnan(fp) | np.isnan(fc))
+    imea = np.full(len(caso), np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = completos & (caso == "Caso 1") & _positivo(base_c12)
+        imea[m] = (mp_kg * base_c12 * fp * fc / pc)[m]
+
+        m = completos & (caso == "Caso 2a") & _positivo(base_c12) & ~np.isnan(v) & ~np.isnan(uc_kg)
+        parte_uc = uc_kg * base_c12 * fc * fp * v
+        resto = (mp_kg - uc_kg) * base_c12 * fc * fp
+        imea[m] = ((parte_uc + resto) / pc)[m]
+
+        m = completos & (caso == "Caso 2b") & _positivo(base_c12) & ~np.isnan(v)
+        imea[m] = (mp_kg * base_c12 * fp * fc * v / pc)[m]
+
+        m = completos & (caso == "Caso 3") & _positivo(base_c3)
+        imea[m] = (mp_kg * base_c3 * fp * fc / pc)[m]
+
+    return imea
+
+
+def calcular_drfa(imea: np.ndarray, referencia) -> np.ndarray:
+    """%DRFA = IMEA * 100 / DRFA de referência (NaN se a referência for vazia ou zero)."""
+    ref = numero(referencia)
+    if np.isnan(ref) or ref == 0:
+        return np.full(len(imea), np.nan)
+    return imea * 100 / ref
+
+
+# --------- Chronic (IDMT / POF) ----------
+CHRONIC_NUMERICAS = [
+    "ANO_POF", "LMR (mg_kg)", "MREC_STMR (mg_kg)", "Market Share",
+    "Consumo diário per capita (g_dia_pessoa) C",
+    "Fator de Processamento FP", "Fator de Conversão FC", "PC (kg)",
+]
+CHRONIC_REGIAO = "Região"
+
+
+def preparar_chronic(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Converte uma vez as colunas de entrada do IDMT (toNumberSafe do front não aceita vírgula)."""
+    entradas = {c: numeros(df[c], virgula_decimal=False) for c in CHRONIC_NUMERICAS}
+    entradas[CHRONIC_REGIAO] = df[CHRONIC_REGIAO].to_numpy(dtype=object)
+    return entradas
+
+
+def calcular_idmt(entradas: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    IDMT por linha, como calcularIDMT (chronic_crop.js):
+    (LMR se > 0, senão MREC/STMR se > 0) * C/1000 * FP * FC / PC.
+    """
+    consumo = entradas["Consumo diário per capita (g_dia_pessoa) C"] / 1000
+    fp = entradas["Fator de Processamento FP"]
+    fc = entradas["Fator de Conversão FC"]
+    lmr = entradas["LMR (mg_kg)"]
+    mrec = entradas["MREC_STMR (mg_kg)"]
+    pc = entradas["PC (kg)"]
+
+    limite = np.where(_positivo(lmr), lmr, np.where(_positivo(mrec), mrec, np.nan))
+    validos = ~(np.isnan(consumo) | np.isnan(fp) | np.isnan(fc) | np.isnan(limite)) & _positivo(pc)
+
+    idmt = np.full(len(pc), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        idmt[validos] = (limite * consumo * fp * fc / pc)[validos]
+    return idmt
+
+
+def calcular_contribuicao(idmt: np.ndarray, entradas: Dict[str, np.ndarray]) -> np.ndarray:
+    """Contribuição individual = IDMT / PC * Market Share (share vazio ou 0 conta como 1)."""
+    pc = entradas["PC (kg)"]
+    share = entradas["Market Share"]
+    share = np.where(np.isnan(share) | (share == 0), 1.0, share)
+    com_pc = ~np.isnan(pc) & (pc != 0)
+
+    contrib = np.zeros(len(pc))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        contrib[com_pc] = (np.nan_to_num(idmt) / pc * share)[com_pc]
+    return contrib
+
+
+def _percentual_ida(total: float, referencia) -> Optional[float]:
+    ref = numero(referencia, virgula_decimal=False)
+    if np.isnan(ref) or ref == 0:
+        return None
+    return total * 100 / ref
+
+
+def agregar_pof(
+    entradas: Dict[str, np.ndarray],
+    idmt: Optional[np.ndarray] = None,
+    ida_anvisa=None,
+    ida_syngenta=None,
+    anos=(2008, 2017),
+) -> Dict[int, Dict[str, Dict[str, Any]]]:
+    """
+    Matrizes POF por ano em um único groupby ANO_POF × Região:
+      PC_Kg          -> último PC (kg) preenchido da região (arredondado a 4 casas)
+      %IDA_ANVISA    -> soma do IDMT da região * 100 / IDA externa
+      %IDA_SYNGENTA  -> soma do IDMT da região * 100 / IDA interna
+    Sem `idmt` (ou sem IDA) os percentuais ficam None, como no GET /dados.
+    """
+    regiao = entradas[CHRONIC_REGIAO]
+    tabela = pd.DataFrame({
+        "ano": entradas["ANO_POF"],
+        "regiao": regiao,
+        "pc": entradas["PC (kg)"],
+        "idmt": np.nan_to_num(idmt) if idmt is not None else 0.0,
+    })
+    tabela = tabela[pd.notna(regiao) & (regiao != "")]
+    grupos = tabela.groupby(["ano", "regiao"], sort=False).agg(pc=("pc", "last"), idmt=("idmt", "sum"))
+
+    pof = {ano: {"PC_Kg": {}, "%IDA_ANVISA": {}, "%IDA_SYNGENTA": {}} for ano in anos}
+    for (ano, reg), linha in grupos.iterrows():
+        if ano not in pof or np.isnan(linha["pc"]):
+            continue
+        pof[ano]["PC_Kg"][reg] = round(float(linha["pc"]), 4)
+        pof[ano]["%IDA_ANVISA"][reg] = _percentual_ida(linha["idmt"], ida_anvisa) if idmt is not None else None
+        pof[ano]["%IDA_SYNGENTA"][reg] = _percentual_ida(linha["idmt"], ida_syngenta) if idmt is not None else None
+    return pof
+
+
+# --------- México ((LMR or R)*C / IDMT / %ADI) ----------
+def _normalizar_mexico(valor) -> Any:
+    """normalizeFromServer (mexico.js): aceita vírgula decimal e separador de milhar."""
+    if valor is None or isinstance(valor, (int, float)):
+        return valor
+    s = str(valor).strip()
+    tem_virgula, tem_ponto = "," in s, "." in s
+    if tem_virgula and tem_ponto:
+        decimal = "," if s.rfind(",") > s.rfind(".") else "."
+        milhar = "." if decimal == "," else ","
+        s = s.replace(milhar, "").replace(decimal, ".", 1)
+    elif tem_virgula:
+        s = s.replace(".", "").replace(",", ".")
+    elif s.count(".") > 1:
+        partes = s.split(".")
+        s = "".join(partes[:-1]) + "." + partes[-1]
+    return s
+
+
+def _numeros_mexico(serie: pd.Series) -> np.ndarray:
+    if serie.dtype.kind not in "biuf":
+        serie = serie.map(_normalizar_mexico, na_action="ignore")
+    return numeros(serie, virgula_decimal=False)
+
+
+def calcular_lc_mexico(df: pd.DataFrame) -> np.ndarray:
+    """(LMR or R)*C por linha: R se > 0, senão LMR se > 0 (calcRowAndPaint em mexico.js)."""
+    lmr = _numeros_mexico(df["LMR (mg/kg)"])
+    r = _numeros_mexico(df["R (mg/kg)"])
+    c = _numeros_mexico(df["C (Kg/person/day)"])
+    limite = np.where(_positivo(r), r, np.where(_positivo(lmr), lmr, np.nan))
+    return limite * c
+
+
+def totais_mexico(df: pd.DataFrame, bw, adi) -> Dict[str, Optional[float]]:
+    """Soma de (LMR or R)*C, IDMT = soma / bw e %ADI = IDMT / ADI * 100 (calcularTudo em mexico.js)."""
+    soma = float(np.nansum(calcular_lc_mexico(df)))
+    bw = numero(bw, virgula_decimal=False)
+    adi = numero(adi, virgula_decimal=False)
+
+    idmt = soma / bw if bw > 0 else None
+    percentual = idmt / adi * 100 if (idmt is not None and adi > 0) else None
+    return {"sumLC": soma, "idmt": idmt, "%ADI_interno": percentual}
@@ -0,0 +1,200 @@
+# utils/compressao.py
+"""
+Compressão das respostas (gzip ou brotli, conforme o Accept-Encoding).
+
+- Leituras completas de dataset (/dados sem filtros): o corpo comprimido é
+  um derivado da entrada do dataset_cache, calculado uma vez por versão e
+  por codificação, num nível alto; as requisições seguintes só copiam os
+  bytes. A resposta já sai com Content-Encoding e o middleware a ignora.
+- Demais respostas: CompressaoMiddleware comprime na hora (nível médio),
+  inclusive em streaming (NDJSON, CSV), com flush a cada bloco. PDFs,
+  planilhas, ZIPs e imagens já são comprimidos e passam direto. Como em
+  http_cache.resposta_dataset, a ETag forte de uma resposta comprimida aqui
+  ganha o sufixo da codificação ("<etag>-br"): a representação é outra.
+
+brotli é opcional: sem o pacote, só gzip.
+"""
+import gzip
+from typing import Optional, Set, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import (
+    DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware, GZipResponder, IdentityResponder,
+)
+
+try:
+    import brotli
+except ImportError:  # dependência opcional
+    brotli = None
+
+# Ordem de preferência quando o cliente aceita mais de uma
+CODIFICACOES = ("br", "gzip") if brotli is not None else ("gzip",)
+
+NIVEL_GZIP_CACHE = 9
+# brotli 11 leva segundos num /dados de ~800 KB; 9 fica na casa de dezenas de ms
+QUALIDADE_BROTLI_CACHE = 9
+NIVEL_GZIP_DINAMICO = 6
+QUALIDADE_BROTLI_DINAMICO = 5
+TAMANHO_MINIMO = 1024
+
+TIPOS_JA_COMPRIMIDOS = DEFAULT_EXCLUDED_CONTENT_TYPES + (
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+)
+
+
+def aceitas(accept_encoding: str) -> Set[str]:
+    """Codificações do Accept-Encoding com q > 0."""
+    resultado = set()
+    for parte in accept_encoding.split(","):
+        nome, _, params = parte.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            chave, _, valor = param.strip().partition("=")
+            if chave.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nome and q > 0:
+            resultado.add(nome.strip().lower())
+    return resultado
+
+
+def escolher(accept_encoding: str) -> Optional[str]:
+    """Melhor codificação suportada que o cliente aceita (None = sem compressão)."""
+    pedidas = aceitas(accept_encoding)
+    for codificacao in CODIFICACOES:
+        if codificacao in pedidas:
+            return codificacao
+    return None
+
+
+def comprimir(corpo: bytes, codificacao: str) -> bytes:
+    """Compressão forte, para corpos que ficam em cache."""
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=QUALIDADE_BROTLI_CACHE)
+    return gzip.compress(corpo, compresslevel=NIVEL_GZIP_CACHE, mtime=0)
+
+
+class _BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, qualidade: int, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.qualidade = qualidade
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.qualidade)
+        dados = self._compressor.process(body)
+        return dados + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+def _vary_sem_repeticao(send):
+    """
+    Os responders do Starlette acrescentam "Accept-Encoding" ao Vary sem olhar
+    o que já existe; respostas que já o trazem (http_cache, estáticos do dist)
+    sairiam com o valor repetido.
+    """
+    async def enviar(message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            if "vary" in headers:
+                valores = []
+                for valor in headers["vary"].split(","):
+                    valor = valor.strip()
+                    if valor and valor.lower() not in (v.lower() for v in valores):
+                        valores.append(valor)
+                headers["Vary"] = ", ".join(valores)
+        await send(message)
+
+    return enviar
+
+
+def etag_codificada(etag: str, codificacao: str) -> str:
+    """ETag da representação comprimida com `codificacao` ('"abc"' -> '"abc-br"')."""
+    return f'{etag[:-1]}-{codificacao}"' if etag.endswith('"') else etag
+
+
+def _candidatos(if_none_match: str) -> Set[str]:
+    return {c.strip()[2:] if c.strip().startswith("W/") else c.strip() for c in if_none_match.split(",") if c.strip()}
+
+
+def _if_none_match_sem_sufixo(scope, codificacao: str) -> Tuple[dict, Set[str]]:
+    """
+    A rota compara If-None-Match com a ETag da representação sem compressão:
+    junto de cada '"abc-br"' pedido vai também '"abc"'. Retorna (scope, ETags
+    pedidas originalmente).
+    """
+    if_none_match = Headers(scope=scope).get("if-none-match")
+    if not if_none_match:
+        return scope, set()
+    pedidas = _candidatos(if_none_match)
+    sufixo = f'-{codificacao}"'
+    extras = [c[: -len(sufixo)] + '"' for c in pedidas if c.endswith(sufixo)]
+    if not extras:
+        return scope, pedidas
+    headers = [(k, v) for k, v in scope["headers"] if k != b"if-none-match"]
+    headers.append((b"if-none-match", ", ".join([if_none_match, *extras]).encode("latin-1")))
+    return {**scope, "headers": headers}, pedidas
+
+
+def _etag_por_codificacao(send, responder: IdentityResponder, codificacao: str, pedidas: Set[str]):
+    """
+    Sufixa a ETag das respostas que o `responder` comprimiu (e dos 304 de uma
+    ETag pedida já com o sufixo). Respostas que a própria rota comprimiu
+    (datasets em cache, estáticos pré-comprimidos) já trazem a ETag certa.
+    """
+    async def enviar(message):
+        if message["type"] == "http.response.start" and not responder.content_encoding_set:
+            headers = MutableHeaders(raw=message["headers"])
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                codificada = etag_codificada(etag, codificacao)
+                if "content-encoding" in headers or (message["status"] == 304 and codificada in pedidas):
+                    headers["ETag"] = codificada
+        await send(message)
+
+    return enviar
+
+
+class CompressaoMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware do Starlette com brotli (se instalado), Accept-Encoding
+    com q-values e exclusão dos tipos que já chegam comprimidos. Respostas
+    com Content-Encoding (datasets em cache, estáticos pré-comprimidos)
+    passam sem alteração.
+    """
+
+    def __init__(self, app, minimum_size: int = TAMANHO_MINIMO, compresslevel: int = NIVEL_GZIP_DINAMICO):
+        super().__init__(
+            app, minimum_size=minimum_size, compresslevel=compresslevel,
+            exclude_content_types=TIPOS_JA_COMPRIMIDOS,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        send = _vary_sem_repeticao(send)
+        codificacao = escolher(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacao is None:
+            await IdentityResponder(
+                self.app, self.minimum_size, exclude_content_types=self.exclude_content_types,
+            )(scope, receive, send)
+            return
+        if codificacao == "br":
+            responder = _BrotliResponder(
+                self.app, self.minimum_size, QUALIDADE_BROTLI_DINAMICO,
+                exclude_content_types=self.exclude_content_types,
+            )
+        else:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel,
+                thread_minimum_size=self.thread_minimum_size,
+                exclude_content_types=self.exclude_content_types,
+            )
+        scope, pedidas = _if_none_match_sem_sufixo(scope, codificacao)
+        await responder(scope, receive, _etag_por_codificacao(send, responder, codificacao, pedidas))
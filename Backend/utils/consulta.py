@@ -0,0 +1,151 @@
+# utils/consulta.py
+"""
+Filtros, projeção de colunas (fields=) e paginação por cursor dos endpoints /dados.
+
+Os índices (valor -> posições das linhas) são montados uma vez por versão
+do dataset e guardados na própria entrada do dataset_cache; um filtro vira
+algumas interseções de arrays de posições, sem varrer a tabela.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+LIMITE_MAXIMO = 5000
+
+
+def normalizar_chave(valor) -> str:
+    # 2017 e 2017.0 (ANO POF lido como float) caem na mesma chave
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _construir_indices(df: pd.DataFrame, colunas: List[str]) -> Dict[str, Dict[str, np.ndarray]]:
+    indices = {}
+    for coluna in colunas:
+        posicoes: Dict[str, list] = {}
+        for pos, valor in enumerate(df[coluna].tolist()):
+            if valor is None:
+                continue
+            posicoes.setdefault(normalizar_chave(valor), []).append(pos)
+        indices[coluna] = {k: np.asarray(v, dtype=np.int64) for k, v in posicoes.items()}
+    return indices
+
+
+def sem_parametros(filtros: Dict[str, Optional[List[str]]], *outros) -> bool:
+    return not any(filtros.values()) and all(o is None for o in outros)
+
+
+def selecionar(entrada, filtros: Dict[str, Optional[List[str]]]) -> np.ndarray:
+    """
+    Posições das linhas que atendem aos filtros {coluna: [valores]}:
+    OU entre valores da mesma coluna, E entre colunas.
+    """
+    ativos = {c: v for c, v in filtros.items() if v}
+    if not ativos:
+        return np.arange(len(entrada.df), dtype=np.int64)
+
+    colunas = sorted(filtros)
+    indices = entrada.derivado(
+        "indices:" + "|".join(colunas),
+        lambda e: _construir_indices(e.df, colunas),
+    )
+
+    vazio = np.empty(0, dtype=np.int64)
+    resultado = None
+    for coluna, valores in ativos.items():
+        partes = [indices[coluna].get(normalizar_chave(v), vazio) for v in valores]
+        posicoes = partes[0] if len(partes) == 1 else np.unique(np.concatenate(partes))
+        resultado = posicoes if resultado is None else np.intersect1d(resultado, posicoes, assume_unique=True)
+        if len(resultado) == 0:
+            break
+    return resultado
+
+
+def _separar_campos(valor: str, colunas: List[str]) -> List[str]:
+    # Há colunas com vírgula no nome ("... Percentil 97,5"): junta pedaços
+    # até formar um nome conhecido
+    campos, atual = [], None
+    for pedaco in valor.split(","):
+        atual = pedaco if atual is None else f"{atual},{pedaco}"
+        if atual.strip() in colunas:
+            campos.append(atual.strip())
+            atual = None
+    if atual is not None and atual.strip():
+        raise HTTPException(status_code=400, detail=f"Campo desconhecido em fields: {atual.strip()!r}")
+    return campos
+
+
+def projetar(colunas: List[str], fields: Optional[List[str]]) -> List[str]:
+    if not fields:
+        return list(colunas)
+    pedidas: List[str] = []
+    for valor in fields:
+        for campo in _separar_campos(valor, colunas):
+            if campo not in pedidas:
+                pedidas.append(campo)
+    return pedidas or list(colunas)
+
+
+def _assinatura_filtros(filtros, colunas) -> str:
+    canonico = json.dumps([sorted((c, sorted(v)) for c, v in filtros.items() if v), colunas], ensure_ascii=False)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:8]
+
+
+def _codificar_cursor(token: str, filtro: str, offset: int) -> str:
+    bruto = json.dumps({"v": token, "f": filtro, "o": offset}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def _decodificar_cursor(cursor: str, token: str, filtro: str) -> int:
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(dados["o"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    if dados.get("v") != token:
+        raise HTTPException(status_code=409, detail="O dataset mudou desde o cursor; recomece a paginação.")
+    if dados.get("f") != filtro or offset < 0:
+        raise HTTPException(status_code=400, detail="Cursor não corresponde aos filtros/campos da consulta.")
+    return offset
+
+
+def executar(
+    entrada,
+    filtros: Dict[str, Optional[List[str]]],
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Aplica filtros, projeção e paginação sobre a entrada do cache.
+    Retorna (DataFrame da página, info de paginação).
+    """
+    df = entrada.df
+    colunas = projetar(list(df.columns), fields)
+    posicoes = selecionar(entrada, filtros)
+
+    filtro = _assinatura_filtros(filtros, colunas)
+    inicio = _decodificar_cursor(cursor, entrada.token, filtro) if cursor else 0
+    fim = len(posicoes) if limit is None else min(inicio + limit, len(posicoes))
+    proximo = _codificar_cursor(entrada.token, filtro, fim) if fim < len(posicoes) else None
+
+    # Sem filtros a página é uma fatia contígua: evita copiar a tabela inteira
+    pagina = df.iloc[inicio:fim] if len(posicoes) == len(df) else df.iloc[posicoes[inicio:fim]]
+    if colunas != list(df.columns):
+        pagina = pagina[colunas]
+    return pagina, {
+        "total_filtrado": int(len(posicoes)),
+        "inicio": inicio,
+        "proximo_cursor": proximo,
+    }
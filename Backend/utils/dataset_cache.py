@@ -0,0 +1,236 @@
+# utils/dataset_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils import diario, metricas
+from utils.sob_demanda import modulo
+
+pd = modulo("pandas")
+
+
+def _assinatura(path: str) -> Optional[Tuple]:
+    """
+    (mtime_ns, tamanho) do arquivo e a assinatura do diário de edições ao
+    lado dele (utils/diario.py), ou None se o arquivo não existir.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, diario.assinatura(path))
+
+
+# Tipos de pandas.api.types.infer_dtype tratados como coluna numérica
+_INFERIDOS_NUMERICOS = {"integer", "floating", "mixed-integer-float", "decimal", "empty"}
+
+
+def _forma_canonica(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` com cada coluna numa forma que não depende de como foi carregada
+    (.xlsx, snapshot com mmap ou JSON do /atualizar, que trazem dtypes
+    diferentes para o mesmo conteúdo): números viram float64 e o resto
+    object com None nos vazios.
+    """
+    colunas = {}
+    for i, nome in enumerate(df.columns):
+        serie = df.iloc[:, i]
+        if serie.dtype.kind in "biuf" or pd.api.types.infer_dtype(serie, skipna=True) in _INFERIDOS_NUMERICOS:
+            colunas[i] = pd.to_numeric(serie, errors="coerce").astype("float64")
+        else:
+            serie = serie.astype(object)
+            colunas[i] = serie.where(serie.notna(), None)
+    return pd.DataFrame(colunas, index=df.index)
+
+
+# Assinatura de uma entrada publicada em memória com gravação ainda pendente
+# (utils/escrita.py): vale mais que o arquivo até o gravador confirmar
+EM_MEMORIA = object()
+
+
+def _valida(entrada: Optional["DatasetEntry"], assinatura) -> bool:
+    return entrada is not None and (entrada.assinatura is EM_MEMORIA or entrada.assinatura == assinatura)
+
+
+class DatasetEntry:
+    """
+    Uma versão carregada de uma planilha: DataFrame já validado/limpo,
+    metadados extras (ex.: bloco de metadados do México) e artefatos
+    derivados (corpo JSON serializado, etc.), calculados uma vez por versão.
+    """
+
+    def __init__(self, path: str, assinatura, versao: int, df: pd.DataFrame, extras: Optional[Dict] = None):
+        self.path = path
+        self.assinatura = assinatura
+        self.versao = versao
+        self.df = df
+        self.extras = extras or {}
+        self.carregado_em = time.time()
+        self._derivados: Dict[str, Any] = {}
+        # Reentrante: um derivado pode depender de outro (ex.: etag -> resposta)
+        self._lock = threading.RLock()
+
+    @property
+    def token(self) -> str:
+        """
+        Identificador do conteúdo desta versão. Ao contrário de `versao`
+        (contador local), é o mesmo em todos os processos que leram o mesmo
+        arquivo, pelo .xlsx ou pelo snapshot, e para o mesmo conteúdo
+        regravado pelo /atualizar: o hash é da forma canônica, não dos dtypes.
+        """
+        return self.derivado("token", lambda e: hashlib.sha256(
+            pd.util.hash_pandas_object(_forma_canonica(e.df), index=False).to_numpy().tobytes()
+        ).hexdigest()[:16])
+
+    def derivado(self, chave: str, construir: Callable[["DatasetEntry"], Any]) -> Any:
+        """Retorna o artefato `chave`, construindo-o na primeira chamada desta versão."""
+        try:
+            return self._derivados[chave]
+        except KeyError:
+            pass
+        with self._lock:
+            if chave not in self._derivados:
+                self._derivados[chave] = construir(self)
+            return self._derivados[chave]
+
+
+class DatasetCache:
+    """
+    Cache em processo das planilhas, revalidado pela assinatura do arquivo
+    (mtime + tamanho). Uma leitura com o arquivo inalterado custa um os.stat().
+    """
+
+    def __init__(self):
+        self._entradas: Dict[str, DatasetEntry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._versoes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def _lock_do(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _contar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def obter(self, path: str, carregar: Callable[[str], Tuple[pd.DataFrame, Dict]]) -> DatasetEntry:
+        """
+        Retorna a entrada em cache de `path`, recarregando com `carregar(path)`
+        se o arquivo mudou. `carregar` devolve (DataFrame, extras) e pode
+        levantar HTTPException; erros não são cacheados.
+        """
+        entrada = self._entradas.get(path)
+        if entrada is not None and (entrada.assinatura is EM_MEMORIA or entrada.assinatura == _assinatura(path)):
+            self._contar("hits")
+            return entrada
+
+        # Um carregamento por arquivo de cada vez: requisições concorrentes
+        # esperam a primeira terminar em vez de parsear o mesmo Excel em paralelo.
+        with self._lock_do(path):
+            assinatura = _assinatura(path)
+            entrada = self._entradas.get(path)
+            if _valida(entrada, assinatura):
+                self._contar("hits")
+                return entrada
+
+            self._contar("misses")
+            df, extras = carregar(path)
+            with self._lock:
+                versao = self._versoes.get(path, 0) + 1
+                self._versoes[path] = versao
+                entrada = DatasetEntry(path, assinatura, versao, df, extras)
+                self._entradas[path] = entrada
+            return entrada
+
+    def substituir(self, path: str, df: pd.DataFrame, extras: Optional[Dict] = None) -> DatasetEntry:
+        """
+        Publica uma nova versão de `path` já em memória (ex.: /atualizar ou
+        PATCH), sem reler a planilha. A entrada fica marcada EM_MEMORIA: o
+        arquivo em disco ainda não a reflete, então mudanças nele não a
+        invalidam até `confirmar` com esta versão.
+        """
+        with self._lock_do(path):
+            with self._lock:
+                versao = self._versoes.get(path, 0) + 1
+                self._versoes[path] = versao
+                entrada = DatasetEntry(path, EM_MEMORIA, versao, df, extras)
+                self._entradas[path] = entrada
+            return entrada
+
+    def versao_atual(self, path: str) -> Optional[int]:
+        """`versao` da entrada em cache de `path`, ou None."""
+        with self._lock:
+            entrada = self._entradas.get(path)
+            return entrada.versao if entrada is not None else None
+
+    def confirmar(self, path: str, versao: Optional[int]):
+        """
+        Marca a entrada de `path` como correspondente ao arquivo em disco
+        (depois que o gravador persistiu o que estava em memória), se ela
+        ainda for a `versao` gravada. Uma versão mais nova continua
+        EM_MEMORIA até a gravação dela.
+        """
+        with self._lock:
+            entrada = self._entradas.get(path)
+            if entrada is not None and entrada.versao == versao:
+                entrada.assinatura = _assinatura(path)
+
+    def revalidar(self, path: str):
+        """
+        O arquivo mudou de forma mas não de conteúdo (compactação do diário):
+        a entrada confirmada passa a corresponder ao arquivo novo. Uma
+        EM_MEMORIA fica como está.
+        """
+        with self._lock:
+            entrada = self._entradas.get(path)
+            if entrada is not None and entrada.assinatura is not EM_MEMORIA:
+                entrada.assinatura = _assinatura(path)
+
+    def invalidar(self, path: str):
+        """Descarta a entrada de `path` (ex.: após um /atualizar bem-sucedido)."""
+        with self._lock:
+            if self._entradas.pop(path, None) is not None:
+                self.invalidacoes += 1
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            datasets = {
+                os.path.basename(p): {
+                    "versao": e.versao,
+                    "linhas": len(e.df),
+                    "carregado_em": e.carregado_em,
+                }
+                for p, e in self._entradas.items()
+            }
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidacoes": self.invalidacoes,
+                "datasets": datasets,
+            }
+
+
+def corpo_json(conteudo: Any) -> bytes:
+    """Serializa como o JSONResponse do FastAPI, para guardar o corpo pronto no cache."""
+    with metricas.etapa("serializacao", codificador="json"):
+        return json.dumps(
+            conteudo,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+# Instância única compartilhada pelas rotas
+dataset_cache = DatasetCache()
+
@@ -0,0 +1,152 @@
+# utils/diario.py
+"""
+Diário das edições por célula (PATCH /dados), ao lado da planilha.
+
+Um PATCH não regrava o .xlsx: o gravador (utils/escrita.py) acrescenta uma
+linha JSON em .<planilha>.diario.jsonl com as células alteradas, um custo
+que cresce com a edição e não com a tabela. Cada linha traz a assinatura
+(mtime_ns, tamanho) do .xlsx sobre o qual vale. Na leitura
+(edicao.com_diario) as linhas da assinatura atual são aplicadas por cima da
+planilha (ou do snapshot); as outras são sobras de uma compactação ou de um
+/atualizar interrompidos e são ignoradas.
+
+A compactação (GravadorDataset._compactar) leva o diário para dentro do
+.xlsx e reescreve aqui só o que chegou durante ela, já com a assinatura
+nova. Só usa a stdlib: é importado pelo dataset_cache.
+"""
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+SUFIXO = ".diario.jsonl"
+
+Celulas = Dict[Tuple[int, str], Any]
+
+
+def caminho(path: str) -> str:
+    pasta, nome = os.path.split(path)
+    return os.path.join(pasta, f".{nome}{SUFIXO}")
+
+
+def _assinatura_arquivo(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def base(path: str) -> Optional[Tuple[int, int]]:
+    """Assinatura do .xlsx: a que as linhas novas do diário recebem."""
+    return _assinatura_arquivo(path)
+
+
+def assinatura(path: str) -> Optional[Tuple[int, int]]:
+    """Assinatura do diário de `path` (None se não houver)."""
+    return _assinatura_arquivo(caminho(path))
+
+
+def tamanho(path: str) -> int:
+    atual = assinatura(path)
+    return atual[1] if atual else 0
+
+
+def _nativo(valor: Any) -> Any:
+    if hasattr(valor, "item") and not isinstance(valor, (str, bytes)):
+        valor = valor.item()  # escalares numpy
+    if isinstance(valor, float) and valor != valor:
+        return None
+    return valor
+
+
+def _linha(base_xlsx, linha_cabecalho: int, celulas: Celulas) -> bytes:
+    registro = {
+        "base": list(base_xlsx) if base_xlsx else None,
+        "cabecalho": linha_cabecalho,
+        "celulas": [[pos, coluna, _nativo(valor)] for (pos, coluna), valor in celulas.items()],
+    }
+    return (json.dumps(registro, ensure_ascii=False, allow_nan=False) + "\n").encode("utf-8")
+
+
+def anexar(path: str, celulas: Celulas, linha_cabecalho: int = 1) -> int:
+    """Acrescenta as células ao diário (com fsync). Retorna o tamanho do diário."""
+    with open(caminho(path), "a+b") as f:
+        # Linha cortada por uma queda no meio da escrita: começa na próxima
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(_linha(base(path), linha_cabecalho, celulas))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def _registros(dados: bytes):
+    for linha in dados.splitlines():
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            continue  # linha cortada
+        if isinstance(registro, dict) and isinstance(registro.get("celulas"), list):
+            yield registro
+
+
+def ler(path: str) -> Tuple[Celulas, int, int]:
+    """
+    (células que valem para o .xlsx atual, a última mais recente vence; linha
+    do cabeçalho; bytes lidos do diário).
+    """
+    try:
+        with open(caminho(path), "rb") as f:
+            dados = f.read()
+    except FileNotFoundError:
+        return {}, 1, 0
+    atual = base(path)
+    esperada = list(atual) if atual else None
+    celulas: Celulas = {}
+    linha_cabecalho = 1
+    for registro in _registros(dados):
+        if registro.get("base") != esperada:
+            continue
+        linha_cabecalho = registro.get("cabecalho", linha_cabecalho)
+        for pos, coluna, valor in registro["celulas"]:
+            celulas[(int(pos), coluna)] = valor
+    return celulas, linha_cabecalho, len(dados)
+
+
+def rebasear(path: str, lido: int):
+    """
+    Depois da compactação: descarta os `lido` primeiros bytes (já estão no
+    .xlsx) e marca o que chegou depois com a assinatura do .xlsx novo.
+    """
+    destino = caminho(path)
+    try:
+        with open(destino, "rb") as f:
+            f.seek(lido)
+            resto = f.read()
+    except FileNotFoundError:
+        return
+    atual = base(path)
+    nova = list(atual) if atual else None
+    linhas = []
+    for registro in _registros(resto):
+        registro["base"] = nova
+        linhas.append(json.dumps(registro, ensure_ascii=False) + "\n")
+    if not linhas:
+        descartar(path)
+        return
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(linhas)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, destino)
+
+
+def descartar(path: str):
+    """Apaga o diário (ex.: /atualizar regravou a planilha inteira)."""
+    try:
+        os.remove(caminho(path))
+    except FileNotFoundError:
+        pass
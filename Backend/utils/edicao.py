@@ -0,0 +1,400 @@
+# utils/edicao.py
+"""
+Edição por célula dos datasets (PATCH /dados).
+
+O corpo é uma lista de operações {"linha" | "chave", "coluna", "valor"}
+(ou {"versao": <token>, "ops": [...]}):
+  - "linha": posição 0-based do registro, na ordem de /dados;
+  - "chave": {coluna: valor} que identifica um ou mais registros
+    (ex.: {"Cultivo": "ABACATE", "ANO_POF": 2017, "Região": "Sul"}).
+
+As operações são aplicadas sobre uma cópia do DataFrame em cache e só as
+células que de fato mudaram são gravadas: primeiro no diário ao lado da
+planilha (utils/diario.py), aplicado na leitura por `com_diario`; depois,
+na compactação, dentro do .xlsx por `gravar_celulas`, que troca só essas
+células no XML da aba (demais abas, formatação e fórmulas intactas).
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import posixpath
+import re
+import uuid
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from fastapi import HTTPException
+
+from utils import diario
+from utils.consulta import normalizar_chave
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+logger = logging.getLogger(__name__)
+
+Alteracoes = Dict[Tuple[int, str], Any]
+
+
+def normalizar_payload(payload: Any) -> Tuple[Optional[str], List[Dict]]:
+    """Retorna (versão esperada, operações) aceitando lista pura ou {"versao", "ops"}."""
+    if isinstance(payload, list):
+        versao, ops = None, payload
+    elif isinstance(payload, dict) and isinstance(payload.get("ops"), list):
+        versao, ops = payload.get("versao"), payload["ops"]
+    else:
+        raise HTTPException(status_code=400, detail='Envie uma lista de operações ou {"ops": [...]}.')
+    if not all(isinstance(op, dict) for op in ops):
+        raise HTTPException(status_code=400, detail="Cada operação deve ser um objeto.")
+    return versao, ops
+
+
+def _mesmo_valor(a: Any, b: Any) -> bool:
+    vazio_a = a is None or (isinstance(a, float) and np.isnan(a))
+    vazio_b = b is None or (isinstance(b, float) and np.isnan(b))
+    if vazio_a or vazio_b:
+        return vazio_a and vazio_b
+    return a == b
+
+
+def _compativel(serie: pd.Series, valor: Any) -> bool:
+    # pandas 3 não faz upcast silencioso ao atribuir: detecta antes
+    kind = serie.dtype.kind
+    if kind in "iu":
+        return isinstance(valor, (int, np.integer)) and not isinstance(valor, bool)
+    if kind == "f":
+        return isinstance(valor, (int, float, np.number)) and not isinstance(valor, bool)
+    if kind == "b":
+        return isinstance(valor, bool)
+    if isinstance(serie.dtype, pd.StringDtype):
+        return isinstance(valor, str)
+    return True
+
+
+class _Localizador:
+    """Resolve "linha"/"chave" em posições, com as colunas-chave normalizadas uma vez."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._textos: Dict[str, np.ndarray] = {}
+
+    def _texto(self, coluna: str) -> np.ndarray:
+        if coluna not in self._textos:
+            self._textos[coluna] = np.array(
+                [normalizar_chave(v) if v is not None else None for v in self.df[coluna].tolist()],
+                dtype=object,
+            )
+        return self._textos[coluna]
+
+    def posicoes(self, op: Dict, i: int) -> np.ndarray:
+        if "linha" in op:
+            linha = op["linha"]
+            if not isinstance(linha, int) or isinstance(linha, bool) or not 0 <= linha < len(self.df):
+                raise HTTPException(status_code=400, detail=f"Operação {i}: linha inválida ({linha!r}).")
+            return np.array([linha])
+
+        chave = op.get("chave")
+        if not isinstance(chave, dict) or not chave:
+            raise HTTPException(status_code=400, detail=f"Operação {i}: informe 'linha' ou 'chave'.")
+        mascara = np.ones(len(self.df), dtype=bool)
+        for coluna, valor in chave.items():
+            if coluna not in self.df.columns:
+                raise HTTPException(status_code=400, detail=f"Operação {i}: coluna de chave desconhecida {coluna!r}.")
+            mascara &= self._texto(coluna) == normalizar_chave(valor)
+        posicoes = np.flatnonzero(mascara)
+        if len(posicoes) == 0:
+            raise HTTPException(status_code=404, detail=f"Operação {i}: nenhum registro com a chave {chave}.")
+        return posicoes
+
+
+def aplicar_ops(entrada, payload: Any) -> Tuple[pd.DataFrame, Alteracoes]:
+    """
+    Aplica as operações sobre uma cópia de `entrada.df`.
+    Retorna (novo DataFrame, {(posição, coluna): valor} só com o que mudou).
+    """
+    versao, ops = normalizar_payload(payload)
+    if versao is not None and versao != entrada.token:
+        raise HTTPException(status_code=409, detail="O dataset mudou desde a leitura; recarregue os dados.")
+
+    df = entrada.df
+    localizar = _Localizador(df)
+    pedidas: Alteracoes = {}
+    for i, op in enumerate(ops):
+        coluna = op.get("coluna")
+        if coluna not in df.columns:
+            raise HTTPException(status_code=400, detail=f"Operação {i}: coluna desconhecida {coluna!r}.")
+        if "valor" not in op:
+            raise HTTPException(status_code=400, detail=f"Operação {i}: falta 'valor'.")
+        for pos in localizar.posicoes(op, i):
+            # A última operação sobre a mesma célula vence
+            pedidas[(int(pos), coluna)] = op["valor"]
+
+    alteracoes = {
+        (pos, coluna): valor
+        for (pos, coluna), valor in pedidas.items()
+        if not _mesmo_valor(df[coluna].iat[pos], valor)
+    }
+    if not alteracoes:
+        return df, alteracoes
+    return aplicar_alteracoes(df, alteracoes), alteracoes
+
+
+def aplicar_alteracoes(df: pd.DataFrame, alteracoes: Alteracoes) -> pd.DataFrame:
+    """Cópia de `df` com as células de `alteracoes`, alargando o dtype da coluna se preciso."""
+    novo = df.copy()
+    for coluna in {c for _, c in alteracoes}:
+        valores = [v for (_, c), v in alteracoes.items() if c == coluna]
+        if not all(v is None or _compativel(novo[coluna], v) for v in valores) or (
+            any(v is None for v in valores) and novo[coluna].dtype.kind in "iub"
+        ):
+            novo[coluna] = novo[coluna].astype(object)
+    for (pos, coluna), valor in alteracoes.items():
+        novo.iat[pos, novo.columns.get_loc(coluna)] = valor
+    return novo
+
+
+def com_diario(path: str, df: pd.DataFrame) -> pd.DataFrame:
+    """`df` lido da planilha com as edições do diário (utils/diario.py) por cima."""
+    celulas, _, _ = diario.ler(path)
+    validas = {(p, c): v for (p, c), v in celulas.items() if c in df.columns and 0 <= p < len(df)}
+    if len(validas) < len(celulas):
+        logger.warning("Diário de %s: %d célula(s) fora da tabela ignorada(s)",
+                       os.path.basename(path), len(celulas) - len(validas))
+    return aplicar_alteracoes(df, validas) if validas else df
+
+
+# ---------------- gravação no .xlsx ----------------
+# O .xlsx é um zip de XML: a aba editada é reescrita trocando só os <c> das
+# células alteradas (o resto do XML passa byte a byte); as outras partes do
+# pacote são copiadas.
+
+_NS = {
+    "m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+}
+_CALC_CHAIN = "xl/calcChain.xml"
+
+_LINHA = re.compile(rb'<(?:\w+:)?row\b[^>]*?\sr="(\d+)"[^>]*?(?:/>|>.*?</(?:\w+:)?row>)', re.S)
+_CELULA = re.compile(rb'<(?:\w+:)?c\b[^>]*?\sr="([A-Z]+)\d+"[^>]*?(?:/>|>.*?</(?:\w+:)?c>)', re.S)
+_SHEETDATA = re.compile(rb'<(\w+:)?sheetData\b[^>]*?(/?)>')
+_FORMULA = re.compile(rb'<(?:\w+:)?f\b[^>]*')
+_ESTILO = re.compile(rb'\ss="(\d+)"')
+
+
+def _coluna(letras: bytes) -> int:
+    n = 0
+    for ch in letras:
+        n = n * 26 + ch - 64
+    return n
+
+
+def _letras(n: int) -> str:
+    letras = ""
+    while n:
+        n, resto = divmod(n - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _parte_da_primeira_aba(zin: zipfile.ZipFile) -> str:
+    wb = ElementTree.fromstring(zin.read("xl/workbook.xml"))
+    rid = wb.find("m:sheets/m:sheet", _NS).get(f"{{{_NS['r']}}}id")
+    for rel in ElementTree.fromstring(zin.read("xl/_rels/workbook.xml.rels")):
+        if rel.get("Id") == rid:
+            alvo = rel.get("Target")
+            return alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+    raise ValueError("Primeira aba não encontrada no workbook.")
+
+
+def _textos_compartilhados(zin: zipfile.ZipFile, indices) -> Dict[int, str]:
+    """Só os textos de sharedStrings.xml nos `indices` pedidos."""
+    faltam, textos = set(indices), {}
+    if not faltam or "xl/sharedStrings.xml" not in zin.namelist():
+        return textos
+    with zin.open("xl/sharedStrings.xml") as f:
+        i = 0
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f"{{{_NS['m']}}}si":
+                continue
+            if i in faltam:
+                # Texto simples (<t>) ou rich text (<r><t>); a fonética (<rPh>) fica de fora
+                partes = elem.findall("m:t", _NS) + elem.findall("m:r/m:t", _NS)
+                textos[i] = "".join(t.text or "" for t in partes)
+                faltam.discard(i)
+                if not faltam:
+                    break
+            elem.clear()
+            i += 1
+    return textos
+
+
+def _cabecalho(zin: zipfile.ZipFile, linha: bytes) -> Dict[str, int]:
+    """{nome da coluna: índice 1-based} a partir do XML da linha de cabeçalho."""
+    celulas = []
+    for m in _CELULA.finditer(linha):
+        # Sem prefixo de namespace, só para ler t, <v> e <is><t>
+        xml = ElementTree.fromstring(re.sub(rb"<(/?)\w+:", rb"<\1", m.group(0)))
+        v, t = xml.find("v"), xml.find("is/t")
+        valor = v.text if v is not None else (t.text if t is not None else None)
+        celulas.append((_coluna(m.group(1)), xml.get("t"), valor))
+    compartilhados = _textos_compartilhados(zin, [int(v) for _, tipo, v in celulas if tipo == "s" and v is not None])
+    indice = {}
+    for coluna, tipo, valor in celulas:
+        if tipo == "s" and valor is not None:
+            valor = compartilhados.get(int(valor))
+        if valor is not None and str(valor).strip():
+            indice[str(valor).strip()] = coluna
+    return indice
+
+
+def _xml_celula(prefixo: str, ref: str, estilo: Optional[bytes], valor: Any) -> bytes:
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    p = prefixo
+    s = f' s="{estilo.decode()}"' if estilo else ""
+    if valor is None or (isinstance(valor, float) and not math.isfinite(valor)):
+        return f'<{p}c r="{ref}"{s}/>'.encode()
+    if isinstance(valor, bool):
+        return f'<{p}c r="{ref}"{s} t="b"><{p}v>{int(valor)}</{p}v></{p}c>'.encode()
+    if isinstance(valor, (int, float)):
+        return f'<{p}c r="{ref}"{s}><{p}v>{valor!r}</{p}v></{p}c>'.encode()
+    texto = escape(valor if isinstance(valor, str) else str(valor))
+    return f'<{p}c r="{ref}"{s} t="inlineStr"><{p}is><{p}t xml:space="preserve">{texto}</{p}t></{p}is></{p}c>'.encode("utf-8")
+
+
+def _editar_linha(prefixo: str, numero: int, xml: Optional[bytes], valores: Dict[int, Any]) -> Tuple[bytes, bool]:
+    """
+    XML da linha `numero` (None = linha ainda inexistente) com `valores`
+    ({coluna 1-based: valor}) aplicados. Retorna (xml, se alguma fórmula foi
+    sobrescrita).
+    """
+    if xml is None:
+        abertura, corpo = f'<{prefixo}row r="{numero}">'.encode(), b""
+    elif xml.endswith(b"/>"):
+        abertura, corpo = xml[:-2] + b">", b""
+    else:
+        fim_abertura = xml.index(b">") + 1
+        abertura, corpo = xml[:fim_abertura], xml[fim_abertura:xml.rindex(b"</")]
+
+    formula = False
+    pendentes = dict(sorted(valores.items()))
+    saida = []
+    for m in _CELULA.finditer(corpo):
+        coluna = _coluna(m.group(1))
+        for nova in [c for c in pendentes if c < coluna]:
+            saida.append(_xml_celula(prefixo, f"{_letras(nova)}{numero}", None, pendentes.pop(nova)))
+        if coluna not in pendentes:
+            saida.append(m.group(0))
+            continue
+        celula = m.group(0)
+        f = _FORMULA.search(celula)
+        if f is not None:
+            if b't="shared"' in f.group(0) and b"ref=" in f.group(0):
+                # A fórmula compartilhada mora nesta célula: apagá-la quebraria as que a usam
+                raise ValueError(f"{_letras(coluna)}{numero} guarda uma fórmula compartilhada do Excel.")
+            formula = True
+        estilo = _ESTILO.search(celula[:celula.index(b">")])
+        saida.append(_xml_celula(prefixo, f"{_letras(coluna)}{numero}", estilo.group(1) if estilo else None,
+                                 pendentes.pop(coluna)))
+    for nova, valor in pendentes.items():
+        saida.append(_xml_celula(prefixo, f"{_letras(nova)}{numero}", None, valor))
+    return abertura + b"".join(saida) + f"</{prefixo}row>".encode(), formula
+
+
+def _editar_aba(xml: bytes, linhas: Dict[int, Dict[int, Any]]) -> Tuple[bytes, bool]:
+    """XML da aba com `linhas` ({linha 1-based: {coluna: valor}}) aplicadas; só elas são reescritas."""
+    dados = _SHEETDATA.search(xml)
+    if dados is None:
+        raise ValueError("Aba sem <sheetData>.")
+    prefixo = (dados.group(1) or b"").decode()
+    if dados.group(2):  # <sheetData/>
+        inicio = fim = dados.end()
+        abertura, fechamento = dados.group(0)[:-2] + b">", f"</{prefixo}sheetData>".encode()
+    else:
+        inicio = dados.end()
+        fim = xml.index(f"</{prefixo}sheetData>".encode(), inicio)
+        abertura, fechamento = dados.group(0), b""
+
+    formula = False
+    pendentes = dict(sorted(linhas.items()))
+    saida, anterior = [], inicio
+    for m in _LINHA.finditer(xml, inicio, fim):
+        if not pendentes:
+            break
+        numero = int(m.group(1))
+        if numero < next(iter(pendentes)):
+            continue
+        saida.append(xml[anterior:m.start()])
+        # Linhas novas antes desta (a planilha não tinha nada nelas)
+        for n in [n for n in pendentes if n < numero]:
+            saida.append(_editar_linha(prefixo, n, None, pendentes.pop(n))[0])
+        if numero in pendentes:
+            editada, f = _editar_linha(prefixo, numero, m.group(0), pendentes.pop(numero))
+            formula |= f
+            saida.append(editada)
+        else:
+            saida.append(m.group(0))
+        anterior = m.end()
+    saida.append(xml[anterior:fim])
+    for n, valores in pendentes.items():
+        saida.append(_editar_linha(prefixo, n, None, valores)[0])
+    return xml[:dados.start()] + abertura + b"".join(saida) + fechamento + xml[fim:], formula
+
+
+def _sem_calc_chain(nome: str, dados: bytes) -> bytes:
+    """Partes do pacote ajustadas quando uma fórmula foi sobrescrita."""
+    if nome == "[Content_Types].xml":
+        return re.sub(rb'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', b"", dados)
+    if nome == "xl/_rels/workbook.xml.rels":
+        return re.sub(rb'<Relationship\b[^>]*Target="[^"]*calcChain\.xml"[^>]*/>', b"", dados)
+    if nome == "xl/workbook.xml" and b"fullCalcOnLoad" not in dados:
+        return re.sub(rb"<((?:\w+:)?calcPr)\b", rb'<\1 fullCalcOnLoad="1"', dados, count=1)
+    return dados
+
+
+def gravar_celulas(path: str, alteracoes: Alteracoes, linha_cabecalho: int = 1, destino: Optional[str] = None):
+    """
+    Escreve só as células alteradas na primeira aba de `path` (salvando em
+    `destino`, se informado; ver utils/escrita.py).
+    `linha_cabecalho` é a linha (1-based) dos nomes de coluna; o registro na
+    posição p fica na linha linha_cabecalho + 1 + p.
+
+    Só os <c> dessas células mudam no XML da aba: as outras mantêm fórmula e
+    valor calculado (o que o pandas lê), e as demais abas, estilos e tabelas
+    passam como estão. Se uma fórmula foi sobrescrita, o calcChain sai do
+    pacote e o workbook pede recálculo ao abrir (fullCalcOnLoad).
+    """
+    separado = destino is not None and os.path.abspath(destino) != os.path.abspath(path)
+    alvo = destino if separado else os.path.join(os.path.dirname(path), f".edicao.{uuid.uuid4().hex[:8]}.tmp.xlsx")
+    try:
+        with zipfile.ZipFile(path) as zin:
+            parte = _parte_da_primeira_aba(zin)
+            aba = zin.read(parte)
+            cabecalho = next((m for m in _LINHA.finditer(aba) if int(m.group(1)) == linha_cabecalho), None)
+            indice = _cabecalho(zin, cabecalho.group(0)) if cabecalho is not None else {}
+            faltando = sorted({c for _, c in alteracoes if c not in indice})
+            if faltando:
+                raise HTTPException(status_code=400, detail=f"Colunas ausentes na planilha: {faltando}")
+
+            linhas: Dict[int, Dict[int, Any]] = {}
+            for (pos, coluna), valor in alteracoes.items():
+                linhas.setdefault(linha_cabecalho + 1 + pos, {})[indice[coluna]] = valor
+            aba, formula = _editar_aba(aba, linhas)
+
+            with zipfile.ZipFile(alvo, "w", zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    if info.filename == parte:
+                        zout.writestr(info, aba)
+                    elif not (formula and info.filename == _CALC_CHAIN):
+                        dados = zin.read(info)
+                        zout.writestr(info, _sem_calc_chain(info.filename, dados) if formula else dados)
+        if not separado:
+            os.replace(alvo, path)
+    finally:
+        if not separado and os.path.exists(alvo):
+            os.remove(alvo)
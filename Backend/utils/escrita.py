@@ -0,0 +1,414 @@
+# utils/escrita.py
+"""
+Caminho de escrita das planilhas: um gravador por dataset.
+
+- Gravações são serializadas por dataset (lock `_escrita`, só do gravador)
+  e feitas num arquivo temporário no mesmo diretório, trocado pelo original
+  com os.replace: quem lê vê a planilha antiga inteira ou a nova inteira.
+- Group commit: pedidos que chegam dentro da janela RISKWISE_JANELA_ESCRITA_MS
+  (padrão 50 ms) viram uma única escrita física.
+- Um lote é uma escrita completa (/atualizar, a mais recente vence) e/ou as
+  células alteradas por PATCH acumuladas desde a última gravação.
+- Um lote só de células não regrava o .xlsx: vai para o diário ao lado da
+  planilha (utils/diario.py), um append do tamanho da edição. A thread do
+  gravador compacta o diário no .xlsx (só as células editadas, ver
+  edicao.gravar_celulas) quando ele passa de RISKWISE_DIARIO_MAX_KB (padrão
+  256) ou fica RISKWISE_DIARIO_OCIOSO_S (padrão 30) sem edições, e no
+  shutdown. Uma escrita completa descarta o diário.
+
+O estado em memória (dataset_cache) é atualizado antes da escrita, sob o
+lock `estado`, que só cobre a mutação do cache e o agendamento: a escrita
+física roda fora dele, então um /atualizar ou PATCH não espera a gravação
+anterior terminar. Leitores nunca bloqueiam, só pegam a versão em cache;
+a entrada fica EM_MEMORIA até o gravador confirmar a versão que gravou.
+
+Write-behind (padrão; RISKWISE_ESCRITA_ASSINCRONA=0 desliga): a requisição
+só atualiza a memória e agenda; uma thread por dataset grava o lote em
+segundo plano, tentando de novo com backoff se falhar (ex.: arquivo aberto
+no Excel). No modo síncrono o primeiro pedido da janela é o "líder": espera
+a janela, grava o lote e acorda os demais, e a requisição só volta depois
+da gravação. Em ambos, `descarregar_tudo()` (lifespan do app) grava o que
+estiver pendente antes de o processo sair.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, NamedTuple, Optional
+
+from utils import diario, edicao, perfil
+from utils.dataset_cache import dataset_cache
+from utils.edicao import Alteracoes, gravar_celulas
+
+logger = logging.getLogger(__name__)
+
+JANELA_PADRAO_MS = 50
+BACKOFF_MAXIMO = 30.0
+DIARIO_MAX_KB_PADRAO = 256
+DIARIO_OCIOSO_S_PADRAO = 30
+
+Escritor = Callable[[str], None]
+
+
+class Ticket(NamedTuple):
+    lote: int
+    lider: bool
+    versao: int
+
+
+def _janela() -> float:
+    try:
+        return max(0, int(os.environ.get("RISKWISE_JANELA_ESCRITA_MS", JANELA_PADRAO_MS))) / 1000
+    except ValueError:
+        return JANELA_PADRAO_MS / 1000
+
+
+def _limite_diario() -> int:
+    try:
+        return max(0, int(os.environ.get("RISKWISE_DIARIO_MAX_KB", DIARIO_MAX_KB_PADRAO))) * 1024
+    except ValueError:
+        return DIARIO_MAX_KB_PADRAO * 1024
+
+
+def _diario_ocioso() -> float:
+    try:
+        return max(0.1, float(os.environ.get("RISKWISE_DIARIO_OCIOSO_S", DIARIO_OCIOSO_S_PADRAO)))
+    except ValueError:
+        return float(DIARIO_OCIOSO_S_PADRAO)
+
+
+def escrita_assincrona() -> bool:
+    return os.environ.get("RISKWISE_ESCRITA_ASSINCRONA", "1").strip().lower() not in ("0", "false", "nao", "no")
+
+
+def _temporario(path: str) -> str:
+    pasta, nome = os.path.split(path)
+    base, ext = os.path.splitext(nome)
+    return os.path.join(pasta, f".{base}.{uuid.uuid4().hex[:8]}.tmp{ext}")
+
+
+def _fsync(path: str):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def gravar_atomico(path: str, escrever: Escritor):
+    """
+    Chama `escrever(temporario)` e troca o temporário por `path` com os.replace.
+    O temporário fica no mesmo diretório (mesmo filesystem) e mantém a extensão.
+    """
+    tmp = _temporario(path)
+    try:
+        escrever(tmp)
+        _fsync(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class GravadorDataset:
+    def __init__(self, path: str, assincrona: Optional[bool] = None):
+        self.path = path
+        self.assincrona = escrita_assincrona() if assincrona is None else assincrona
+        # Mutação do cache + agendamento; quem edita o dataset segura este lock
+        self.estado = threading.Lock()
+        # Escrita física: um escritor por arquivo de cada vez
+        self._escrita = threading.Lock()
+        self._cond = threading.Condition()
+        self._versao_cache: Optional[int] = None  # versão do dataset_cache do lote aberto
+        self._completa: Optional[Escritor] = None
+        self._celulas: Alteracoes = {}
+        self._linha_cabecalho = 1
+        self._lote = 0           # lote aberto, recebendo pedidos
+        self._concluido = -1     # último lote gravado (modo síncrono)
+        self._lider_ativo = False
+        self._erros: Dict[int, Optional[BaseException]] = {}
+        self._worker: Optional[threading.Thread] = None
+        self._parar = False
+        self._compactar_ja = False  # diário passou do limite
+        self.versao = 0          # último pedido aceito
+        self.versao_gravada = 0  # último pedido que está no disco
+        self.ultima_gravacao: Optional[float] = None
+        self.ultimo_erro: Optional[str] = None
+        self.escritas = 0
+        self.compactacoes = 0
+        self.falhas = 0
+        self.pedidos = 0
+
+    def _pendente(self) -> bool:
+        return self._completa is not None or bool(self._celulas)
+
+    def agendar(
+        self,
+        completa: Optional[Escritor] = None,
+        celulas: Optional[Alteracoes] = None,
+        linha_cabecalho: int = 1,
+    ) -> Ticket:
+        """
+        Junta o pedido ao lote aberto. Chamar com `estado` seguro, logo após
+        atualizar o cache, para que a ordem no lote seja a ordem aplicada.
+        """
+        with self._cond:
+            if completa is not None:
+                # Escrita completa substitui tudo o que estava pendente
+                self._completa, self._celulas = completa, {}
+            if celulas:
+                self._celulas.update(celulas)
+            self._linha_cabecalho = linha_cabecalho
+            self._versao_cache = dataset_cache.versao_atual(self.path)
+            self.pedidos += 1
+            self.versao += 1
+
+            if self.assincrona:
+                self._iniciar_worker()
+                self._cond.notify_all()
+                return Ticket(self._lote, False, self.versao)
+
+            self._parar = False  # gravador em uso de novo depois de um descarregar()
+            lider = not self._lider_ativo
+            self._lider_ativo = True
+            return Ticket(self._lote, lider, self.versao)
+
+    def aguardar(self, ticket: Ticket):
+        """
+        Modo síncrono: bloqueia até o lote do ticket estar no disco e relança
+        o erro da escrita, se houver. No write-behind volta na hora, exceto
+        numa requisição perfilada (utils/perfil.py): aí espera a thread
+        gravadora (até BACKOFF_MAXIMO), para a escrita entrar no perfil.
+        """
+        if self.assincrona:
+            if perfil.ativo():
+                with self._cond:
+                    self._cond.wait_for(lambda: self.versao_gravada >= ticket.versao, timeout=BACKOFF_MAXIMO)
+            return
+        if ticket.lider:
+            time.sleep(_janela())
+            self._gravar_lote()
+        with self._cond:
+            while self._concluido < ticket.lote:
+                self._cond.wait()
+            erro = self._erros.get(ticket.lote)
+        if erro is not None:
+            raise erro
+
+    def situacao(self) -> str:
+        """Status para a resposta da requisição que agendou a escrita."""
+        return "agendado" if self.assincrona else "salvo"
+
+    def _gravar_lote(self) -> Optional[BaseException]:
+        with self._escrita:
+            with self._cond:
+                completa, celulas, linha = self._completa, self._celulas, self._linha_cabecalho
+                self._completa, self._celulas = None, {}
+                lote, versao, versao_cache = self._lote, self.versao, self._versao_cache
+                self._lote += 1
+                self._lider_ativo = False
+
+            erro = None
+            gravou = completa is not None or bool(celulas)
+            if gravou:
+                try:
+                    if completa is not None:
+                        def escrever(destino: str):
+                            completa(destino)
+                            if celulas:
+                                gravar_celulas(destino, celulas, linha)
+                        gravar_atomico(self.path, escrever)
+                        # A planilha nova já tem tudo; o diário era sobre a antiga
+                        diario.descartar(self.path)
+                    elif diario.anexar(self.path, celulas, linha) > _limite_diario():
+                        with self._cond:
+                            self._compactar_ja = True
+                            self._cond.notify_all()
+                except BaseException as e:
+                    erro = e
+
+            with self._cond:
+                if erro is None and gravou:
+                    self.escritas += 1
+                    self.versao_gravada = versao
+                    self.ultima_gravacao = time.time()
+                    self.ultimo_erro = None
+                    if completa is None and not self._parar:
+                        # Quem compacta o diário é a thread do gravador, também no modo síncrono
+                        self._iniciar_worker()
+                elif erro is not None:
+                    self.falhas += 1
+                    self.ultimo_erro = f"{type(erro).__name__}: {erro}"
+                    if self.assincrona:
+                        # Volta para a fila por baixo do que chegou depois
+                        if self._completa is None:
+                            self._completa = completa
+                            self._celulas = {**celulas, **self._celulas}
+
+            if erro is None and gravou:
+                # O cache já tem o conteúdo gravado: só passa a corresponder ao
+                # arquivo (se nada mais novo foi publicado enquanto gravava)
+                dataset_cache.confirmar(self.path, versao_cache)
+            elif erro is not None and not self.assincrona:
+                # A requisição vai falhar: o disco volta a ser a referência
+                dataset_cache.invalidar(self.path)
+
+        with self._cond:
+            self._concluido = lote
+            self._erros[lote] = erro
+            for antigo in [k for k in self._erros if k < lote - 100]:
+                del self._erros[antigo]
+            self._cond.notify_all()
+        return erro
+
+    # ---------------- write-behind ----------------
+
+    def _iniciar_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._parar = False
+            self._worker = threading.Thread(
+                target=self._loop,
+                name=f"gravador-{os.path.basename(self.path)}",
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _loop(self):
+        falhas_seguidas = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._parar or self._compactar_ja or (self.assincrona and self._pendente()),
+                    timeout=_diario_ocioso() if diario.tamanho(self.path) else None,
+                )
+                if self._parar:
+                    return
+                gravar = self.assincrona and self._pendente()
+            if not gravar:
+                # Diário acima do limite, ou sem edições há RISKWISE_DIARIO_OCIOSO_S
+                self._compactar()
+                continue
+            time.sleep(_janela())
+            erro = self._gravar_lote()
+            if erro is None:
+                falhas_seguidas = 0
+                continue
+            falhas_seguidas += 1
+            espera = min(BACKOFF_MAXIMO, 0.5 * 2 ** (falhas_seguidas - 1))
+            logger.warning("Falha ao gravar %s (tentativa %d), nova tentativa em %.1fs: %s",
+                           self.path, falhas_seguidas, espera, self.ultimo_erro)
+            with self._cond:
+                self._cond.wait_for(lambda: self._parar, timeout=espera)
+                if self._parar:
+                    return
+
+    def compactar_depois(self):
+        """Garante a thread que compacta o diário (após RISKWISE_DIARIO_OCIOSO_S ou no shutdown)."""
+        with self._cond:
+            self._iniciar_worker()
+
+    def _compactar(self) -> bool:
+        """
+        Leva o diário para dentro do .xlsx. O .xlsx novo é montado fora de
+        `_escrita` (PATCHes continuam indo para o diário); só a troca dos
+        arquivos é serializada com os outros escritores. Retorna True se o
+        diário ficou vazio.
+        """
+        with self._cond:
+            self._compactar_ja = False
+        with self._escrita:
+            base = diario.base(self.path)
+            celulas, linha, lido = diario.ler(self.path)
+            if not celulas:
+                diario.rebasear(self.path, lido)  # só sobras de outra versão do .xlsx
+                return True
+        tmp = _temporario(self.path)
+        try:
+            gravar_celulas(self.path, celulas, linha, destino=tmp)
+            _fsync(tmp)
+            with self._escrita:
+                if diario.base(self.path) != base:
+                    # Uma escrita completa trocou a planilha (e descartou o diário)
+                    return False
+                os.replace(tmp, self.path)
+                diario.rebasear(self.path, lido)
+                # Mesmo conteúdo, arquivo novo: a entrada em cache continua valendo
+                dataset_cache.revalidar(self.path)
+            with self._cond:
+                self.compactacoes += 1
+            return True
+        except Exception as e:
+            logger.warning("Falha ao compactar o diário de %s: %s", self.path, e)
+            return False
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def descarregar(self, tentativas: int = 3) -> bool:
+        """Para o worker e grava o que estiver pendente. Retorna True se nada ficou para trás."""
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        for _ in range(tentativas):
+            with self._cond:
+                if not self._pendente():
+                    break
+            self._gravar_lote()
+        if diario.tamanho(self.path):
+            self._compactar()
+        with self._cond:
+            return not self._pendente()
+
+    def estatisticas(self) -> Dict:
+        with self._cond:
+            return {
+                "modo": "write-behind" if self.assincrona else "sincrono",
+                "versao": self.versao,
+                "versao_gravada": self.versao_gravada,
+                "pendente": self._pendente(),
+                "diario_bytes": diario.tamanho(self.path),
+                "ultima_gravacao": self.ultima_gravacao,
+                "ultimo_erro": self.ultimo_erro,
+                "pedidos": self.pedidos,
+                "escritas": self.escritas,
+                "compactacoes": self.compactacoes,
+                "falhas": self.falhas,
+            }
+
+
+_gravadores: Dict[str, GravadorDataset] = {}
+_lock = threading.Lock()
+
+
+def gravador_de(path: str) -> GravadorDataset:
+    with _lock:
+        if path not in _gravadores:
+            _gravadores[path] = GravadorDataset(path)
+        return _gravadores[path]
+
+
+def estatisticas() -> Dict[str, Dict]:
+    with _lock:
+        gravadores = dict(_gravadores)
+    return {os.path.basename(p): g.estatisticas() for p, g in gravadores.items()}
+
+
+def com_diario(path: str, df):
+    """
+    `df` lido da planilha com as edições do diário por cima (edicao.com_diario).
+    Se havia diário (ex.: de uma execução anterior), o gravador do dataset
+    passa a cuidar da compactação.
+    """
+    df = edicao.com_diario(path, df)
+    if diario.tamanho(path):
+        gravador_de(path).compactar_depois()
+    return df
+
+
+def descarregar_tudo():
+    """Grava tudo o que estiver pendente; chamado no shutdown do app."""
+    with _lock:
+        gravadores = list(_gravadores.values())
+    for g in gravadores:
+        if not g.descarregar():
+            logger.error("Alterações pendentes não gravadas em %s: %s", g.path, g.ultimo_erro)
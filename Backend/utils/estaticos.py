@@ -0,0 +1,226 @@
+# utils/estaticos.py
+"""
+Build dos arquivos estáticos do Frontend com hash no nome e variantes
+comprimidas, e o StaticFiles que os entrega.
+
+`compilar` gera Frontend/dist/ já no layout das URLs (/css, /javascript,
+/imagens, páginas na raiz):
+  - cada asset de css/, javascript/ e imagens/ ganha uma cópia com o hash do
+    conteúdo no nome (report.js -> report.3f9a1c0b2e.js) e as referências nos
+    HTML/CSS/JS são reescritas para ela; a cópia sem hash continua lá para
+    URLs montadas em runtime;
+  - arquivos de texto ganham .gz (e .br, se o pacote brotli estiver
+    instalado) quando a variante é menor que o original;
+  - manifest.json com o mapa URL -> URL com hash e um digest das fontes.
+
+Em runtime, `carregar` só usa o dist se o digest das fontes bater (como os
+snapshots das planilhas): editou um .js e não recompilou, o servidor volta a
+servir Frontend/ direto. Os arquivos com hash vão com Cache-Control
+immutable; o resto (páginas, nomes sem hash) com no-cache.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from utils import compressao
+
+try:
+    import brotli
+except ImportError:  # dependência opcional: sem ela, só gzip
+    brotli = None
+
+DIST_DIRNAME = "dist"
+MANIFEST = "manifest.json"
+FORMATO = 1
+
+# Diretório do Frontend -> prefixo da URL (as páginas de html/ ficam na raiz)
+DIRETORIOS_ASSETS = {"css": "css", "javascript": "javascript", "imagens": "imagens"}
+DIRETORIO_PAGINAS = "html"
+ARQUIVOS_RAIZ = ("favicon.ico",)
+
+EXTENSOES_TEXTO = (".html", ".css", ".js", ".svg", ".json", ".txt", ".ico")
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+# Referências absolutas a assets dentro de HTML/CSS/JS (não casa o caminho de URLs externas)
+_REFERENCIA = re.compile(r"(?<![\w.:/-])/(?:css|javascript|imagens)/[^\s\"'()<>?#`]+")
+
+Substituicoes = Dict[str, Dict[str, str]]
+
+
+# --------- fontes ----------
+def _fontes(frontend_dir: str) -> Iterator[Tuple[str, str]]:
+    """(URL, caminho) de cada arquivo servido, em ordem estável."""
+    for nome_dir, prefixo in DIRETORIOS_ASSETS.items():
+        yield from _arquivos(os.path.join(frontend_dir, nome_dir), "/" + prefixo)
+    yield from _arquivos(os.path.join(frontend_dir, DIRETORIO_PAGINAS), "")
+    for nome in ARQUIVOS_RAIZ:
+        caminho = os.path.join(frontend_dir, nome)
+        if os.path.isfile(caminho):
+            yield "/" + nome, caminho
+
+
+def _arquivos(raiz: str, prefixo: str) -> Iterator[Tuple[str, str]]:
+    for pasta, subpastas, arquivos in os.walk(raiz):
+        subpastas.sort()
+        for nome in sorted(arquivos):
+            # .bak são os backups deixados por corrigir_caminhos.py
+            if nome.startswith(".") or nome.endswith(".bak"):
+                continue
+            caminho = os.path.join(pasta, nome)
+            relativo = os.path.relpath(caminho, raiz).replace(os.sep, "/")
+            yield f"{prefixo}/{relativo}", caminho
+
+
+def digest_fontes(frontend_dir: str) -> str:
+    """sha256 sobre nomes e conteúdos de todas as fontes (muda se qualquer arquivo mudar)."""
+    h = hashlib.sha256()
+    for url, caminho in _fontes(frontend_dir):
+        h.update(url.encode("utf-8") + b"\0")
+        with open(caminho, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+# --------- build ----------
+def _com_hash(url: str, conteudo: bytes) -> str:
+    base, ext = os.path.splitext(url)
+    return f"{base}.{hashlib.sha256(conteudo).hexdigest()[:10]}{ext}"
+
+
+def _aplicar(conteudo: bytes, url: str, substituicoes: Substituicoes, mapa: Dict[str, str]) -> bytes:
+    ext = os.path.splitext(url)[1]
+    if ext not in (".html", ".css", ".js"):
+        return conteudo
+    texto = conteudo.decode("utf-8")
+    for padrao, novo in substituicoes.get(ext, {}).items():
+        texto = re.sub(padrao, novo, texto)
+    texto = _REFERENCIA.sub(lambda m: mapa.get(m.group(0), m.group(0)), texto)
+    return texto.encode("utf-8")
+
+
+def _comprimidas(conteudo: bytes) -> List[Tuple[str, bytes]]:
+    import gzip
+
+    variantes = [(".gz", gzip.compress(conteudo, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variantes.append((".br", brotli.compress(conteudo, quality=11)))
+    return [(sufixo, dados) for sufixo, dados in variantes if len(dados) < len(conteudo)]
+
+
+def compilar(frontend_dir: str, substituicoes: Optional[Substituicoes] = None) -> Dict:
+    """
+    Gera <frontend_dir>/dist do zero. `substituicoes` = {extensão: {regex: troca}}
+    aplicadas antes do hash (as mesmas de corrigir_caminhos.py).
+    Retorna o manifest gravado.
+    """
+    substituicoes = substituicoes or {}
+    destino = os.path.join(frontend_dir, DIST_DIRNAME)
+    fontes = list(_fontes(frontend_dir))
+    conteudos = {}
+    for url, caminho in fontes:
+        with open(caminho, "rb") as f:
+            conteudos[url] = f.read()
+
+    # Binários primeiro, depois CSS (referencia imagens), JS e por fim as
+    # páginas: cada arquivo é reescrito antes de ter o próprio hash calculado
+    ordem = {".css": 1, ".js": 2, ".html": 3}
+    mapa: Dict[str, str] = {}
+    saida: Dict[str, bytes] = {}
+    for url, _ in sorted(fontes, key=lambda f: ordem.get(os.path.splitext(f[0])[1], 0)):
+        conteudo = _aplicar(conteudos[url], url, substituicoes, mapa)
+        saida[url] = conteudo
+        if url.split("/")[1] in DIRETORIOS_ASSETS.values():
+            mapa[url] = _com_hash(url, conteudo)
+            saida[mapa[url]] = conteudo
+
+    if os.path.isdir(destino):
+        shutil.rmtree(destino)
+    codificacoes = set()
+    for url, conteudo in saida.items():
+        caminho = os.path.join(destino, *url.lstrip("/").split("/"))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        if url.endswith(EXTENSOES_TEXTO):
+            for sufixo, dados in _comprimidas(conteudo):
+                with open(caminho + sufixo, "wb") as f:
+                    f.write(dados)
+                codificacoes.add(sufixo)
+
+    manifest = {
+        "formato": FORMATO,
+        "fontes": digest_fontes(frontend_dir),
+        "arquivos": dict(sorted(mapa.items())),
+        "variantes": sorted(codificacoes),
+    }
+    with open(os.path.join(destino, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# --------- runtime ----------
+_CODIFICACOES = (("br", ".br"), ("gzip", ".gz"))
+
+
+class EstaticosPreComprimidos(StaticFiles):
+    """
+    StaticFiles sobre o dist: entrega a variante .br/.gz gerada no build
+    quando o cliente aceita (Vary: Accept-Encoding) e marca os arquivos com
+    hash no nome como immutable.
+    """
+
+    def __init__(self, *, directory: str, imutaveis, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.imutaveis = frozenset(imutaveis)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        pedido = Headers(scope=scope)
+        caminho = os.fspath(full_path)
+        resposta = None
+        variantes = False
+        aceitas = compressao.aceitas(pedido.get("accept-encoding", ""))
+        for codificacao, sufixo in _CODIFICACOES:
+            variante = caminho + sufixo
+            if not os.path.isfile(variante):
+                continue
+            variantes = True
+            if resposta is None and codificacao in aceitas:
+                resposta = FileResponse(
+                    variante, status_code=status_code, stat_result=os.stat(variante),
+                    media_type=mimetypes.guess_type(caminho)[0] or "text/plain",
+                    headers={"Content-Encoding": codificacao},
+                )
+        if resposta is None:
+            resposta = FileResponse(caminho, status_code=status_code, stat_result=stat_result)
+        if variantes:
+            resposta.headers["Vary"] = "Accept-Encoding"
+
+        relativo = os.path.relpath(caminho, self.directory).replace(os.sep, "/")
+        resposta.headers["Cache-Control"] = CACHE_IMUTAVEL if relativo in self.imutaveis else CACHE_REVALIDAR
+
+        if self.is_not_modified(resposta.headers, pedido):
+            return NotModifiedResponse(resposta.headers)
+        return resposta
+
+
+def carregar(frontend_dir: str) -> Optional[EstaticosPreComprimidos]:
+    """App estático do dist, ou None se não houver build ou ele estiver desatualizado."""
+    destino = os.path.join(frontend_dir, DIST_DIRNAME)
+    try:
+        with open(os.path.join(destino, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("formato") != FORMATO or manifest.get("fontes") != digest_fontes(frontend_dir):
+        return None
+    imutaveis = [url.lstrip("/") for url in manifest.get("arquivos", {}).values()]
+    return EstaticosPreComprimidos(directory=destino, imutaveis=imutaveis, html=True)
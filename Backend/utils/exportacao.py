@@ -0,0 +1,93 @@
+# utils/exportacao.py
+"""
+Exportação do relatório combinado em planilha (xlsx) ou CSV.
+
+As seções e os filtros são os do PDF (utils/secoes_relatorio.py). As linhas
+são geradas e escritas uma a uma:
+- xlsx: Workbook(write_only=True) do openpyxl, que grava cada aba num
+  temporário em vez de manter as células em memória; o arquivo final vai
+  para um Spool (memória até o limiar, depois disco; ver utils/spool_pdf.py);
+- csv: texto gerado em blocos direto para a resposta; com mais de uma
+  seção, um CSV por seção dentro de um ZIP montado em fluxo.
+"""
+import csv
+import io
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from utils.secoes_relatorio import Secao, secoes
+from utils.spool_pdf import Resultado, Spool, de_worker, diretorio_spool, limiar_spool
+from utils.zip_fluxo import ZipEmFluxo
+
+FORMATOS = ("xlsx", "csv")
+# Validação do ?format= de /report/export
+PADRAO_FORMATO = f"^({'|'.join(FORMATOS)})$"
+LINHAS_POR_BLOCO_CSV = 1000
+
+
+def secoes_escolhidas(argumentos: Dict[str, Any], secao: Optional[str] = None) -> List[Secao]:
+    """Seções do relatório; com `secao`, só ela (404 se não fizer parte do relatório)."""
+    todas = list(secoes(**argumentos))
+    if secao is None:
+        return todas
+    escolhidas = [s for s in todas if s.nome.lower() == secao.strip().lower()]
+    if not escolhidas:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Seção {secao!r} não está no relatório. Disponíveis: {[s.nome for s in todas]}",
+        )
+    return escolhidas
+
+
+def _celula(valor: Any, ilegais) -> Any:
+    # Valores vêm do JSON do front: só tipos que a planilha aceita, sem caracteres de controle
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    return ilegais.sub("", str(valor))
+
+
+def gerar_xlsx(lista: Iterable[Secao]) -> Resultado:
+    """Uma aba por seção; devolve os bytes ou um arquivo em disco (PDFEmDisco)."""
+    # openpyxl só na primeira exportação, não no cold start (utils/sob_demanda.py)
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)
+    for secao in lista:
+        ws = wb.create_sheet(title=secao.nome[:31])
+        ws.append(secao.cabecalho)
+        for linha in secao.linhas:
+            ws.append([_celula(v, ILLEGAL_CHARACTERS_RE) for v in linha])
+    spool = Spool(limiar_spool(), diretorio_spool(), sufixo=".xlsx")
+    try:
+        wb.save(spool)
+        return de_worker(spool.resultado())
+    except BaseException:
+        spool.descartar()
+        raise
+
+
+def blocos_csv(secao: Secao) -> Iterator[bytes]:
+    texto = io.StringIO()
+    escritor = csv.writer(texto)
+    # BOM: o Excel abre o UTF-8 com acentos corretamente
+    texto.write("\ufeff")
+    escritor.writerow(secao.cabecalho)
+    for i, linha in enumerate(secao.linhas, 1):
+        escritor.writerow(linha)
+        if i % LINHAS_POR_BLOCO_CSV == 0:
+            yield texto.getvalue().encode("utf-8")
+            texto.seek(0)
+            texto.truncate()
+    yield texto.getvalue().encode("utf-8")
+
+
+def zip_de_csvs(lista: Iterable[Secao]) -> Iterator[bytes]:
+    saida = ZipEmFluxo(compressao=zipfile.ZIP_DEFLATED)
+    for secao in lista:
+        for bloco in saida.adicionar_blocos(f"{secao.nome}.csv", blocos_csv(secao)):
+            if bloco:
+                yield bloco
+    yield saida.fechar()
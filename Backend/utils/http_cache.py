@@ -0,0 +1,81 @@
+# utils/http_cache.py
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from utils import compressao
+
+# Dataset pode ser guardado pelo navegador, mas sempre revalidado via ETag
+CACHE_CONTROL_DADOS = "no-cache"
+
+# Token da versão do dataset lida (a "versao" da forma compacta do relatório,
+# ver utils/referencias.py); também vai em meta.versao nos corpos JSON
+HEADER_VERSAO = "X-RiskWise-Versao"
+
+
+def etag_de(corpo: bytes) -> str:
+    """ETag forte derivada do conteúdo serializado."""
+    return '"' + hashlib.sha256(corpo).hexdigest()[:32] + '"'
+
+
+def _etag_confere(if_none_match: str, etag: str) -> bool:
+    # If-None-Match usa comparação fraca (RFC 9110 §13.1.2): ignora o prefixo W/
+    if if_none_match.strip() == "*":
+        return True
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == etag:
+            return True
+    return False
+
+
+def resposta_condicional(
+    request: Request,
+    corpo: bytes,
+    etag: str,
+    media_type: str = "application/json",
+    cache_control: str = CACHE_CONTROL_DADOS,
+    content_encoding: Optional[str] = None,
+    versao: Optional[str] = None,
+) -> Response:
+    """
+    Devolve 304 sem corpo se o cliente já tem `etag`; senão o corpo completo
+    com ETag e Cache-Control. Com `content_encoding`, `corpo` já vem
+    comprimido (e `etag` é a da representação comprimida). `versao` (token
+    do dataset) vai no header HEADER_VERSAO.
+    """
+    # Vary também no 304 e na versão sem compressão: caches intermediários
+    # não podem misturar as representações
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if versao is not None:
+        headers[HEADER_VERSAO] = versao
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_confere(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=corpo, media_type=media_type, headers=headers)
+
+
+def resposta_dataset(request: Request, entrada, montar_resposta, chave: str = "resposta") -> Response:
+    """
+    Resposta condicional do corpo JSON em cache de uma entrada do dataset_cache.
+    `chave` separa representações do mesmo dataset (ex.: registros x colunar).
+    Se o cliente aceita gzip/brotli, o corpo comprimido também é um derivado
+    da entrada: comprimido uma vez por versão, não a cada requisição.
+    """
+    corpo = entrada.derivado(chave, montar_resposta)
+    etag = entrada.derivado("etag:" + chave, lambda e: etag_de(corpo))
+    codificacao = compressao.escolher(request.headers.get("accept-encoding", ""))
+    if codificacao is None:
+        return resposta_condicional(request, corpo, etag, versao=entrada.token)
+    comprimido = entrada.derivado(f"{chave}:{codificacao}", lambda e: compressao.comprimir(corpo, codificacao))
+    # Representações diferentes do mesmo conteúdo: ETag forte distinta por codificação
+    etag_comprimido = compressao.etag_codificada(etag, codificacao)
+    return resposta_condicional(
+        request, comprimido, etag_comprimido, content_encoding=codificacao, versao=entrada.token
+    )
@@ -0,0 +1,323 @@
+# utils/metricas.py
+"""
+Métricas no formato texto do Prometheus (GET /metrics) e spans das etapas
+internas.
+
+- MetricasMiddleware: histograma de latência e requisições em andamento por
+  rota (o template da rota, ex. /acute/dados, não a URL com parâmetros).
+- `etapa(nome)`: mede um trecho interno (leitura da planilha, validação de
+  colunas, limpeza de NaN, serialização, PDF) no histograma
+  riskwise_etapa_duracao_segundos. Aninhado numa requisição, vira um span
+  filho dela.
+- RISKWISE_SPANS_ARQUIVO: se definido, cada span (requisição ou etapa) vira
+  uma linha JSON nesse arquivo, com trace_id/span_id/parent_id, para análise
+  offline. Sem a variável os spans nem são montados.
+
+Os contadores são por processo (como os de /cache/stats). Só usa a stdlib:
+nada de pacote extra no cold start.
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.routing import Mount
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_BYTES = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, valores: Dict[str, str]) -> Rotulos:
+        return tuple((r, str(valores.get(r, ""))) for r in self.rotulos)
+
+    def _amostras(self) -> List[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}", *self._amostras()]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Rotulos, float] = {}
+
+    def somar(self, delta: float, **rotulos: str):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + delta
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [f"{self.nome}{_formatar_rotulos(r)} {_numero(v)}" for r, v in itens]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagem por bucket (não cumulativa; o último é +Inf), soma]
+        self._series: Dict[Rotulos, list] = {}
+
+    def observar(self, valor: float, **rotulos: str):
+        chave = self._chave(rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = sorted((r, (list(c), s)) for r, (c, s) in self._series.items())
+        linhas = []
+        for rotulos, (contagens, soma) in itens:
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += n
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(rotulos, ('le', _numero(limite)))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(rotulos)} {acumulado}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas: List[_Metrica] = []
+        # Valores lidos na hora da coleta (ex.: contadores do dataset_cache)
+        self._coletores: List[Callable[[], Iterator[Tuple[str, str, str, float]]]] = []
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        self._metricas.append(metrica)
+        return metrica
+
+    def coletor(self, funcao: Callable[[], Iterator[Tuple[str, str, str, float]]]):
+        """`funcao` gera (nome, tipo, ajuda, valor) a cada coleta."""
+        self._coletores.append(funcao)
+
+    def exportar(self) -> str:
+        linhas: List[str] = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        for funcao in self._coletores:
+            for nome, tipo, ajuda, valor in funcao():
+                linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {_numero(valor)}"]
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+duracao_requisicao = registro.registrar(Histograma(
+    "riskwise_http_requisicao_duracao_segundos",
+    "Latência das requisições HTTP até o último byte da resposta.",
+    ("metodo", "rota", "status"),
+))
+requisicoes_em_andamento = registro.registrar(Gauge(
+    "riskwise_http_requisicoes_em_andamento",
+    "Requisições HTTP em andamento.",
+    ("metodo", "rota"),
+))
+duracao_etapa = registro.registrar(Histograma(
+    "riskwise_etapa_duracao_segundos",
+    "Duração das etapas internas (leitura da planilha, validação, limpeza, serialização, PDF).",
+    ("etapa",),
+))
+tamanho_pdf = registro.registrar(Histograma(
+    "riskwise_pdf_tamanho_bytes",
+    "Tamanho dos PDFs gerados (sem contar os servidos do cache).",
+    ("gerador",),
+    buckets=BUCKETS_BYTES,
+))
+
+
+# --------- spans ----------
+class _Exportador:
+    """Acrescenta spans como linhas JSON em RISKWISE_SPANS_ARQUIVO."""
+
+    def __init__(self):
+        self.caminho = os.environ.get("RISKWISE_SPANS_ARQUIVO") or None
+        self._arquivo = None
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self) -> bool:
+        return self.caminho is not None
+
+    def gravar(self, span: Dict[str, Any]):
+        linha = json.dumps(span, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho, "a", encoding="utf-8", buffering=1)
+            self._arquivo.write(linha)
+
+
+exportador = _Exportador()
+
+# (trace_id, span_id) do span corrente; o threadpool do FastAPI copia o
+# contexto, então etapas dentro de endpoints síncronos herdam a requisição
+_span_atual: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("riskwise_span", default=None)
+
+
+def _novo_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def span(nome: str, **atributos: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Span exportado para o JSONL (no-op sem RISKWISE_SPANS_ARQUIVO). O dict
+    devolvido aceita atributos extras definidos dentro do bloco.
+    """
+    if not exportador.ativo:
+        yield atributos
+        return
+    pai = _span_atual.get()
+    trace_id = pai[0] if pai else uuid.uuid4().hex
+    span_id = _novo_id()
+    token = _span_atual.set((trace_id, span_id))
+    inicio, relogio = time.time(), time.perf_counter()
+    erro = None
+    try:
+        yield atributos
+    except BaseException as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        _span_atual.reset(token)
+        registro_span = {
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": pai[1] if pai else None,
+            "nome": nome,
+            "inicio": round(inicio, 6),
+            "duracao_ms": round((time.perf_counter() - relogio) * 1000, 3),
+            "atributos": atributos,
+        }
+        if erro:
+            registro_span["erro"] = erro
+        exportador.gravar(registro_span)
+
+
+@contextmanager
+def etapa(nome: str, **atributos: Any) -> Iterator[Dict[str, Any]]:
+    """Mede uma etapa interna: histograma por `nome` e, se ativo, um span."""
+    inicio = time.perf_counter()
+    try:
+        with span(nome, **atributos) as attrs:
+            yield attrs
+    finally:
+        duracao_etapa.observar(time.perf_counter() - inicio, etapa=nome)
+
+
+def observar_pdf(gerador: str, tamanho: int):
+    tamanho_pdf.observar(tamanho, gerador=gerador)
+
+
+# --------- middleware ----------
+def _tabela_rotas(rotas) -> List[Tuple[Any, str]]:
+    """
+    (regex, template) de cada rota, na ordem de resolução. Mounts entram como
+    "<prefixo>/*". Routers incluídos: versões recentes do FastAPI não guardam
+    mais o prefixo na própria rota; os caminhos completos vêm dos contextos
+    efetivos do router incluído.
+    """
+    tabela: List[Tuple[Any, str]] = []
+    for rota in rotas:
+        if isinstance(rota, Mount):
+            tabela.append((rota.path_regex, (rota.path or "") + "/*"))
+        elif hasattr(rota, "effective_route_contexts"):
+            tabela.extend((c.path_regex, c.path) for c in rota.effective_route_contexts())
+        elif hasattr(rota, "path_regex") and hasattr(rota, "path"):
+            tabela.append((rota.path_regex, rota.path))
+    return tabela
+
+
+def _rota(tabela: List[Tuple[Any, str]], caminho: str) -> str:
+    """Template da rota que atende `caminho` (cardinalidade limitada)."""
+    for regex, template in tabela:
+        if regex.match(caminho):
+            return template
+    return "sem_rota"
+
+
+class MetricasMiddleware:
+    """
+    Latência (até o fim do corpo, inclusive em streaming) e requisições em
+    andamento por método e rota. `roteador` é o app FastAPI, para resolver o
+    template da rota antes de a requisição entrar.
+    """
+
+    def __init__(self, app, roteador=None):
+        self.app = app
+        self.roteador = roteador
+        self._tabela: Optional[List[Tuple[Any, str]]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._tabela is None:
+            # Montada na primeira requisição, com todas as rotas já incluídas
+            self._tabela = _tabela_rotas(getattr(self.roteador, "routes", ()))
+        metodo = scope["method"]
+        rota = _rota(self._tabela, scope["path"])
+        status = {"codigo": 500}
+
+        async def enviar(message):
+            if message["type"] == "http.response.start":
+                status["codigo"] = message["status"]
+            await send(message)
+
+        requisicoes_em_andamento.somar(1, metodo=metodo, rota=rota)
+        inicio = time.perf_counter()
+        try:
+            with span("requisicao", metodo=metodo, rota=rota) as atributos:
+                await self.app(scope, receive, enviar)
+                atributos["status"] = status["codigo"]
+        finally:
+            requisicoes_em_andamento.somar(-1, metodo=metodo, rota=rota)
+            duracao_requisicao.observar(
+                time.perf_counter() - inicio, metodo=metodo, rota=rota, status=str(status["codigo"]),
+            )
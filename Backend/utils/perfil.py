@@ -0,0 +1,225 @@
+# utils/perfil.py
+"""
+Profiling sob demanda de uma requisição.
+
+Desligado por padrão. Com RISKWISE_PROFILING=1, uma requisição marcada com
+o header X-RiskWise-Profile ou com ?profile=1 roda sob um profiler por
+amostragem:
+
+- uma thread lê as pilhas de todas as threads (sys._current_frames) a cada
+  RISKWISE_PROFILING_INTERVALO_MS (padrão 5 ms) enquanto a requisição não
+  termina. Pega o event loop, o threadpool dos endpoints síncronos e o
+  gravador do write-behind (utils/escrita.py), até dentro do pandas, do
+  openpyxl e do ReportLab. Threads paradas em wait/select não contam;
+- enquanto o profiling está ativo o PDF é renderizado neste processo
+  (utils/pool_pdf.py) e não sai do cache de PDFs, para o ReportLab aparecer
+  no perfil;
+- o resultado fica em RISKWISE_PROFILING_DIR (padrão <tmp>/riskwise_perfis,
+  os RISKWISE_PROFILING_MAX mais recentes, padrão 20) em "collapsed stacks"
+  (uma pilha por linha com a contagem no fim, entrada de flamegraph.pl e
+  speedscope). A resposta traz o id no header X-RiskWise-Perfil; o arquivo
+  sai em GET /profiling/<id>.
+
+Requisições concorrentes aparecem no mesmo perfil: use em execuções de
+diagnóstico, não sob carga. Com RISKWISE_PROFILING_TOKEN definido, o header
+(ou o ?profile=) precisa trazer o token em vez de "1".
+"""
+import collections
+import contextvars
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+
+HEADER_PEDIDO = "x-riskwise-profile"
+HEADER_RESPOSTA = "X-RiskWise-Perfil"
+PARAMETRO = "profile"
+
+# Folhas que indicam thread ociosa (esperando trabalho ou I/O)
+_OCIOSAS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _inteiro_env(nome: str, padrao: int) -> int:
+    try:
+        return max(0, int(os.environ.get(nome, padrao)))
+    except ValueError:
+        return padrao
+
+
+def habilitado() -> bool:
+    return os.environ.get("RISKWISE_PROFILING", "").strip().lower() in ("1", "true", "sim", "on")
+
+
+def diretorio() -> str:
+    return os.environ.get("RISKWISE_PROFILING_DIR") or os.path.join(tempfile.gettempdir(), "riskwise_perfis")
+
+
+# Amostrador da requisição corrente (herdado pelo threadpool via contexto)
+_atual: contextvars.ContextVar[Optional["Amostrador"]] = contextvars.ContextVar("riskwise_perfil", default=None)
+
+
+def ativo() -> bool:
+    """True dentro de uma requisição sendo perfilada."""
+    return _atual.get() is not None
+
+
+def _quadro(codigo) -> str:
+    caminho = codigo.co_filename
+    for marca in ("site-packages" + os.sep, "Backend" + os.sep):
+        i = caminho.rfind(marca)
+        if i >= 0:
+            caminho = caminho[i + len(marca):]
+            break
+    else:
+        caminho = os.path.basename(caminho)
+    return f"{codigo.co_name} ({caminho}:{codigo.co_firstlineno})"
+
+
+class Amostrador:
+    def __init__(self, intervalo: float):
+        self.id = uuid.uuid4().hex
+        self.intervalo = intervalo
+        self.pilhas: collections.Counter = collections.Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name="riskwise-perfil", daemon=True)
+
+    def iniciar(self):
+        self.inicio = time.time()
+        self._relogio = time.perf_counter()
+        self._thread.start()
+
+    def parar(self) -> float:
+        self._parar.set()
+        self._thread.join()
+        return time.perf_counter() - self._relogio
+
+    def _rodar(self):
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            self.amostras += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                codigo = frame.f_code
+                if (os.path.basename(codigo.co_filename), codigo.co_name) in _OCIOSAS:
+                    continue
+                quadros = []
+                while frame is not None:
+                    quadros.append(_quadro(frame.f_code))
+                    frame = frame.f_back
+                quadros.append(nomes.get(ident, f"thread-{ident}"))
+                self.pilhas[";".join(reversed(quadros))] += 1
+
+    def salvar(self, meta: Dict[str, Any]) -> str:
+        destino = diretorio()
+        os.makedirs(destino, exist_ok=True)
+        with open(os.path.join(destino, self.id + ".txt"), "w", encoding="utf-8") as f:
+            for pilha, n in self.pilhas.most_common():
+                f.write(f"{pilha} {n}\n")
+        with open(os.path.join(destino, self.id + ".json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        _podar(destino, _inteiro_env("RISKWISE_PROFILING_MAX", 20))
+        return self.id
+
+
+def _podar(destino: str, maximo: int):
+    metas = sorted(
+        (os.path.join(destino, n) for n in os.listdir(destino) if n.endswith(".json")),
+        key=os.path.getmtime, reverse=True,
+    )
+    for caminho in metas[max(1, maximo):]:
+        for extensao in (".json", ".txt"):
+            try:
+                os.remove(caminho[:-len(".json")] + extensao)
+            except OSError:
+                pass
+
+
+def listar() -> List[Dict[str, Any]]:
+    """Metadados dos perfis guardados, do mais recente ao mais antigo."""
+    destino = diretorio()
+    if not os.path.isdir(destino):
+        return []
+    perfis = []
+    for nome in os.listdir(destino):
+        if nome.endswith(".json"):
+            try:
+                with open(os.path.join(destino, nome), encoding="utf-8") as f:
+                    perfis.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(perfis, key=lambda m: m.get("inicio", 0), reverse=True)
+
+
+def caminho_de(perfil_id: str) -> Optional[str]:
+    """Arquivo collapsed do perfil, ou None (id inválido ou inexistente)."""
+    if not _ID.match(perfil_id):
+        return None
+    caminho = os.path.join(diretorio(), perfil_id + ".txt")
+    return caminho if os.path.isfile(caminho) else None
+
+
+def _pedido(scope) -> bool:
+    esperado = os.environ.get("RISKWISE_PROFILING_TOKEN") or "1"
+    valor = Headers(scope=scope).get(HEADER_PEDIDO)
+    if valor is None:
+        valores = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(PARAMETRO)
+        valor = valores[0] if valores else None
+    return valor is not None and valor == esperado
+
+
+class PerfilMiddleware:
+    """Liga o Amostrador nas requisições marcadas (só com RISKWISE_PROFILING=1)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not habilitado() or not _pedido(scope):
+            await self.app(scope, receive, send)
+            return
+
+        amostrador = Amostrador(_inteiro_env("RISKWISE_PROFILING_INTERVALO_MS", 5) / 1000 or 0.005)
+        status = {"codigo": None}
+
+        async def enviar(message):
+            if message["type"] == "http.response.start":
+                status["codigo"] = message["status"]
+                MutableHeaders(scope=message)[HEADER_RESPOSTA] = amostrador.id
+            await send(message)
+
+        token = _atual.set(amostrador)
+        amostrador.iniciar()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = amostrador.parar()
+            _atual.reset(token)
+            amostrador.salvar({
+                "id": amostrador.id,
+                "metodo": scope["method"],
+                "caminho": scope["path"],
+                "status": status["codigo"],
+                "inicio": round(amostrador.inicio, 3),
+                "duracao_ms": round(duracao * 1000, 1),
+                "intervalo_ms": round(amostrador.intervalo * 1000, 1),
+                "amostras": amostrador.amostras,
+            })
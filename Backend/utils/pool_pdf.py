@@ -0,0 +1,164 @@
+# utils/pool_pdf.py
+"""
+Renderização dos PDFs (ReportLab) fora do processo da API.
+
+O build do ReportLab é CPU puro: rodando no threadpool do FastAPI ele
+disputa o GIL com todas as outras requisições. Aqui os PDFs vão para um
+ProcessPoolExecutor dedicado:
+
+- RISKWISE_PDF_WORKERS: número de processos (0 = renderiza no próprio
+  processo, em thread; padrão 0 na Vercel e metade dos núcleos fora dela);
+- RISKWISE_PDF_FILA: máximo de PDFs em andamento + aguardando (padrão
+  2 × workers, mínimo 2). Com a fila cheia a API responde 503 com
+  Retry-After em vez de acumular trabalho;
+- cada worker é "aquecido" no início (imports, fontes e estilos), para o
+  primeiro PDF de cada processo não pagar esse custo;
+- o PDF é escrito num spool (utils/spool_pdf.py): PDFs grandes voltam do
+  worker como arquivo temporário, não como bytes.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from utils import metricas, perfil
+from utils.spool_pdf import PDFEmDisco, Resultado, de_worker, descartar_retorno, diretorio_spool, limiar_spool, renderizar_em_spool
+
+
+def _em_deploy() -> bool:
+    return bool(os.environ.get("VERCEL") or os.environ.get("VERCEL_ENV"))
+
+
+def _inteiro_env(nome: str, padrao: int) -> int:
+    try:
+        return max(0, int(os.environ.get(nome, padrao)))
+    except ValueError:
+        return padrao
+
+
+def numero_workers() -> int:
+    padrao = 0 if _em_deploy() else max(1, (os.cpu_count() or 2) // 2)
+    return _inteiro_env("RISKWISE_PDF_WORKERS", padrao)
+
+
+def _aquecer():
+    """Initializer dos workers: carrega ReportLab, fontes e estilos uma vez por processo."""
+    from io import BytesIO
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    from utils import report
+
+    estilos, _ = report._estilos()
+    report._table_style()
+    SimpleDocTemplate(BytesIO(), **report._doc()).build([Paragraph("-", estilos["Normal"])])
+
+
+class PoolPDF:
+    def __init__(self):
+        self.workers = numero_workers()
+        self.limite = _inteiro_env("RISKWISE_PDF_FILA", max(2, 2 * self.workers)) or 1
+        self._vagas = threading.BoundedSemaphore(self.limite)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._duracao_media = 1.0  # segundos, média móvel para o Retry-After
+        self.em_andamento = 0
+        self.recusados = 0
+
+    def _obter_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: o processo da API tem threads (write-behind, threadpool),
+                # e fork com threads ativas não é seguro
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_aquecer,
+                )
+            return self._executor
+
+    def _descartar_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def retry_after(self) -> int:
+        # Tempo estimado até abrir uma vaga: fila inteira dividida pelos workers
+        paralelos = max(1, self.workers)
+        return max(1, math.ceil(self._duracao_media * self.limite / paralelos))
+
+    async def renderizar(self, funcao: Callable[..., Any], *args: Any, **kwargs: Any) -> Resultado:
+        """
+        Executa `funcao(*args, destino=..., **kwargs)` (função de módulo,
+        picklable, que escreve o PDF em `destino`) no pool e devolve os bytes
+        ou um PDFEmDisco. Levanta 503 se a fila estiver cheia.
+        """
+        if not self._vagas.acquire(blocking=False):
+            self.recusados += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Muitos relatórios em geração; tente novamente em instantes.",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+        self.em_andamento += 1
+        inicio = time.perf_counter()
+        tarefa = (funcao, args, kwargs, limiar_spool(), diretorio_spool())
+        try:
+            # Nos workers não há como alimentar as métricas deste processo:
+            # a etapa mede daqui (inclui o envio ao worker e a volta)
+            with metricas.etapa("pdf_build", gerador=funcao.__name__, workers=self.workers) as atributos:
+                resultado = await self._executar(tarefa)
+                tamanho = resultado.tamanho if isinstance(resultado, PDFEmDisco) else len(resultado)
+                atributos["bytes"] = tamanho
+            metricas.observar_pdf(funcao.__name__, tamanho)
+            return resultado
+        finally:
+            self.em_andamento -= 1
+            self._vagas.release()
+            self._duracao_media = 0.8 * self._duracao_media + 0.2 * (time.perf_counter() - inicio)
+
+    async def _executar(self, tarefa) -> Resultado:
+        # Requisição perfilada: renderiza aqui, onde o amostrador enxerga o ReportLab
+        if self.workers == 0 or perfil.ativo():
+            # de_worker ainda na thread: se a requisição for cancelada, o
+            # resultado descartado apaga o temporário sozinho
+            return await run_in_threadpool(lambda: de_worker(renderizar_em_spool(*tarefa)))
+        executor = self._obter_executor()
+        try:
+            futuro = executor.submit(renderizar_em_spool, *tarefa)
+            try:
+                return de_worker(await asyncio.wrap_future(futuro))
+            except asyncio.CancelledError:
+                # Cliente desistiu com o PDF em andamento: o temporário não fica para trás
+                futuro.add_done_callback(descartar_retorno)
+                raise
+        except BrokenProcessPool:
+            # Worker morreu (ex.: OOM): recria o pool para as próximas requisições
+            self._descartar_executor(executor)
+            raise
+
+    def encerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def estatisticas(self):
+        return {
+            "workers": self.workers,
+            "limite_fila": self.limite,
+            "em_andamento": self.em_andamento,
+            "recusados": self.recusados,
+            "duracao_media_s": round(self._duracao_media, 3),
+        }
+
+
+# Instância única (o executor só é criado no primeiro PDF)
+pool_pdf = PoolPDF()
@@ -0,0 +1,60 @@
+# utils/referencias.py
+"""
+Forma compacta das seções do relatório combinado. Em vez da tabela inteira,
+o front manda a versão do dataset (meta.versao ou header X-RiskWise-Versao
+de /dados) e só as linhas que tocou,
+no mesmo formato de overrides de /calcular:
+
+    {"versao": "<token>", "overrides": {"<linha>": {"<coluna>": valor, ...}}}
+
+Cada rota junta isso com a sua cópia do dataset (dataset_cache) e monta as
+mesmas linhas que o front montaria; as colunas calculadas vêm de
+utils/calculos.py só para as linhas pedidas.
+"""
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException
+
+Overrides = Dict[str, Dict[str, Any]]
+
+
+def e_referencia(secao: Any) -> bool:
+    return isinstance(secao, dict) and ("overrides" in secao or "versao" in secao)
+
+
+def ler(secao: Dict[str, Any], nome: str) -> Tuple[str, Overrides]:
+    """(versao, overrides) da seção `nome`; 400 se o formato não for o esperado."""
+    versao = secao.get("versao")
+    overrides = secao.get("overrides") or {}
+    # Sem a versão as posições poderiam casar com outro dataset sem aviso
+    if not isinstance(versao, str) or not versao:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{nome}.versao' é obrigatório: use meta.versao (ou o header X-RiskWise-Versao) de /dados.",
+        )
+    if not isinstance(overrides, dict) or not all(isinstance(v, dict) for v in overrides.values()):
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{nome}.overrides' deve ser um objeto {{linha: {{coluna: valor}}}}.",
+        )
+    return versao, overrides
+
+
+def conferir_versao(entrada, versao: str):
+    # As linhas são posições: com outra versão do dataset apontariam para outros registros
+    if versao != entrada.token:
+        raise HTTPException(status_code=409, detail="O dataset mudou desde a leitura; recarregue os dados.")
+
+
+def por_linha(overrides: Overrides, total: int) -> Dict[int, Dict[str, Any]]:
+    """{posição: valores} na ordem do dataset (ValueError para linha inválida)."""
+    saida = {}
+    for chave, valores in overrides.items():
+        try:
+            linha = int(chave)
+        except (TypeError, ValueError):
+            raise ValueError(f"Linha inválida: {chave!r}")
+        if not 0 <= linha < total:
+            raise ValueError(f"Linha fora do intervalo: {linha}")
+        saida[linha] = valores
+    return dict(sorted(saida.items()))
@@ -4,11 +4,25 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
 
+from utils.secoes_relatorio import (
+    COLUNAS_ACUTE, COLUNAS_CHRONIC, COLUNAS_WATER, COLUNAS_WATER_CHRONIC, COLUNAS_MEXICO,
+    CABECALHO_MEXICO_RESULTADOS, flags, ida_ou_traco, linha_mexico_resultados, linhas_pof, valores,
+)
+
+# Tabelas grandes saem em blocos deste tamanho (cada um com o cabeçalho).
+# Uma Table de milhares de linhas é medida e re-dividida a cada quebra de
+# página, o que deixa o build quadrático; blocos de ~1 página mantêm linear.
+LINHAS_POR_TABELA = 60
 
 # --------- estilos e utilidades ----------
+# Estilos e cabeçalhos são montados uma vez por processo (os workers do
+# pool_pdf já os criam no aquecimento) e compartilhados entre os PDFs.
+@lru_cache(maxsize=None)
 def _estilos():
     estilos = getSampleStyleSheet()
     if "CustomTitle" not in estilos:
@@ -24,12 +38,14 @@ def _estilos():
     )
     return estilos, header_style
 
+@lru_cache(maxsize=None)
 def _table_style(header_bg="#4CAF50"):
     return TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(header_bg)),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
         ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('LEADING', (0, 0), (-1, 0), 17),
         ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
         ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
         ('ALIGN', (0, 1), (3, -1), 'LEFT'),
@@ -45,50 +61,67 @@ def _doc():
     return dict(pagesize=A2, leftMargin=30*mm, rightMargin=30*mm, topMargin=30*mm, bottomMargin=30*mm)
 
 
-# --------- POF ----------
-def _pof_table(pof_dict):
+def _quebrar(titulo, largura):
+    """Quebra o título por palavras para caber na coluna (o que o Paragraph fazia)."""
+    util = largura - 12  # padding padrão de 6 pt de cada lado
+    linhas = []
+    for parte in titulo.split("\n"):
+        atual = ""
+        for palavra in parte.split():
+            teste = f"{atual} {palavra}" if atual else palavra
+            if atual and stringWidth(teste, "Helvetica-Bold", 14) > util:
+                linhas.append(atual)
+                atual = palavra
+            else:
+                atual = teste
+        linhas.append(atual)
+    return "\n".join(linhas)
+
+@lru_cache(maxsize=None)
+def _cabecalho(colunas):
+    """Linha de cabeçalho (texto puro) e larguras de uma especificação de colunas."""
+    return [_quebrar(titulo, largura) for titulo, _, largura in colunas], [largura for _, _, largura in colunas]
+
+def _linhas(colunas, dados):
+    return [valores(colunas, item) for item in dados or []]
+
+def _tabelas(colunas, linhas, header_bg):
     """
-    pof_dict esperado:
-    {
-      "PC_Kg": {...},
-      "%IDA_ANVISA": {...},
-      "%IDA_SYNGENTA": {...}
-    }
+    Uma Table por bloco de LINHAS_POR_TABELA linhas, cada uma com o
+    cabeçalho; em sequência, sem espaço entre elas, formam uma tabela só.
     """
+    cabecalho, col_widths = _cabecalho(colunas)
+    estilo = _table_style(header_bg)
+    tabelas = []
+    for inicio in range(0, max(len(linhas), 1), LINHAS_POR_TABELA):
+        tabela = Table([cabecalho] + linhas[inicio:inicio + LINHAS_POR_TABELA], colWidths=col_widths, repeatRows=1)
+        tabela.setStyle(estilo)
+        tabelas.append(tabela)
+    return tabelas
+
+
+# --------- POF ----------
+def _pof_table(pof_dict):
+    table = Table(linhas_pof(pof_dict), colWidths=[100] + [80]*6, repeatRows=1)
+    table.setStyle(_pof_style())
+    return table
 
-    regioes = ["Brasil", "Centro-Oeste", "Nordeste", "Norte", "Sudeste", "Sul"]
-
-    def _get_region(d, metrica, reg, default="—"):
-        obj = (d or {}).get(metrica) or {}
-        if reg in obj:
-            return obj.get(reg)
-        if reg == "Centro-Oeste":
-            # tenta variação com underline
-            return obj.get("Centro_Oeste", default)
-        return default
-
-    linhas = [
-        ["Métrica"] + regioes,
-        ["PC (Kg)"]     + [_get_region(pof_dict, "PC_Kg", r)         for r in regioes],
-        ["IDA_EXTERNA"] + [_get_region(pof_dict, "%IDA_ANVISA", r)   for r in regioes],
-        ["IDA_INTERNA"] + [_get_region(pof_dict, "%IDA_SYNGENTA", r) for r in regioes],
-    ]
-    table = Table(linhas, colWidths=[100] + [80]*6, repeatRows=1)
-    table.setStyle(TableStyle([
+@lru_cache(maxsize=None)
+def _pof_style():
+    return TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#455A64")),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
         ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
-    ]))
-    return table
+    ])
 
 
 # --------- Acute (seção) ----------
 
 def _acute_section(drfa_externo, drfa_interno, dados):
-    estilos, header_style = _estilos()
+    estilos, _ = _estilos()
     elementos = []
 
     elementos.append(Paragraph("Acute Diet Calculator", estilos["CustomTitle"]))
@@ -101,45 +134,14 @@ def _acute_section(drfa_externo, drfa_interno, dados):
     elementos.append(Paragraph(info_text, estilos["CustomInfo"]))
     elementos.append(Spacer(1, 20))
 
-    cabecalho = [
-        Paragraph("Cultivo", header_style),
-        Paragraph("ANO<br/>POF", header_style),
-        Paragraph("Região", header_style),
-        Paragraph("Caso<br/>Fórmula", header_style),
-        Paragraph("LMR<br/>(mg/kg)", header_style),
-        Paragraph("HR/MCR", header_style),
-        Paragraph("MREC/STMR", header_style),
-        Paragraph("IMEA", header_style),
-        Paragraph("%DRFA<br/>Externo", header_style),
-        Paragraph("%DRFA<br/>Interno", header_style)
-    ]
-
-    linhas = [cabecalho]
-    for item in dados or []:
-        linhas.append([
-            item.get("Cultivo/ Matriz Animal", "-"),
-            item.get("ANO POF", "-"),
-            item.get("Região", "-"),
-            item.get("Caso Fórmula", "-"),
-            item.get("LMR (mg/kg)", "-"),
-            item.get("HR/MCR (mg/kg)", "-"),
-            item.get("MREC/STMR (mg/kg)", "-"),
-            item.get("IMEA (mg/kg p.c./dia)", "-"),
-            item.get("%DRFA ANVISA", "-"),
-            item.get("%DRFA SYNGENTA", "-"),
-        ])
-
-    col_widths = [120, 60, 90, 80, 70, 70, 70, 150, 100, 100]
-    tabela = Table(linhas, colWidths=col_widths, repeatRows=1)
-    tabela.setStyle(_table_style("#4CAF50"))
-    elementos.append(tabela)
+    elementos.extend(_tabelas(COLUNAS_ACUTE, _linhas(COLUNAS_ACUTE, dados), "#4CAF50"))
     return elementos
 
 
 # --------- Chronic (seção) ----------
 
 def _chronic_section(ida_externo, ida_interno, chronic_rows, pof2008=None, pof2017=None):
-    estilos, header_style = _estilos()
+    estilos, _ = _estilos()
     elementos = []
 
     elementos.append(Paragraph("Chronic DRA Calculator", estilos["CustomTitle"]))
@@ -151,34 +153,7 @@ def _chronic_section(ida_externo, ida_interno, chronic_rows, pof2008=None, pof20
     elementos.append(Paragraph(info_text, estilos["CustomInfo"]))
     elementos.append(Spacer(1, 20))
 
-    cabecalho = [
-        Paragraph("Cultivo", header_style),
-        Paragraph("ANO<br/>POF", header_style),
-        Paragraph("Região", header_style),
-        Paragraph("LMR<br/>(mg/kg)", header_style),
-        Paragraph("MREC_STMR<br/>(mg/kg)", header_style),
-        Paragraph("Market<br/>Share (%)", header_style),
-        Paragraph("IDMT<br/>(%)", header_style),
-        Paragraph("Contribuição<br/>Individual (%)", header_style),
-    ]
-
-    linhas = [cabecalho]
-    for item in chronic_rows or []:
-        linhas.append([
-            item.get("Cultivo", "-"),
-            item.get("ANO_POF", "-"),
-            item.get("Região", "-"),
-            item.get("LMR (mg_kg)", item.get("LMR (mg/kg)", "-")),
-            item.get("MREC_STMR (mg_kg)", item.get("MREC_STMR (mg/kg)", "-")),
-            item.get("Market Share (%)", item.get("Market Share", "-")),
-            item.get("IDMT (%)", item.get("IDMT (Numerador)", "-")),
-            item.get("Contribuição Individual do Cultivo (%)", item.get("Contribuição Individual do Cultivo", "-")),
-        ])
-
-    col_widths = [150, 60, 90, 90, 110, 120, 160, 170]
-    tabela = Table(linhas, colWidths=col_widths, repeatRows=1)
-    tabela.setStyle(_table_style("#1976D2"))
-    elementos.append(tabela)
+    elementos.extend(_tabelas(COLUNAS_CHRONIC, _linhas(COLUNAS_CHRONIC, chronic_rows), "#1976D2"))
     elementos.append(Spacer(1, 24))
 
     if pof2008:
@@ -196,7 +171,7 @@ def _chronic_section(ida_externo, ida_interno, chronic_rows, pof2008=None, pof20
 # --------- Water Acute (seção) ----------
 
 def _water_section(water_data):
-    estilos, header_style = _estilos()
+    estilos, _ = _estilos()
     elems = []
     elems.append(Paragraph("Water Acute Calculator", estilos["CustomTitle"]))
 
@@ -209,32 +184,11 @@ def _water_section(water_data):
     ))
     elems.append(Spacer(1, 12))
 
-    cabecalho = [
-        Paragraph("Concentração", header_style),
-        Paragraph("Peso Adulto", header_style),
-        Paragraph("Peso Criança", header_style),
-        Paragraph("%DRFA Interno Adulto", header_style),
-        Paragraph("%DRFA Externo Adulto", header_style),
-        Paragraph("%DRFA Interno Criança", header_style),
-        Paragraph("%DRFA Externo Criança", header_style)
-    ]
-    linha_dados = [
-        water_data.get("Concentração", "-"),
-        water_data.get("Peso Adulto", "-"),
-        water_data.get("Peso Criança", "-"),
-        water_data.get("%DRFA Interno Adulto", "-"),
-        water_data.get("%DRFA Externo Adulto", "-"),
-        water_data.get("%DRFA Interno Criança", "-"),
-        water_data.get("%DRFA Externo Criança", "-")
-    ]
-
-    tabela = Table([cabecalho, linha_dados], colWidths=[100, 100, 100, 120, 120, 120, 120], repeatRows=1)
-    tabela.setStyle(_table_style("#009688"))
-    elems.append(tabela)
+    elems.extend(_tabelas(COLUNAS_WATER, _linhas(COLUNAS_WATER, [water_data]), "#009688"))
     return elems
 
 def _water_chronic_section(water_chr_data):
-    estilos, header_style = _estilos()
+    estilos, _ = _estilos()
     elems = []
     elems.append(Paragraph("Water Chronic Calculator", estilos["CustomTitle"]))
 
@@ -246,71 +200,22 @@ def _water_chronic_section(water_chr_data):
     ))
     elems.append(Spacer(1, 12))
 
-    cabecalho = [
-        Paragraph("Concentração", header_style),
-        Paragraph("Peso Adulto", header_style),
-        Paragraph("Peso Criança", header_style),
-        Paragraph("%IDA Interno Adulto", header_style),
-        Paragraph("%IDA Externo Adulto", header_style),
-        Paragraph("%IDA Interno Criança", header_style),
-        Paragraph("%IDA Externo Criança", header_style)
-    ]
-    linha_dados = [
-        water_chr_data.get("Concentração", "-"),
-        water_chr_data.get("Peso Adulto", "-"),
-        water_chr_data.get("Peso Criança", "-"),
-        water_chr_data.get("%IDA Interno Adulto", "-"),
-        water_chr_data.get("%IDA Externo Adulto", "-"),
-        water_chr_data.get("%IDA Interno Criança", "-"),
-        water_chr_data.get("%IDA Externo Criança", "-")
-    ]
-
-    tabela = Table([cabecalho, linha_dados], colWidths=[100, 100, 100, 120, 120, 120, 120], repeatRows=1)
-    tabela.setStyle(_table_style("#3F51B5"))  # cor diferente para crônico
-    elems.append(tabela)
+    # cor diferente para crônico
+    elems.extend(_tabelas(COLUNAS_WATER_CHRONIC, _linhas(COLUNAS_WATER_CHRONIC, [water_chr_data]), "#3F51B5"))
     return elems
 
 
 def _mexico_chronic_section(mexico_data, mexico_results):
-    estilos, header_style = _estilos()
+    estilos, _ = _estilos()
     elems = []
     elems.append(Paragraph("Mexico Chronic Calculator", estilos["CustomTitle"]))
 
     # Tabela principal
-    cabecalho = [
-        Paragraph("Crop", header_style),
-        Paragraph("Cultivo", header_style),
-        Paragraph("LMR (mg/kg)", header_style),
-        Paragraph("R (mg/kg)", header_style),
-        Paragraph("C (Kg/person/day)", header_style),
-        Paragraph("(LMR or R)*C", header_style)
-    ]
-    linhas = [cabecalho]
-    for item in mexico_data or []:
-        linhas.append([
-            item.get("Crop", "-"),
-            item.get("Cultivo", "-"),
-            item.get("LMR (mg/kg)", "-"),
-            item.get("R (mg/kg)", "-"),
-            item.get("C (Kg/person/day)", "-"),
-            item.get("(LMR or R)*C", "-")
-        ])
-    tabela = Table(linhas, colWidths=[120, 120, 120, 120, 120, 120], repeatRows=1)
-    tabela.setStyle(_table_style("#F08C1B"))
-    elems.append(tabela)
+    elems.extend(_tabelas(COLUNAS_MEXICO, _linhas(COLUNAS_MEXICO, mexico_data), "#F08C1B"))
     elems.append(Spacer(1, 16))
 
     # Resultados consolidados
-    resultados = [
-        ["BW (kg)", "Sum", "ADI (mg/kg bw/dia)", "IDMT", "%ADI"],
-        [
-            mexico_results.get("bw", "-"),
-            mexico_results.get("sum", "-"),
-            mexico_results.get("adi", "-"),
-            mexico_results.get("idmt", "-"),
-            mexico_results.get("percentAdi", "-")
-        ]
-    ]
+    resultados = [CABECALHO_MEXICO_RESULTADOS, linha_mexico_resultados(mexico_results)]
     tabela_resultados = Table(resultados, colWidths=[80, 180, 160, 180, 180])
     tabela_resultados.setStyle(_table_style("#F08F21"))
     elems.append(tabela_resultados)
@@ -319,26 +224,24 @@ def _mexico_chronic_section(mexico_data, mexico_results):
 
 
 # --------- APIs de geração (bytes) ----------
+# Todas aceitam `destino` (objeto com write): o PDF é escrito nele e nada é
+# retornado. Sem destino, devolvem os bytes (ver utils/spool_pdf.py).
+def _construir(elementos, destino=None):
+    saida = destino if destino is not None else BytesIO()
+    SimpleDocTemplate(saida, **_doc()).build(elementos)
+    if destino is None:
+        return saida.getvalue()
+
 # Mantém compatibilidade com /acute/gerar-pdf
-def gerar_pdf_bytes(drfa_externo, drfa_interno, dados):
+def gerar_pdf_bytes(drfa_externo, drfa_interno, dados, destino=None):
     """Wrapper histórico: gera apenas a seção Acute."""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, **_doc())
-    elementos = _acute_section(drfa_externo, drfa_interno, dados)
-    doc.build(elementos)
-    buffer.seek(0)
-    return buffer.read()
+    return _construir(_acute_section(drfa_externo, drfa_interno, dados), destino)
 
-def gerar_pdf_acute_bytes(drfa_externo, drfa_interno, dados):
-    return gerar_pdf_bytes(drfa_externo, drfa_interno, dados)
+def gerar_pdf_acute_bytes(drfa_externo, drfa_interno, dados, destino=None):
+    return gerar_pdf_bytes(drfa_externo, drfa_interno, dados, destino)
 
-def gerar_pdf_chronic_bytes(ida_externo, ida_interno, chronic_rows, pof2008=None, pof2017=None):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, **_doc())
-    elementos = _chronic_section(ida_externo, ida_interno, chronic_rows, pof2008, pof2017)
-    doc.build(elementos)
-    buffer.seek(0)
-    return buffer.read()
+def gerar_pdf_chronic_bytes(ida_externo, ida_interno, chronic_rows, pof2008=None, pof2017=None, destino=None):
+    return _construir(_chronic_section(ida_externo, ida_interno, chronic_rows, pof2008, pof2017), destino)
 
 
 def gerar_pdf_combinado(
@@ -348,25 +251,23 @@ def gerar_pdf_combinado(
     pof2008=None, pof2017=None,
     water_data=None, water_chronic_data=None,
     incluir_water_acute=False, incluir_water_chronic=False,
-    mexico=None
+    mexico=None,
+    destino=None
 ):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, **_doc())
     elementos = []
 
-    # ---- Gates/flags
-    temAcute = bool(acute_rows and len(acute_rows) > 0)
-    temChronic = bool(chronic_rows and len(chronic_rows) > 0)
-    temWaterAcute = bool(incluir_water_acute)
-    temWaterChronic = bool(incluir_water_chronic)
-    temMexico = bool(mexico and isinstance(mexico.get("data"), list) and len(mexico["data"]) > 0)
+    # ---- Gates/flags (mesmas regras da exportação, ver utils/secoes_relatorio.py)
+    tem = flags(acute_rows, chronic_rows, incluir_water_acute, incluir_water_chronic, mexico)
+    temAcute = tem["acute"]
+    temChronic = tem["chronic"]
+    temWaterAcute = tem["water_acute"]
+    temWaterChronic = tem["water_chronic"]
+    temMexico = tem["mexico"]
 
     if not (temAcute or temChronic or temWaterAcute or temWaterChronic or temMexico):
         estilos, _ = _estilos()
         elementos.append(Paragraph("Nenhum dado para gerar relatório.", estilos["Title"]))
-        doc.build(elementos)
-        buffer.seek(0)
-        return buffer.read()
+        return _construir(elementos, destino)
 
     # ---- Acute
     if temAcute:
@@ -376,9 +277,9 @@ def gerar_pdf_combinado(
 
     # ---- Chronic
     if temChronic:
-        ida_ext = chronic_ida_externo if (chronic_ida_externo not in (None, "")) else "-"
-        ida_int = chronic_ida_interno if (chronic_ida_interno not in (None, "")) else "-"
-        elementos.extend(_chronic_section(ida_ext, ida_int, chronic_rows, pof2008, pof2017))
+        elementos.extend(_chronic_section(
+            ida_ou_traco(chronic_ida_externo), ida_ou_traco(chronic_ida_interno), chronic_rows, pof2008, pof2017
+        ))
         if temWaterChronic or temWaterAcute or temMexico:
             elementos.append(PageBreak())
 
@@ -398,6 +299,4 @@ def gerar_pdf_combinado(
     if temMexico:
         elementos.extend(_mexico_chronic_section(mexico["data"], mexico.get("results", {})))
 
-    doc.build(elementos)
-    buffer.seek(0)
-    return buffer.read()
\ No newline at end of file
+    return _construir(elementos, destino)
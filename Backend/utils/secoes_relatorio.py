@@ -0,0 +1,189 @@
+# utils/secoes_relatorio.py
+"""
+Conteúdo das seções do relatório combinado, sem dependência de ReportLab.
+
+O PDF (utils/report.py) e a exportação em planilha/CSV (utils/exportacao.py)
+partem daqui, para as duas saídas terem as mesmas seções, colunas e regras
+de inclusão.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# Especificação das colunas de cada seção: (título, chaves do registro em
+# ordem de preferência, largura no PDF). "\n" no título quebra a linha no PDF.
+COLUNAS_ACUTE = (
+    ("Cultivo", ("Cultivo/ Matriz Animal",), 120),
+    ("ANO\nPOF", ("ANO POF",), 60),
+    ("Região", ("Região",), 90),
+    ("Caso\nFórmula", ("Caso Fórmula",), 80),
+    ("LMR\n(mg/kg)", ("LMR (mg/kg)",), 70),
+    ("HR/MCR", ("HR/MCR (mg/kg)",), 70),
+    ("MREC/STMR", ("MREC/STMR (mg/kg)",), 70),
+    ("IMEA", ("IMEA (mg/kg p.c./dia)",), 150),
+    ("%DRFA\nExterno", ("%DRFA ANVISA",), 100),
+    ("%DRFA\nInterno", ("%DRFA SYNGENTA",), 100),
+)
+
+COLUNAS_CHRONIC = (
+    ("Cultivo", ("Cultivo",), 150),
+    ("ANO\nPOF", ("ANO_POF",), 60),
+    ("Região", ("Região",), 90),
+    ("LMR\n(mg/kg)", ("LMR (mg_kg)", "LMR (mg/kg)"), 90),
+    ("MREC_STMR\n(mg/kg)", ("MREC_STMR (mg_kg)", "MREC_STMR (mg/kg)"), 110),
+    ("Market\nShare (%)", ("Market Share (%)", "Market Share"), 120),
+    ("IDMT\n(%)", ("IDMT (%)", "IDMT (Numerador)"), 160),
+    ("Contribuição\nIndividual (%)",
+     ("Contribuição Individual do Cultivo (%)", "Contribuição Individual do Cultivo"), 170),
+)
+
+COLUNAS_WATER = (
+    ("Concentração", ("Concentração",), 100),
+    ("Peso Adulto", ("Peso Adulto",), 100),
+    ("Peso Criança", ("Peso Criança",), 100),
+    ("%DRFA Interno Adulto", ("%DRFA Interno Adulto",), 120),
+    ("%DRFA Externo Adulto", ("%DRFA Externo Adulto",), 120),
+    ("%DRFA Interno Criança", ("%DRFA Interno Criança",), 120),
+    ("%DRFA Externo Criança", ("%DRFA Externo Criança",), 120),
+)
+
+COLUNAS_WATER_CHRONIC = (
+    ("Concentração", ("Concentração",), 100),
+    ("Peso Adulto", ("Peso Adulto",), 100),
+    ("Peso Criança", ("Peso Criança",), 100),
+    ("%IDA Interno Adulto", ("%IDA Interno Adulto",), 120),
+    ("%IDA Externo Adulto", ("%IDA Externo Adulto",), 120),
+    ("%IDA Interno Criança", ("%IDA Interno Criança",), 120),
+    ("%IDA Externo Criança", ("%IDA Externo Criança",), 120),
+)
+
+COLUNAS_MEXICO = (
+    ("Crop", ("Crop",), 120),
+    ("Cultivo", ("Cultivo",), 120),
+    ("LMR (mg/kg)", ("LMR (mg/kg)",), 120),
+    ("R (mg/kg)", ("R (mg/kg)",), 120),
+    ("C (Kg/person/day)", ("C (Kg/person/day)",), 120),
+    ("(LMR or R)*C", ("(LMR or R)*C",), 120),
+)
+
+CABECALHO_MEXICO_RESULTADOS = ["BW (kg)", "Sum", "ADI (mg/kg bw/dia)", "IDMT", "%ADI"]
+CHAVES_MEXICO_RESULTADOS = ("bw", "sum", "adi", "idmt", "percentAdi")
+
+REGIOES_POF = ["Brasil", "Centro-Oeste", "Nordeste", "Norte", "Sudeste", "Sul"]
+
+
+def valor(item: Dict[str, Any], chaves) -> Any:
+    # Primeira chave presente no registro (mesmo que o valor seja None), senão "-"
+    for chave in chaves:
+        if chave in item:
+            return item[chave]
+    return "-"
+
+
+def valores(colunas, item: Dict[str, Any]) -> List[Any]:
+    return [valor(item, chaves) for _, chaves, _ in colunas]
+
+
+def titulos(colunas) -> List[str]:
+    """Títulos das colunas numa linha só (para planilha/CSV)."""
+    return [titulo.replace("\n", " ") for titulo, _, _ in colunas]
+
+
+def linhas_pof(pof_dict: Optional[Dict[str, Any]]) -> List[List[Any]]:
+    """
+    Tabela Métrica × região de um POF:
+    {"PC_Kg": {...}, "%IDA_ANVISA": {...}, "%IDA_SYNGENTA": {...}}
+    """
+
+    def _get_region(d, metrica, reg, default="—"):
+        obj = (d or {}).get(metrica) or {}
+        if reg in obj:
+            return obj.get(reg)
+        if reg == "Centro-Oeste":
+            # tenta variação com underline
+            return obj.get("Centro_Oeste", default)
+        return default
+
+    return [
+        ["Métrica"] + REGIOES_POF,
+        ["PC (Kg)"]     + [_get_region(pof_dict, "PC_Kg", r)         for r in REGIOES_POF],
+        ["IDA_EXTERNA"] + [_get_region(pof_dict, "%IDA_ANVISA", r)   for r in REGIOES_POF],
+        ["IDA_INTERNA"] + [_get_region(pof_dict, "%IDA_SYNGENTA", r) for r in REGIOES_POF],
+    ]
+
+
+def linha_mexico_resultados(mexico_results: Dict[str, Any]) -> List[Any]:
+    return [mexico_results.get(k, "-") for k in CHAVES_MEXICO_RESULTADOS]
+
+
+def flags(
+    acute_rows=None, chronic_rows=None,
+    incluir_water_acute=False, incluir_water_chronic=False,
+    mexico=None, **_
+) -> Dict[str, bool]:
+    """Quais seções entram no relatório (mesmas regras para PDF e exportação)."""
+    return {
+        "acute": bool(acute_rows and len(acute_rows) > 0),
+        "chronic": bool(chronic_rows and len(chronic_rows) > 0),
+        "water_acute": bool(incluir_water_acute),
+        "water_chronic": bool(incluir_water_chronic),
+        "mexico": bool(mexico and isinstance(mexico.get("data"), list) and len(mexico["data"]) > 0),
+    }
+
+
+def ida_ou_traco(valor_ida: Any) -> Any:
+    return valor_ida if valor_ida not in (None, "") else "-"
+
+
+class Secao(NamedTuple):
+    nome: str                   # identificador (aba da planilha / arquivo CSV)
+    cabecalho: List[str]
+    linhas: Iterable[List[Any]]
+
+
+def secoes(
+    acute_drfa_externo=None, acute_drfa_interno=None,
+    chronic_ida_externo=None, chronic_ida_interno=None,
+    acute_rows=None, chronic_rows=None,
+    pof2008=None, pof2017=None,
+    water_data=None, water_chronic_data=None,
+    incluir_water_acute=False, incluir_water_chronic=False,
+    mexico=None,
+) -> Iterator[Secao]:
+    """
+    Seções tabulares do relatório, na ordem do PDF, a partir dos mesmos
+    argumentos de gerar_pdf_combinado. As linhas são geradas sob demanda.
+    Os parâmetros (DRFA/IDA) de cada seção incluída vão na seção "Parametros".
+    """
+    tem = flags(acute_rows, chronic_rows, incluir_water_acute, incluir_water_chronic, mexico)
+    water_data = water_data or {}
+    water_chronic_data = water_chronic_data or {}
+
+    parametros = []
+    if tem["acute"]:
+        parametros += [["Acute", "DRFA Externo", acute_drfa_externo], ["Acute", "DRFA Interno", acute_drfa_interno]]
+    if tem["chronic"]:
+        parametros += [["Chronic", "IDA Externo", ida_ou_traco(chronic_ida_externo)],
+                       ["Chronic", "IDA Interno", ida_ou_traco(chronic_ida_interno)]]
+    if tem["water_chronic"]:
+        parametros += [["Water Chronic", "IDA Externo", water_chronic_data.get("IDA Externo", "-")],
+                       ["Water Chronic", "IDA Interno", water_chronic_data.get("IDA Interno", "-")]]
+    if tem["water_acute"]:
+        parametros += [["Water Acute", "DRFA Externo", water_data.get("DRFA Externo", "-")],
+                       ["Water Acute", "DRFA Interno", water_data.get("DRFA Interno", "-")]]
+    yield Secao("Parametros", ["Seção", "Parâmetro", "Valor"], parametros)
+
+    if tem["acute"]:
+        yield Secao("Acute", titulos(COLUNAS_ACUTE), (valores(COLUNAS_ACUTE, item) for item in acute_rows))
+    if tem["chronic"]:
+        yield Secao("Chronic", titulos(COLUNAS_CHRONIC), (valores(COLUNAS_CHRONIC, item) for item in chronic_rows))
+        for nome, pof in (("POF 2008", pof2008), ("POF 2017", pof2017)):
+            if pof:
+                cabecalho, *linhas = linhas_pof(pof)
+                yield Secao(nome, cabecalho, linhas)
+    if tem["water_chronic"]:
+        yield Secao("Water Chronic", titulos(COLUNAS_WATER_CHRONIC), [valores(COLUNAS_WATER_CHRONIC, water_chronic_data)])
+    if tem["water_acute"]:
+        yield Secao("Water Acute", titulos(COLUNAS_WATER), [valores(COLUNAS_WATER, water_data)])
+    if tem["mexico"]:
+        yield Secao("Mexico", titulos(COLUNAS_MEXICO), (valores(COLUNAS_MEXICO, item) for item in mexico["data"]))
+        yield Secao("Mexico Resultados", CABECALHO_MEXICO_RESULTADOS,
+                    [linha_mexico_resultados(mexico.get("results", {}))])
@@ -0,0 +1,78 @@
+# utils/serializacao.py
+"""
+Serialização JSON dos datasets.
+
+Usa orjson quando instalado (codificador nativo, serializa arrays numpy
+direto e já escreve NaN/inf como null); sem ele cai no json da stdlib,
+limpando os não finitos antes. O formato colunar (`format=columnar`) manda
+uma lista por coluna em vez de repetir o nome das colunas em cada registro.
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+from utils import metricas
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+FORMATOS = ("registros", "columnar")
+# Validação do ?format= das rotas /dados
+PADRAO_FORMATO = f"^({'|'.join(FORMATOS)})$"
+
+
+def dumps(conteudo: Any) -> bytes:
+    """JSON compacto em UTF-8; NaN/inf viram null."""
+    with metricas.etapa("serializacao", codificador="orjson" if orjson is not None else "json"):
+        if orjson is not None:
+            return orjson.dumps(conteudo, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(
+            _sem_nao_finitos(conteudo),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+def _sem_nao_finitos(obj: Any) -> Any:
+    # Caminho sem orjson: arrays viram listas e NaN/inf viram None
+    if isinstance(obj, np.ndarray):
+        obj = obj.tolist()
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _sem_nao_finitos(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sem_nao_finitos(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return _sem_nao_finitos(obj.item())
+    return obj
+
+
+def _coluna(serie: pd.Series):
+    kind = serie.dtype.kind
+    if kind in "iub":
+        return serie.to_numpy()
+    if kind == "f":
+        return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    valores = serie.to_numpy(dtype=object)
+    # Colunas object só com float/None (efeito do replace de NaN nas rotas)
+    # voltam a ser float64 e vão vetorizadas para o codificador
+    if pd.api.types.infer_dtype(valores, skipna=True) == "floating":
+        return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    return [None if v is None or v is pd.NA or (isinstance(v, float) and not math.isfinite(v)) else v
+            for v in valores.tolist()]
+
+
+def colunar(df: pd.DataFrame) -> Dict[str, Any]:
+    """{"colunas": [...], "dados": {coluna: valores}} a partir do DataFrame."""
+    colunas: List[str] = list(df.columns)
+    return {"colunas": colunas, "dados": {c: _coluna(df[c]) for c in colunas}}
@@ -0,0 +1,161 @@
+# utils/snapshot.py
+"""
+Snapshot colunar das planilhas de Backend/data.
+
+Para cada .xlsx é gerado um diretório data/snapshot/<nome>/ com:
+  - manifest.json: sha256 do .xlsx de origem, esquema usado na validação,
+    colunas/dtypes, tabela de strings das colunas de texto e extras
+    (ex.: metadados do México);
+  - um .npy por coluna (valores numéricos ou códigos int32 da tabela de strings).
+
+Os .npy são abertos com mmap, então carregar o snapshot custa milissegundos,
+contra segundos de parsing do openpyxl. O snapshot é usado apenas se o sha256
+do .xlsx e o esquema baterem; caso contrário a rota volta para o .xlsx.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+SNAPSHOT_DIRNAME = "snapshot"
+MANIFEST = "manifest.json"
+FORMATO = 1
+
+
+def _dir_snapshot(xlsx_path: str) -> str:
+    base = os.path.splitext(os.path.basename(xlsx_path))[0]
+    return os.path.join(os.path.dirname(xlsx_path), SNAPSHOT_DIRNAME, base)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _escrita_permitida() -> bool:
+    # Mesmo critério das rotas /atualizar: o deploy é read-only
+    return not (os.environ.get("VERCEL") or os.environ.get("VERCEL_ENV"))
+
+
+def _nativo(v: Any) -> Any:
+    """Converte escalares numpy para tipos JSON nativos."""
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and (np.isnan(v) or np.isinf(v)):
+        return None
+    return v
+
+
+def compilar(xlsx_path: str, df: pd.DataFrame, esquema: Dict[str, List[str]], extras: Optional[Dict] = None) -> str:
+    """
+    Grava o snapshot de `df` (já validado pelo esquema da rota) para `xlsx_path`.
+    Retorna o diretório do snapshot.
+    """
+    destino = _dir_snapshot(xlsx_path)
+    os.makedirs(destino, exist_ok=True)
+    sha = _sha256(xlsx_path)
+
+    colunas = []
+    for i, nome in enumerate(df.columns):
+        serie = df[nome]
+        arquivo = f"c{i}_{sha[:12]}.npy"
+        if serie.dtype.kind in "biufM":
+            np.save(os.path.join(destino, arquivo), serie.to_numpy())
+            colunas.append({"nome": nome, "tipo": "numerico", "dtype": str(serie.dtype), "arquivo": arquivo})
+        else:
+            codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+            np.save(os.path.join(destino, arquivo), codigos.astype(np.int32))
+            colunas.append({
+                "nome": nome,
+                "tipo": "texto",
+                "dtype": str(serie.dtype),
+                "arquivo": arquivo,
+                "valores": [_nativo(v) for v in valores.tolist()],
+            })
+
+    manifest = {
+        "formato": FORMATO,
+        "fonte": os.path.basename(xlsx_path),
+        "sha256": sha,
+        "esquema": esquema,
+        "linhas": len(df),
+        "colunas": colunas,
+        "extras": {k: _nativo(v) for k, v in (extras or {}).items()},
+    }
+
+    # manifest por último e com replace atômico: um leitor concorrente
+    # vê o snapshot antigo inteiro ou o novo inteiro
+    tmp = os.path.join(destino, f".{MANIFEST}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(destino, MANIFEST))
+
+    ativos = {c["arquivo"] for c in colunas} | {MANIFEST}
+    for nome in os.listdir(destino):
+        if nome.endswith(".npy") and nome not in ativos:
+            try:
+                os.remove(os.path.join(destino, nome))
+            except OSError:
+                pass
+    return destino
+
+
+def carregar(xlsx_path: str, esquema: Dict[str, List[str]]) -> Optional[Tuple[pd.DataFrame, Dict]]:
+    """
+    Retorna (DataFrame, extras) a partir do snapshot, ou None se ele não
+    existir, estiver desatualizado em relação ao .xlsx ou ao esquema.
+    """
+    destino = _dir_snapshot(xlsx_path)
+    try:
+        with open(os.path.join(destino, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("formato") != FORMATO or manifest.get("esquema") != esquema:
+        return None
+    try:
+        if manifest.get("sha256") != _sha256(xlsx_path):
+            return None
+    except OSError:
+        return None
+
+    try:
+        dados = {}
+        for col in manifest["colunas"]:
+            arr = np.load(os.path.join(destino, col["arquivo"]), mmap_mode="r")
+            if col["tipo"] == "numerico":
+                dados[col["nome"]] = pd.Series(arr, dtype=col["dtype"])
+            else:
+                tabela = np.empty(len(col["valores"]) + 1, dtype=object)
+                tabela[:-1] = col["valores"]
+                tabela[-1] = np.nan  # código -1 (vazio) cai no último slot
+                dados[col["nome"]] = pd.Series(tabela[arr], dtype=col["dtype"])
+        df = pd.DataFrame(dados, columns=[c["nome"] for c in manifest["colunas"]])
+    except Exception:
+        return None
+
+    if len(df) != manifest.get("linhas"):
+        return None
+    return df, manifest.get("extras") or {}
+
+
+def atualizar_se_possivel(xlsx_path: str, df: pd.DataFrame, esquema: Dict[str, List[str]], extras: Optional[Dict] = None):
+    """Recompila o snapshot após uma leitura do .xlsx, quando o filesystem permite."""
+    if not _escrita_permitida():
+        return
+    try:
+        compilar(xlsx_path, df, esquema, extras)
+    except Exception:
+        # Snapshot é só otimização: falha aqui não derruba a leitura
+        pass
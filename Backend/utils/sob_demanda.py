@@ -0,0 +1,42 @@
+# utils/sob_demanda.py
+"""
+Importação sob demanda das dependências pesadas (pandas, numpy, openpyxl).
+
+O entry point do Vercel (api/index.py) importa Backend.main, que importa
+todas as rotas; com esses imports no topo dos módulos, todo cold start
+pagava pandas/numpy/openpyxl antes de servir até um HTML estático.
+`modulo("pandas")` devolve um objeto que importa o módulo de verdade no
+primeiro acesso a um atributo (pd.DataFrame, np.nan...). Anotações de tipo
+com esses módulos precisam de `from __future__ import annotations`, senão
+são avaliadas ao definir a função e disparam a importação.
+
+O ReportLab não passa por aqui: só utils/report.py o usa, e as rotas
+importam esse módulo dentro dos endpoints de PDF.
+"""
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class _SobDemanda:
+    __slots__ = ("_nome", "_modulo")
+
+    def __init__(self, nome: str):
+        object.__setattr__(self, "_nome", nome)
+        object.__setattr__(self, "_modulo", None)
+
+    def __getattr__(self, atributo: str) -> Any:
+        modulo: Optional[ModuleType] = self._modulo
+        if modulo is None:
+            # import_module usa o lock de importação: threads concorrentes não importam duas vezes
+            modulo = importlib.import_module(self._nome)
+            object.__setattr__(self, "_modulo", modulo)
+        return getattr(modulo, atributo)
+
+    def __repr__(self) -> str:
+        estado = "carregado" if self._modulo is not None else "não carregado"
+        return f"<módulo sob demanda {self._nome!r} ({estado})>"
+
+
+def modulo(nome: str) -> Any:
+    return _SobDemanda(nome)
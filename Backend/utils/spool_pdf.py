@@ -0,0 +1,157 @@
+# utils/spool_pdf.py
+"""
+Saída dos PDFs com memória limitada.
+
+O gerador escreve num "spool": em memória até RISKWISE_PDF_SPOOL_MB
+(padrão 8) e, acima disso, num arquivo temporário em RISKWISE_PDF_SPOOL_DIR
+(padrão: diretório temporário do sistema). Do worker volta só o caminho do
+arquivo, e a resposta o lê em blocos, com Content-Length. O arquivo
+temporário é apagado quando o último objeto PDFEmDisco que o referencia
+deixa de existir (resposta enviada, cache já copiou para o disco etc.).
+
+O ReportLab monta o documento inteiro uma vez ao salvar e o entrega num
+único write; o que se evita são as cópias seguintes (buffer.read(), pickle
+de volta do worker, BytesIO da resposta) e manter PDFs grandes em memória.
+"""
+import os
+import tempfile
+import weakref
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from fastapi.responses import Response, StreamingResponse
+
+TAMANHO_BLOCO = 64 * 1024
+
+
+def limiar_spool() -> int:
+    try:
+        return max(0, int(os.environ.get("RISKWISE_PDF_SPOOL_MB", 8))) * 1024 * 1024
+    except ValueError:
+        return 8 * 1024 * 1024
+
+
+def diretorio_spool() -> Optional[str]:
+    return os.environ.get("RISKWISE_PDF_SPOOL_DIR") or None
+
+
+def _apagar(caminho: str):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+class PDFEmDisco:
+    """PDF gravado em `caminho`; se temporário, o arquivo some junto com o objeto."""
+
+    def __init__(self, caminho: str, temporario: bool = True):
+        self.caminho = caminho
+        self.tamanho = os.path.getsize(caminho)
+        if temporario:
+            weakref.finalize(self, _apagar, caminho)
+
+
+Resultado = Union[bytes, PDFEmDisco]
+
+
+class Spool:
+    """Destino de escrita: BytesIO até `limiar` bytes, depois arquivo temporário."""
+
+    def __init__(self, limiar: int, diretorio: Optional[str], sufixo: str = ".pdf"):
+        self.limiar = limiar
+        self.diretorio = diretorio
+        self.sufixo = sufixo
+        self._memoria: Optional[BytesIO] = BytesIO()
+        self._arquivo = None
+
+    def write(self, dados) -> int:
+        if self._arquivo is None and self._memoria.tell() + len(dados) > self.limiar:
+            self._arquivo = tempfile.NamedTemporaryFile(
+                prefix="riskwise_", suffix=self.sufixo, dir=self.diretorio, delete=False
+            )
+            self._arquivo.write(self._memoria.getbuffer())
+            self._memoria = None
+        return (self._arquivo or self._memoria).write(dados)
+
+    def flush(self):
+        if self._arquivo is not None:
+            self._arquivo.flush()
+
+    def resultado(self) -> Union[bytes, str]:
+        if self._arquivo is None:
+            return self._memoria.getvalue()
+        self._arquivo.close()
+        return self._arquivo.name
+
+    def descartar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            _apagar(self._arquivo.name)
+
+
+def renderizar_em_spool(
+    funcao: Callable[..., Any],
+    args: Tuple,
+    kwargs: Dict[str, Any],
+    limiar: int,
+    diretorio: Optional[str],
+) -> Union[bytes, str]:
+    """
+    Roda no worker: chama `funcao(*args, destino=spool, **kwargs)` e devolve
+    os bytes (PDF pequeno) ou o caminho do arquivo temporário (picklable).
+    """
+    spool = Spool(limiar, diretorio)
+    try:
+        funcao(*args, destino=spool, **kwargs)
+        return spool.resultado()
+    except BaseException:
+        spool.descartar()
+        raise
+
+
+def de_worker(retorno: Union[bytes, str]) -> Resultado:
+    return PDFEmDisco(retorno) if isinstance(retorno, str) else retorno
+
+
+def descartar_retorno(futuro):
+    """Callback para um render cujo resultado ninguém vai usar: apaga o temporário."""
+    if not futuro.cancelled() and futuro.exception() is None:
+        de_worker(futuro.result())
+
+
+def tamanho(resultado: Resultado) -> int:
+    return resultado.tamanho if isinstance(resultado, PDFEmDisco) else len(resultado)
+
+
+def _blocos(pdf: PDFEmDisco, arquivo):
+    # `pdf` fica referenciado até o fim do envio: o temporário não é apagado antes
+    try:
+        while True:
+            bloco = arquivo.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            yield bloco
+    finally:
+        arquivo.close()
+        del pdf
+
+
+def resposta_arquivo(
+    resultado: Resultado,
+    nome_arquivo: str,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Resposta de download, com Content-Length; arquivos em disco vão em blocos."""
+    cabecalhos = {"Content-Disposition": f'attachment; filename="{nome_arquivo}"', **(headers or {})}
+    if isinstance(resultado, PDFEmDisco):
+        # Abre já: se o cache podar o arquivo depois disso, o descritor continua válido
+        arquivo = open(resultado.caminho, "rb")
+        cabecalhos["Content-Length"] = str(os.fstat(arquivo.fileno()).st_size)
+        return StreamingResponse(_blocos(resultado, arquivo), media_type=media_type, headers=cabecalhos)
+    return Response(resultado, media_type=media_type, headers=cabecalhos)
+
+
+def resposta_pdf(resultado: Resultado, nome_arquivo: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return resposta_arquivo(resultado, nome_arquivo, "application/pdf", headers)
@@ -0,0 +1,99 @@
+# utils/streaming.py
+"""
+Modo streaming (NDJSON) dos endpoints /dados.
+
+Ativado por `?stream=1` ou `Accept: application/x-ndjson`. A primeira linha
+é um objeto de cabeçalho ({"meta": ...} e agregados do dataset); depois vem
+uma linha por registro. Os registros são serializados em blocos direto do
+DataFrame, então o primeiro byte sai logo e a memória de pico fica limitada
+ao tamanho do bloco, não ao da tabela.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import math
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from utils.http_cache import CACHE_CONTROL_DADOS, HEADER_VERSAO, _etag_confere
+from utils.sob_demanda import modulo
+
+np = modulo("numpy")
+pd = modulo("pandas")
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+LINHAS_POR_BLOCO = 500
+
+
+def pedido(request: Request, stream: Optional[str]) -> bool:
+    """True se o cliente pediu o modo streaming (query ou Accept)."""
+    if stream is not None:
+        return stream.strip().lower() in ("1", "true", "sim", "yes")
+    return MEDIA_TYPE_NDJSON in request.headers.get("accept", "")
+
+
+def _padrao(valor: Any):
+    # O que o jsonable_encoder trataria e o json puro não
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _limpar(valor: Any) -> Any:
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if valor is pd.NA or valor is pd.NaT:
+        return None
+    return valor
+
+
+def _linha(conteudo: Any) -> bytes:
+    return json.dumps(
+        conteudo,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_padrao,
+    ).encode("utf-8") + b"\n"
+
+
+def _gerar(cabecalho: Dict, df: pd.DataFrame, linhas_por_bloco: int) -> Iterator[bytes]:
+    yield _linha(cabecalho)
+    colunas = list(df.columns)
+    for inicio in range(0, len(df), linhas_por_bloco):
+        bloco = df.iloc[inicio:inicio + linhas_por_bloco]
+        partes = []
+        for valores in bloco.itertuples(index=False, name=None):
+            partes.append(_linha({c: _limpar(v) for c, v in zip(colunas, valores)}))
+        yield b"".join(partes)
+
+
+def resposta_ndjson(
+    request: Request,
+    entrada,
+    df: pd.DataFrame,
+    cabecalho: Dict,
+    linhas_por_bloco: int = LINHAS_POR_BLOCO,
+) -> Response:
+    """
+    StreamingResponse NDJSON de `df`. A ETag vem da versão do dataset e da
+    query, sem precisar serializar o corpo; If-None-Match continua valendo.
+    """
+    chave = f"{entrada.token}|ndjson|{request.url.query}"
+    etag = '"' + hashlib.sha256(chave.encode("utf-8")).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_DADOS, "Vary": "Accept", HEADER_VERSAO: entrada.token}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_confere(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        _gerar(cabecalho, df, linhas_por_bloco),
+        media_type=MEDIA_TYPE_NDJSON,
+        headers=headers,
+    )
@@ -0,0 +1,63 @@
+# utils/zip_fluxo.py
+"""
+ZIP montado enquanto é enviado.
+
+O ZipFile escreve num buffer sem seek (cada entrada leva data descriptor,
+então o tamanho não precisa ser conhecido antes); após cada bloco o buffer
+é esvaziado e os bytes seguem para a resposta. As entradas vão sem
+compressão por padrão: os PDFs do ReportLab já saem com os streams
+comprimidos (texto, como CSV, pode pedir ZIP_DEFLATED).
+"""
+import time
+import zipfile
+from typing import Iterable, Iterator, List
+
+from utils.spool_pdf import TAMANHO_BLOCO, PDFEmDisco, Resultado
+
+
+class ZipEmFluxo:
+    def __init__(self, compressao: int = zipfile.ZIP_STORED):
+        self._partes: List[bytes] = []
+        self._zip = zipfile.ZipFile(self, "w", compression=compressao)
+
+    # Interface de arquivo usada pelo ZipFile (sem tell/seek: modo streaming)
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self) -> bytes:
+        dados, self._partes = b"".join(self._partes), []
+        return dados
+
+    def adicionar(self, nome: str, conteudo: Resultado) -> Iterator[bytes]:
+        """Escreve a entrada `nome`, devolvendo os bytes do ZIP à medida que saem."""
+        if isinstance(conteudo, PDFEmDisco):
+            return self.adicionar_blocos(nome, _blocos_do_arquivo(conteudo.caminho))
+        return self.adicionar_blocos(nome, [conteudo])
+
+    def adicionar_blocos(self, nome: str, blocos: Iterable[bytes]) -> Iterator[bytes]:
+        """Como `adicionar`, com o conteúdo vindo aos poucos (ex.: linhas de CSV)."""
+        info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        with self._zip.open(info, "w") as destino:
+            for bloco in blocos:
+                destino.write(bloco)
+                yield self.esvaziar()
+        yield self.esvaziar()
+
+    def fechar(self) -> bytes:
+        """Grava o diretório central e devolve o final do arquivo."""
+        self._zip.close()
+        return self.esvaziar()
+
+
+def _blocos_do_arquivo(caminho: str) -> Iterator[bytes]:
+    with open(caminho, "rb") as origem:
+        while True:
+            bloco = origem.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            yield bloco
@@ -0,0 +1,417 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(RAIZ, "Backend")
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANILHAS_DIR = os.path.join(BENCH_DIR, "planilhas")
+RESULTADOS_DIR = os.path.join(BENCH_DIR, "resultados")
+
+FORMATO = 1
+ESCALAS_PADRAO = (1, 10, 100, 1000)
+
+# Linhas de dados que cabem numa planilha (1.048.576 menos o cabeçalho e o
+# bloco de metadados): 1000x das dietas aguda e crônica passa disso e é
+# truncado, o resultado registra as linhas reais
+MAX_LINHAS_EXCEL = 1_048_576
+
+# Índice (0-based) da linha de cabeçalho de cada planilha; o que vem antes
+# (metadados do México) é copiado como está
+PLANILHAS = {
+    "DietaAgudaOf.xlsx": 0,
+    "DietaCronicaOf.xlsx": 0,
+    "DietaCronicaMexico.xlsx": 6,  # routes/mexico.py: LINHA_CABECALHO
+}
+
+# Com --com-limites, acima destas linhas a operação é pulada (memória/tempo
+# fora do razoável numa máquina de desenvolvimento); por padrão mede tudo
+LIMITE_LINHAS = {
+    "GET /acute/dados": 150_000,
+    "GET /dados": 150_000,
+    "GET /mexico/dados": 200_000,
+    "POST /acute/atualizar": 15_000,
+    "POST /acute/gerar-pdf": 15_000,
+    "POST /report/gerar-pdf": 40_000,
+}
+
+ACCEPT_ENCODING = "gzip, deflate, br"  # como um navegador
+
+
+# --------- planilhas sintéticas ----------
+def _digest(caminho: str) -> str:
+    with open(caminho, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _linhas_de_dados(linhas):
+    """Corta as linhas vazias do fim (formatação sem conteúdo)."""
+    fim = len(linhas)
+    while fim and all(v is None for v in linhas[fim - 1]):
+        fim -= 1
+    return linhas[:fim]
+
+
+def gerar_planilhas(escala: int) -> dict:
+    """
+    Gera benchmarks/planilhas/<escala>x/ a partir das planilhas reais de
+    Backend/data: a primeira aba tem as linhas de dados repetidas `escala`
+    vezes (cabeçalho e metadados iguais, valores das fórmulas já
+    calculados); as outras abas são copiadas. Reaproveita o que já foi
+    gerado para as mesmas fontes. Retorna {arquivo: linhas de dados}.
+    """
+    import openpyxl
+
+    destino = os.path.join(PLANILHAS_DIR, f"{escala}x")
+    manifest_path = os.path.join(destino, "manifest.json")
+    fontes = {nome: _digest(os.path.join(DATA_DIR, nome)) for nome in PLANILHAS}
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("formato") == FORMATO and manifest.get("fontes") == fontes and \
+                all(os.path.isfile(os.path.join(destino, n)) for n in PLANILHAS):
+            return manifest["linhas"]
+    except (OSError, ValueError):
+        pass
+
+    if os.path.isdir(destino):
+        shutil.rmtree(destino)
+    os.makedirs(destino)
+    contagem = {}
+    for nome, cabecalho in PLANILHAS.items():
+        inicio = time.perf_counter()
+        modelo = openpyxl.load_workbook(os.path.join(DATA_DIR, nome), read_only=True, data_only=True)
+        saida = openpyxl.Workbook(write_only=True)
+        for indice, aba in enumerate(modelo.worksheets):
+            nova = saida.create_sheet(aba.title)
+            linhas = [list(r) for r in aba.iter_rows(values_only=True)]
+            if indice > 0:
+                for linha in linhas:
+                    nova.append(linha)
+                continue
+            topo, dados = linhas[:cabecalho + 1], _linhas_de_dados(linhas[cabecalho + 1:])
+            total = min(len(dados) * escala, MAX_LINHAS_EXCEL - len(topo))
+            for linha in topo:
+                nova.append(linha)
+            for i in range(total):
+                nova.append(dados[i % len(dados)])
+            contagem[nome] = total
+        modelo.close()
+        saida.save(os.path.join(destino, nome))
+        print(f"  {escala}x {nome}: {contagem[nome]} linhas ({time.perf_counter() - inicio:.1f}s)", file=sys.stderr)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"formato": FORMATO, "fontes": fontes, "linhas": contagem}, f, indent=2)
+    return contagem
+
+
+# --------- medição (processo filho, uma escala) ----------
+def _rotulo(r: dict) -> str:
+    return f"{r['operacao']} [{r['variante']}]" if r.get("variante") else r["operacao"]
+
+
+def _medir_escala(escala: int, linhas: dict, repeticoes: int, orcamento_s: float, com_limites: bool) -> list:
+    """
+    Roda no processo filho, com RISKWISE_DATA_DIR apontando para uma cópia
+    das planilhas sintéticas. Cada operação passa pelo app ASGI inteiro
+    (middlewares, compressão) via TestClient.
+    """
+    sys.path.insert(0, RAIZ)
+    from fastapi.testclient import TestClient
+    from Backend.main import app
+    from utils import snapshot
+    from utils.dataset_cache import dataset_cache
+
+    data_dir = os.environ["RISKWISE_DATA_DIR"]
+    agudo = os.path.join(data_dir, "DietaAgudaOf.xlsx")
+    cronico = os.path.join(data_dir, "DietaCronicaOf.xlsx")
+    mexico = os.path.join(data_dir, "DietaCronicaMexico.xlsx")
+
+    def frio_xlsx(path):
+        # Sem cache e sem snapshot: parse do .xlsx (e gravação do snapshot)
+        def preparar():
+            dataset_cache.invalidar(path)
+            shutil.rmtree(os.path.join(data_dir, snapshot.SNAPSHOT_DIRNAME), ignore_errors=True)
+        return preparar
+
+    def frio_snapshot(path):
+        return lambda: dataset_cache.invalidar(path)
+
+    resultados = []
+    with TestClient(app, headers={"Accept-Encoding": ACCEPT_ENCODING}) as cliente:
+        # Aquecimento: imports sob demanda (pandas, openpyxl) fora das medições
+        cliente.get("/mexico/dados")
+
+        # Payloads de escrita e de PDF: montados na primeira vez que uma
+        # operação não pulada precisa deles (no `preparar`, fora da medição)
+        payloads = {}
+
+        def payload(nome):
+            if nome not in payloads:
+                if nome == "atualizar":
+                    payloads[nome] = cliente.get("/acute/dados").json()["tabelaCompleta"]
+                elif nome == "acute":
+                    payloads[nome] = [{**r, "LMR (mg/kg)": "1"} for r in payload("atualizar")]
+                elif nome == "chronic":
+                    payloads[nome] = [{**r, "LMR (mg_kg)": "2"} for r in cliente.get("/dados").json()["tabelaCompleta"]]
+                elif nome == "mexico":
+                    payloads[nome] = [{**r, "LMR (mg/kg)": "1"} for r in cliente.get("/mexico/dados").json()["rows"]]
+                elif nome == "acute-pdf":
+                    payloads[nome] = {"dados": payload("acute"), "drfa_externo": "0.1", "drfa_interno": "0.2"}
+                elif nome == "report-pdf":
+                    payloads[nome] = {
+                        "acute": payload("acute"), "acute_drfa_externo": "0.1", "acute_drfa_interno": "0.2",
+                        "chronic": payload("chronic"), "chronic_ida_externo": "0.05", "chronic_ida_interno": "0.1",
+                        "mexico": {"data": payload("mexico")},
+                    }
+            return payloads[nome]
+
+        n_agudo = linhas["DietaAgudaOf.xlsx"]
+        n_cronico = linhas["DietaCronicaOf.xlsx"]
+        n_mexico = linhas["DietaCronicaMexico.xlsx"]
+        operacoes = [
+            ("GET /dados", "xlsx", n_cronico, frio_xlsx(cronico), lambda: cliente.get("/dados")),
+            ("GET /dados", "snapshot", n_cronico, frio_snapshot(cronico), lambda: cliente.get("/dados")),
+            ("GET /dados", "cache", n_cronico, None, lambda: cliente.get("/dados")),
+            ("GET /acute/dados", "xlsx", n_agudo, frio_xlsx(agudo), lambda: cliente.get("/acute/dados")),
+            ("GET /acute/dados", "snapshot", n_agudo, frio_snapshot(agudo), lambda: cliente.get("/acute/dados")),
+            ("GET /acute/dados", "cache", n_agudo, None, lambda: cliente.get("/acute/dados")),
+            ("GET /mexico/dados", "xlsx", n_mexico, frio_xlsx(mexico), lambda: cliente.get("/mexico/dados")),
+            ("GET /mexico/dados", "cache", n_mexico, None, lambda: cliente.get("/mexico/dados")),
+            ("POST /acute/atualizar", "", n_agudo, lambda: payload("atualizar"),
+             lambda: cliente.post("/acute/atualizar", json=payload("atualizar"))),
+            ("POST /acute/gerar-pdf", "", n_agudo, lambda: payload("acute-pdf"),
+             lambda: cliente.post("/acute/gerar-pdf", json=payload("acute-pdf"))),
+            ("POST /report/gerar-pdf", "", n_agudo + n_cronico + n_mexico, lambda: payload("report-pdf"),
+             lambda: cliente.post("/report/gerar-pdf", json=payload("report-pdf"))),
+        ]
+
+        for nome, variante, n_linhas, preparar, chamar in operacoes:
+            registro = {"operacao": nome, "variante": variante, "escala": escala, "linhas": n_linhas}
+            limite = LIMITE_LINHAS.get(nome)
+            if com_limites and limite is not None and n_linhas > limite:
+                registro["pulado"] = f"{n_linhas} linhas > limite {limite} (--com-limites)"
+                print(f"  {escala}x {_rotulo(registro)}: pulado", file=sys.stderr)
+                resultados.append(registro)
+                continue
+            amostras, tamanho, gasto = [], None, 0.0
+            for _ in range(repeticoes):
+                if preparar is not None:
+                    preparar()
+                inicio = time.perf_counter()
+                resposta = chamar()
+                decorrido = time.perf_counter() - inicio
+                if resposta.status_code >= 400:
+                    registro["erro"] = f"HTTP {resposta.status_code}: {resposta.text[:200]}"
+                    break
+                amostras.append(decorrido * 1000)
+                tamanho = int(resposta.headers.get("content-length") or len(resposta.content))
+                gasto += decorrido
+                if gasto > orcamento_s:
+                    break
+            if amostras:
+                registro.update({
+                    "amostras_ms": [round(a, 2) for a in amostras],
+                    "mediana_ms": round(statistics.median(amostras), 2),
+                    "min_ms": round(min(amostras), 2),
+                    "max_ms": round(max(amostras), 2),
+                    "bytes": tamanho,
+                })
+            print(f"  {escala}x {_rotulo(registro)}: {registro.get('mediana_ms', registro.get('erro'))} ms", file=sys.stderr)
+            resultados.append(registro)
+    return resultados
+
+
+def _rodar_escala(escala: int, linhas: dict, args) -> list:
+    """Mede uma escala num processo novo (constantes de caminho das rotas, caches e memória limpos)."""
+    with tempfile.TemporaryDirectory(prefix=f"riskwise_bench_{escala}x_") as tmp:
+        # Cópia: /acute/atualizar grava na planilha
+        data_dir = os.path.join(tmp, "data")
+        shutil.copytree(os.path.join(PLANILHAS_DIR, f"{escala}x"), data_dir)
+        saida = os.path.join(tmp, "resultado.json")
+        env = {
+            **os.environ,
+            "RISKWISE_DATA_DIR": data_dir,
+            # Mede a gravação dentro da requisição, e o PDF renderizado de fato
+            # (sem processo à parte e sem cache de PDFs)
+            "RISKWISE_ESCRITA_ASSINCRONA": "0",
+            "RISKWISE_PDF_WORKERS": "0",
+            "RISKWISE_PDF_CACHE_MB": "0",
+            "RISKWISE_PDF_CACHE_DIR": "",
+            "RISKWISE_SPANS_ARQUIVO": "",
+            "RISKWISE_PROFILING": "",
+        }
+        comando = [
+            sys.executable, os.path.abspath(__file__), "_medir",
+            "--escala", str(escala), "--linhas", json.dumps(linhas), "--saida", saida,
+            "--repeticoes", str(args.repeticoes), "--orcamento-op", str(args.orcamento_op),
+        ] + (["--com-limites"] if args.com_limites else [])
+        retorno = subprocess.run(comando, cwd=RAIZ, env=env)
+        if retorno.returncode != 0:
+            return [{"escala": escala, "erro": f"processo de medição saiu com código {retorno.returncode}"}]
+        with open(saida, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def rodar(args) -> dict:
+    resultados = []
+    for escala in args.escalas:
+        print(f"Escala {escala}x", file=sys.stderr)
+        linhas = gerar_planilhas(escala)
+        resultados.extend(_rodar_escala(escala, linhas, args))
+    relatorio = {
+        "formato": FORMATO,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "maquina": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "repeticoes": args.repeticoes,
+        "resultados": resultados,
+    }
+    saida = args.saida or os.path.join(RESULTADOS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Resultados em {saida}")
+    _resumir_nao_medidos(resultados)
+    return relatorio
+
+
+def _resumir_nao_medidos(resultados: list):
+    """Lista o que ficou sem mediana (pulado ou com erro), por escala."""
+    faltas = [r for r in resultados if "mediana_ms" not in r]
+    if not faltas:
+        return
+    print(f"\n❌ {len(faltas)} operação(ões) sem medição:")
+    for r in faltas:
+        motivo = r.get("pulado") or r.get("erro") or "sem amostras"
+        rotulo = _rotulo(r) if r.get("operacao") else "(escala inteira)"
+        print(f"  {r.get('escala')}x {rotulo}: {motivo}")
+
+
+# --------- comparação ----------
+def _chave(r: dict):
+    return r.get("operacao"), r.get("variante", ""), r.get("escala")
+
+
+def comparar(base: dict, novo: dict, tolerancia: float, minimo_ms: float) -> bool:
+    """
+    Compara as medianas por (operação, variante, escala). Regressão: mais
+    lento que a base por mais de `tolerancia` (fração) e por mais de
+    `minimo_ms` (ruído em operações rápidas), ou medido na base e agora com
+    erro, pulado ou ausente. Retorna True se não houve.
+    """
+    anteriores = {_chave(r): r for r in base.get("resultados", []) if "mediana_ms" in r}
+    medidos = {_chave(r) for r in novo.get("resultados", []) if "mediana_ms" in r}
+    atuais = {_chave(r): r for r in novo.get("resultados", []) if r.get("operacao")}
+    regressoes = 0
+    print(f"\n{'operação':<34} {'escala':>6} {'base ms':>10} {'novo ms':>10} {'var':>8}")
+    for r in novo.get("resultados", []):
+        if "mediana_ms" not in r:
+            continue
+        anterior = anteriores.get(_chave(r))
+        rotulo = _rotulo(r)
+        if anterior is None:
+            print(f"{rotulo:<34} {r['escala']:>5}x {'-':>10} {r['mediana_ms']:>10.1f} {'novo':>8}")
+            continue
+        antes, agora = anterior["mediana_ms"], r["mediana_ms"]
+        variacao = (agora - antes) / antes if antes else 0.0
+        marca = ""
+        if agora - antes > minimo_ms and variacao > tolerancia:
+            marca, regressoes = "  ❌ regressão", regressoes + 1
+        elif antes - agora > minimo_ms and -variacao > tolerancia:
+            marca = "  ✅ melhora"
+        print(f"{rotulo:<34} {r['escala']:>5}x {antes:>10.1f} {agora:>10.1f} {variacao:>+7.0%}{marca}")
+    # Medido na base e não agora: uma operação que passou a falhar não pode
+    # passar como "sem regressão"
+    for chave, anterior in anteriores.items():
+        if chave in medidos:
+            continue
+        atual = atuais.get(chave, {})
+        motivo = "erro" if "erro" in atual else "pulado" if "pulado" in atual else "ausente"
+        regressoes += 1
+        print(f"{_rotulo(anterior):<34} {anterior['escala']:>5}x {anterior['mediana_ms']:>10.1f} {motivo:>10} {'':>8}  ❌ regressão")
+    if regressoes:
+        print(f"\n❌ {regressoes} regressão(ões): acima de {tolerancia:.0%} (e {minimo_ms:.0f} ms) ou sem medição")
+        return False
+    print(f"\n✅ Nenhuma regressão acima de {tolerancia:.0%}")
+    return True
+
+
+def _carregar(caminho: str) -> dict:
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _escalas(texto: str):
+    return [int(e.strip().rstrip("xX")) for e in texto.split(",") if e.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks das rotas principais com planilhas sintéticas em escala (1x, 10x, 100x, 1000x).",
+    )
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_gerar = sub.add_parser("gerar", help="só gera as planilhas sintéticas")
+    p_gerar.add_argument("--escalas", type=_escalas, default=list(ESCALAS_PADRAO), help="ex.: 1,10,100 (padrão 1,10,100,1000)")
+
+    tolerancia_padrao = float(os.environ.get("RISKWISE_BENCH_TOLERANCIA", 0.25))
+    p_rodar = sub.add_parser("rodar", help="gera (se preciso) e mede; grava o JSON de resultados")
+    p_rodar.add_argument("--escalas", type=_escalas, default=list(ESCALAS_PADRAO), help="ex.: 1,10,100 (padrão 1,10,100,1000)")
+    p_rodar.add_argument("--repeticoes", type=int, default=5, help="medições por operação (padrão 5); vale a mediana")
+    p_rodar.add_argument("--orcamento-op", type=float, default=60.0, help="segundos por operação antes de parar de repetir (padrão 60)")
+    p_rodar.add_argument("--com-limites", action="store_true", help="pula operações grandes demais (ver LIMITE_LINHAS)")
+    p_rodar.add_argument("--saida", help="arquivo JSON (padrão benchmarks/resultados/benchmark_<data>.json)")
+    p_rodar.add_argument("--comparar", metavar="BASE", help="compara com um JSON anterior; sai com 1 se houver regressão")
+    p_rodar.add_argument("--tolerancia", type=float, default=tolerancia_padrao, help="fração tolerada (padrão RISKWISE_BENCH_TOLERANCIA ou 0.25)")
+    p_rodar.add_argument("--minimo-ms", type=float, default=5.0, help="diferença mínima para contar (padrão 5 ms)")
+
+    p_comparar = sub.add_parser("comparar", help="compara dois JSONs de resultados; sai com 1 se houver regressão")
+    p_comparar.add_argument("base")
+    p_comparar.add_argument("novo")
+    p_comparar.add_argument("--tolerancia", type=float, default=tolerancia_padrao, help="fração tolerada (padrão RISKWISE_BENCH_TOLERANCIA ou 0.25)")
+    p_comparar.add_argument("--minimo-ms", type=float, default=5.0, help="diferença mínima para contar (padrão 5 ms)")
+
+    # Interno: medição de uma escala no processo filho
+    p_medir = sub.add_parser("_medir")
+    p_medir.add_argument("--escala", type=int, required=True)
+    p_medir.add_argument("--linhas", type=json.loads, required=True)
+    p_medir.add_argument("--saida", required=True)
+    p_medir.add_argument("--repeticoes", type=int, default=5)
+    p_medir.add_argument("--orcamento-op", type=float, default=60.0)
+    p_medir.add_argument("--com-limites", action="store_true")
+
+    args = parser.parse_args()
+    if args.comando == "gerar":
+        for escala in args.escalas:
+            print(f"{escala}x: {gerar_planilhas(escala)}")
+    elif args.comando == "rodar":
+        relatorio = rodar(args)
+        if args.comparar:
+            sys.exit(0 if comparar(_carregar(args.comparar), relatorio, args.tolerancia, args.minimo_ms) else 1)
+    elif args.comando == "comparar":
+        ok = comparar(_carregar(args.base), _carregar(args.novo), args.tolerancia, args.minimo_ms)
+        sys.exit(0 if ok else 1)
+    elif args.comando == "_medir":
+        resultados = _medir_escala(args.escala, args.linhas, args.repeticoes, args.orcamento_op, args.com_limites)
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False)
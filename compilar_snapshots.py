@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Permite importar as rotas como o Backend/main.py faz
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Backend")
+sys.path.append(BACKEND_DIR)
+
+from utils import snapshot  # noqa: E402
+from routes import acute, chronic, mexico  # noqa: E402
+
+
+def compilar_snapshots():
+    """
+    Compila cada planilha de Backend/data em snapshot colunar (data/snapshot/),
+    validando com os mesmos esquemas das rotas. No Vercel roda no buildCommand
+    (vercel.json) a cada deploy; o diretório não é versionado, e localmente o
+    snapshot é recompilado na primeira leitura de um .xlsx alterado.
+    Snapshots desatualizados são ignorados em runtime.
+    """
+    gerados = []
+
+    df = acute._ler_xlsx_validado(acute.EXCEL_PATH)
+    gerados.append(snapshot.compilar(acute.EXCEL_PATH, df, acute.ESQUEMA))
+
+    df = chronic._ler_xlsx_validado(chronic.EXCEL_PATH)
+    gerados.append(snapshot.compilar(chronic.EXCEL_PATH, df, chronic.ESQUEMA))
+
+    df, extras = mexico._ler_xlsx(mexico.EXCEL_PATH)
+    gerados.append(snapshot.compilar(mexico.EXCEL_PATH, df, mexico.ESQUEMA, extras))
+
+    print(f"✅ Compilados {len(gerados)} snapshots:")
+    for destino in gerados:
+        print(f" - {destino}")
+
+if __name__ == "__main__":
+    compilar_snapshots()
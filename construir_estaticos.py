@@ -0,0 +1,40 @@
+import os
+import sys
+
+# Permite importar os utilitários como o Backend/main.py faz
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(RAIZ, "Backend"))
+
+from utils import estaticos  # noqa: E402
+from corrigir_caminhos import css_replacements, html_replacements, js_replacements  # noqa: E402
+
+FRONTEND_DIR = os.path.join(RAIZ, "Frontend")
+
+
+def construir_estaticos():
+    """
+    Gera Frontend/dist: assets com hash no nome, referências reescritas
+    (incluindo as correções de caminho de corrigir_caminhos.py, sem alterar
+    as fontes) e variantes .gz/.br. No Vercel roda como buildCommand
+    (vercel.json) a cada deploy; localmente, rode de novo sempre que algo em
+    Frontend/ mudar, pois um dist desatualizado é ignorado em runtime.
+    Retorna False se o dist gerado não for aceito por estaticos.carregar.
+    """
+    manifest = estaticos.compilar(FRONTEND_DIR, {
+        ".html": html_replacements,
+        ".css": css_replacements,
+        ".js": js_replacements,
+    })
+    destino = os.path.join(FRONTEND_DIR, estaticos.DIST_DIRNAME)
+    total = sum(len(arquivos) for _, _, arquivos in os.walk(destino))
+    variantes = ", ".join(manifest["variantes"]) or "nenhuma"
+    # O deploy falha aqui em vez de subir servindo Frontend/ sem hash
+    if estaticos.carregar(FRONTEND_DIR) is None:
+        print(f"❌ {destino} não confere com as fontes de {FRONTEND_DIR}")
+        return False
+    print(f"✅ {len(manifest['arquivos'])} assets com hash, {total} arquivos em {destino} (variantes: {variantes})")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if construir_estaticos() else 1)
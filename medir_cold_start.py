@@ -0,0 +1,88 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINT = "api.index"
+
+# Dependências que só devem ser importadas no primeiro pedido que as usa
+# (ver Backend/utils/sob_demanda.py)
+PESADOS = ("pandas", "numpy", "openpyxl", "reportlab")
+
+ORCAMENTO_MS_PADRAO = 1000
+
+PROJETO = ("api", "Backend", "utils", "routes")
+
+_LINHA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _medir_uma_vez():
+    """
+    Importa o entry point num processo novo com `-X importtime`.
+    Retorna {módulo: (próprio_us, acumulado_us)}.
+    """
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY_POINT}"],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    if saida.returncode != 0:
+        sys.stderr.write(saida.stderr)
+        raise SystemExit(f"❌ Falha ao importar {ENTRY_POINT}")
+
+    modulos = {}
+    for linha in saida.stderr.splitlines():
+        m = _LINHA.match(linha)
+        if m:
+            proprio, acumulado, nome = m.groups()
+            modulos[nome] = (int(proprio), int(acumulado))
+    return modulos
+
+
+def medir_cold_start(orcamento_ms: float, repeticoes: int = 3, top: int = 20) -> bool:
+    """
+    Mede o tempo de importação de api/index.py (cold start no Vercel) e imprime
+    os módulos mais caros. A melhor de `repeticoes` medições é comparada com o
+    orçamento; também falha se alguma dependência pesada for importada no
+    carregamento. Retorna True se passou.
+    """
+    medicoes = [_medir_uma_vez() for _ in range(max(1, repeticoes))]
+    modulos = min(medicoes, key=lambda m: m[ENTRY_POINT][1])
+    total_ms = modulos[ENTRY_POINT][1] / 1000
+
+    print(f"Importação de {ENTRY_POINT}: {total_ms:.0f} ms (melhor de {len(medicoes)}; orçamento {orcamento_ms:.0f} ms)")
+    print(f"\n{'acumulado':>10} {'próprio':>9}  módulo")
+    # Módulos do projeto um a um; dependências agrupadas pelo pacote de topo
+    raizes = {}
+    for nome, (proprio, acumulado) in modulos.items():
+        raiz = nome if nome.split(".")[0] in PROJETO else nome.split(".")[0]
+        if raiz not in raizes or acumulado > raizes[raiz][1]:
+            raizes[raiz] = (proprio, acumulado, nome)
+    for proprio, acumulado, nome in sorted(raizes.values(), key=lambda v: -v[1])[:top]:
+        print(f"{acumulado / 1000:>8.1f}ms {proprio / 1000:>7.1f}ms  {nome}")
+
+    carregados = [p for p in PESADOS if p in modulos]
+    ok = True
+    if carregados:
+        print(f"\n❌ Importados no cold start (deveriam ser sob demanda): {', '.join(carregados)}")
+        ok = False
+    if total_ms > orcamento_ms:
+        print(f"\n❌ Cold start acima do orçamento: {total_ms:.0f} ms > {orcamento_ms:.0f} ms")
+        ok = False
+    if ok:
+        print("\n✅ Cold start dentro do orçamento")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de importação do entry point do Vercel (api/index.py).")
+    parser.add_argument(
+        "--orcamento-ms", type=float,
+        default=float(os.environ.get("RISKWISE_COLD_START_MS", ORCAMENTO_MS_PADRAO)),
+        help=f"tempo máximo de importação (padrão: RISKWISE_COLD_START_MS ou {ORCAMENTO_MS_PADRAO})",
+    )
+    parser.add_argument("--repeticoes", type=int, default=3, help="medições; vale a melhor (padrão 3)")
+    parser.add_argument("--top", type=int, default=20, help="quantos módulos listar (padrão 20)")
+    args = parser.parse_args()
+    sys.exit(0 if medir_cold_start(args.orcamento_ms, args.repeticoes, args.top) else 1)